@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Automatic channel selection
+Scans neighbouring BSSes and scores each allowed channel by how many APs
+use it, how loud they are and, on 2.4 GHz, how much adjacent channels
+overlap it. Lower scores are better.
+
+Usage: sudo ./channel_scan.py [interface] [--band g|a] [--country CC]
+                              [--from-file SCAN] [--best | --apply]
+       sudo ./channel_scan.py [interface] [--band g|a] [--country CC] --install-timer
+       sudo ./channel_scan.py --remove-timer
+  --best           print only the best channel
+  --apply          switch the running AP to the best channel if it beats
+                   the current one by a clear margin
+  --install-timer  re-score with --apply on a schedule (Auto channel mode)
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+import hostapd_config
+import phy_caps
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SYSTEMD_DIR = "/etc/systemd/system"
+TIMER_NAME = "wifi-extender-channel"
+RESCORE_INTERVAL = "1h"
+
+# 2.4 GHz channels 5 apart (25 MHz) no longer overlap
+OVERLAP_SPAN = 5
+# Channels the 2.4 GHz band plan is built around, preferred on ties
+NON_OVERLAPPING = (1, 6, 11)
+CHANNELS_5GHZ = (36, 40, 44, 48, 149, 153, 157, 161)
+# Countries limited to channels 1-11 on 2.4 GHz
+FCC_COUNTRIES = {"US", "CA"}
+# Only move channel when the best one is this much quieter (clients drop)
+SWITCH_MARGIN = 0.25
+
+
+class Bss:
+    """One neighbouring access point seen in a scan"""
+
+    __slots__ = ("bssid", "freq", "channel", "signal", "ssid", "secondary",
+                 "vht_center")
+
+    def __init__(self, bssid, freq=None, channel=None, signal=None, ssid="",
+                 secondary=0, vht_center=None):
+        self.bssid = bssid
+        self.freq = freq
+        self.channel = channel
+        self.signal = signal
+        self.ssid = ssid
+        self.secondary = secondary    # +1 above, -1 below, 0 for 20 MHz
+        self.vht_center = vht_center  # Centre channel of an 80 MHz BSS
+
+    def occupied(self):
+        """20 MHz channels this BSS transmits on"""
+        if self.vht_center:
+            return [self.vht_center + offset for offset in (-6, -2, 2, 6)]
+        if self.secondary:
+            return [self.channel, self.channel + 4 * self.secondary]
+        return [self.channel]
+
+    def __repr__(self):
+        return f"Bss({self.bssid}, ch={self.channel}, signal={self.signal})"
+
+
+def freq_to_channel(freq):
+    if freq == 2484:
+        return 14
+    if 2412 <= freq <= 2472:
+        return (freq - 2407) // 5
+    if 5000 <= freq <= 5900:
+        return (freq - 5000) // 5
+    return None
+
+
+def parse_scan(text):
+    """Parse `iw dev <iface> scan` output into Bss records"""
+    bsses = []
+    bss = None
+    wide = False
+    for line in text.splitlines():
+        if line.startswith("BSS "):
+            bss = Bss(re.split(r"[ (]", line[4:], 1)[0])
+            bsses.append(bss)
+            continue
+        if bss is None:
+            continue
+        if line.startswith("\tVHT operation:"):
+            wide = False
+        line = line.strip().lstrip("* ")
+        if line.startswith("freq:"):
+            bss.freq = int(float(line.split(":", 1)[1]))
+            if bss.channel is None:
+                bss.channel = freq_to_channel(bss.freq)
+        elif line.startswith("signal:"):
+            bss.signal = float(line.split(":", 1)[1].split()[0])
+        elif line.startswith("SSID:"):
+            bss.ssid = line.split(":", 1)[1].strip()
+        elif line.startswith("DS Parameter set: channel"):
+            bss.channel = int(line.rsplit(" ", 1)[1])
+        elif line.startswith("primary channel:"):
+            bss.channel = int(line.split(":", 1)[1])
+        elif line.startswith("secondary channel offset:"):
+            offset = line.split(":", 1)[1].strip()
+            bss.secondary = {"above": 1, "below": -1}.get(offset, 0)
+        elif line.startswith("channel width:"):
+            wide = line.split(":", 1)[1].split()[0] == "1"
+        elif line.startswith("center freq segment 1:") and wide:
+            bss.vht_center = int(line.split(":", 1)[1])
+    return [b for b in bsses if b.channel]
+
+
+def allowed_channels(band="g", country="IE"):
+    if band == "a":
+        return list(CHANNELS_5GHZ)
+    return list(range(1, 12 if country in FCC_COUNTRIES else 14))
+
+
+def signal_weight(signal):
+    """0 for a barely audible AP (-95 dBm) up to 2 for a very loud one (-50 dBm)"""
+    if signal is None:
+        return 1.0
+    return min(2.0, max(0.0, (signal + 95) / 22.5))
+
+
+def score_channels(bsses, band="g", country="IE"):
+    """Return [(channel, score)] for the allowed channels, best first"""
+    channels = allowed_channels(band, country)
+    scores = dict.fromkeys(channels, 0.0)
+    for bss in bsses:
+        weight = 1 + signal_weight(bss.signal)
+        centers = bss.occupied()
+        for ch in channels:
+            distance = min(abs(ch - c) for c in centers)
+            if band == "a":
+                overlap = 1.0 if distance == 0 else 0.0
+            else:
+                overlap = max(0.0, 1 - distance / OVERLAP_SPAN)
+            scores[ch] += overlap * weight
+    return sorted(scores.items(),
+                  key=lambda item: (round(item[1], 6), item[0] not in NON_OVERLAPPING, item[0]))
+
+
+def best_channel(bsses, band="g", country="IE"):
+    return score_channels(bsses, band, country)[0][0]
+
+
+def should_switch(scores, current, margin=SWITCH_MARGIN):
+    """True if the best channel beats the current one by more than margin"""
+    by_channel = dict(scores)
+    best, best_score = scores[0]
+    if best == current or current not in by_channel:
+        return best != current
+    return by_channel[current] - best_score > margin * max(by_channel[current], 1.0)
+
+
+def scan(iface="wlan0"):
+    """Run a scan on iface and return the raw iw output"""
+    result = subprocess.run(["iw", "dev", iface, "scan"],
+                            capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        # Interfaces already running as an AP need the ap-force flag
+        result = subprocess.run(["iw", "dev", iface, "scan", "ap-force"],
+                                capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise OSError(result.stderr.strip() or f"scan on {iface} failed")
+    return result.stdout
+
+
+def pick_channel(iface="wlan0", band="g", country="IE", fallback=None):
+    """Scan and return the best channel, or fallback if scanning fails"""
+    try:
+        return best_channel(parse_scan(scan(iface)), band, country)
+    except (OSError, subprocess.SubprocessError):
+        if fallback is None:
+            return 36 if band == "a" else 6
+        return fallback
+
+
+def apply_best(scores, path=hostapd_config.HOSTAPD_CONF, probe=None, apply=None):
+    """Move the running AP to the best channel via a live reload
+
+    The HT/VHT lines are regenerated for the new channel: those of the
+    old one (its HT40 direction and VHT80 centre) would make hostapd
+    reject the reload. probe and apply default to phy_caps.probe and
+    live_apply.apply_config.
+    """
+    import live_apply  # live_apply imports this module for "auto"
+
+    probe = probe or phy_caps.probe
+    apply = apply or live_apply.apply_config
+    current = hostapd_config.load(path)
+    channel = current.channel or 0
+    if not should_switch(scores, channel):
+        print(f"Keeping channel {channel}")
+        return 0
+    best = scores[0][0]
+    iface, band = current.interface, current.band
+    caps = probe(iface, best, band, current.country) or None
+    new = hostapd_config.render(current.ssid, current.passphrase, best, current.country,
+                                band, iface, caps, current.bridge)
+    action, changed, downtime = apply(new, path)
+    if downtime is None:
+        print(f"Channel {channel} -> {best} needs {action}, left unchanged")
+        return 1
+    print(f"Switched channel {channel} -> {best} via {action}, AP down for {downtime:.1f}s")
+    return 0
+
+
+def timer_installed(systemd_dir=SYSTEMD_DIR):
+    return os.path.exists(os.path.join(systemd_dir, f"{TIMER_NAME}.timer"))
+
+
+def install_timer(iface, band, country, interval=RESCORE_INTERVAL,
+                  systemd_dir=SYSTEMD_DIR, enable=True):
+    """Install a systemd timer that re-scores channels with --apply"""
+    service = f"""[Unit]
+Description=Pi WiFi Extender - re-score WiFi channel
+After=hostapd.service
+
+[Service]
+Type=oneshot
+ExecStart={sys.executable} {os.path.join(SCRIPT_DIR, "channel_scan.py")} {iface} --band {band} --country {country} --apply
+"""
+    timer = f"""[Unit]
+Description=Pi WiFi Extender - periodic channel re-score
+
+[Timer]
+OnBootSec=5min
+OnUnitActiveSec={interval}
+RandomizedDelaySec=5min
+
+[Install]
+WantedBy=timers.target
+"""
+    for suffix, text in (("service", service), ("timer", timer)):
+        with open(os.path.join(systemd_dir, f"{TIMER_NAME}.{suffix}"), "w") as f:
+            f.write(text)
+    if enable:
+        subprocess.run(["systemctl", "daemon-reload"], check=True, timeout=30)
+        subprocess.run(["systemctl", "enable", "--now", f"{TIMER_NAME}.timer"],
+                       check=True, timeout=30)
+
+
+def remove_timer(systemd_dir=SYSTEMD_DIR):
+    if not timer_installed(systemd_dir):
+        return
+    subprocess.run(["systemctl", "disable", "--now", f"{TIMER_NAME}.timer"],
+                   capture_output=True, timeout=30)
+    for suffix in ("service", "timer"):
+        try:
+            os.remove(os.path.join(systemd_dir, f"{TIMER_NAME}.{suffix}"))
+        except FileNotFoundError:
+            pass
+    subprocess.run(["systemctl", "daemon-reload"], capture_output=True, timeout=30)
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    band = option("--band", "g")
+    country = option("--country", "IE")
+    dump_file = option("--from-file")
+    flags = {a for a in args if a.startswith("--")}
+    positional = [a for a in args if not a.startswith("--")]
+    iface = positional[0] if positional else "wlan0"
+
+    if flags & {"--install-timer", "--remove-timer"}:
+        try:
+            if "--install-timer" in flags:
+                install_timer(iface, band, country)
+            else:
+                remove_timer()
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        if dump_file:
+            with open(dump_file) as f:
+                text = f.read()
+        else:
+            text = scan(iface)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    scores = score_channels(parse_scan(text), band, country)
+    if "--best" in flags:
+        print(scores[0][0])
+        return 0
+    if "--apply" in flags:
+        try:
+            return apply_best(scores)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    for channel, score in scores:
+        print(f"channel {channel:>3}: {score:6.2f}")
+    print(f"Best: {scores[0][0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,294 @@
+"""
+Pi WiFi Extender - Client roster
+Puts names to associated stations: the IPv4 address from the kernel's
+ARP table (/proc/net/arp) and the hostname each client sent in its DHCP
+requests. Hostnames are snooped on br0 by the status daemon (a raw socket
+with a kernel filter, so only DHCP requests reach userspace) and kept in
+a small file, alongside any dnsmasq leases. Lookups read these tables at
+most once per TTL, so a refresh with a hundred clients costs a dict join.
+"""
+
+import ctypes
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+PROC = "/proc"
+BRIDGE = "br0"
+HOSTNAMES_FILE = "/var/lib/wifi-extender-backup/dhcp-hostnames.json"
+DNSMASQ_LEASES = "/var/lib/misc/dnsmasq.leases"
+DEFAULT_TTL = 30.0
+MAX_HOSTNAMES = 1024  # Oldest snooped names are dropped beyond this
+ARP_COMPLETE = 0x2
+
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = 26
+DHCP_MAGIC = b"\x63\x82\x53\x63"
+OPT_PAD, OPT_HOSTNAME, OPT_REQUESTED_IP, OPT_FQDN, OPT_END = 0, 12, 50, 81, 255
+
+# Classic BPF for "udp dst port 67" over IPv4 (tcpdump -dd), so the kernel
+# drops everything but DHCP requests before they reach the snooper
+DHCP_FILTER = [
+    (0x28, 0, 0, 12),      # ldh [12]            ethertype
+    (0x15, 0, 8, 0x0800),  # jeq IPv4 else drop
+    (0x30, 0, 0, 23),      # ldb [23]            IP protocol
+    (0x15, 0, 6, 17),      # jeq UDP else drop
+    (0x28, 0, 0, 20),      # ldh [20]            fragment offset
+    (0x45, 4, 0, 0x1fff),  # jset -> drop
+    (0xb1, 0, 0, 14),      # ldxb 4*([14]&0xf)   IP header length
+    (0x48, 0, 0, 16),      # ldh [x+16]          UDP destination port
+    (0x15, 0, 1, 67),      # jeq 67 else drop
+    (0x06, 0, 0, 0x40000),  # ret accept
+    (0x06, 0, 0, 0),       # ret drop
+]
+
+
+def read_arp(proc=PROC):
+    """MAC -> IPv4 address from the kernel's ARP table (complete entries)"""
+    table = {}
+    try:
+        with open(os.path.join(proc, "net", "arp")) as f:
+            next(f, None)  # Header
+            for line in f:
+                # IP address, HW type, Flags, HW address, Mask, Device
+                fields = line.split()
+                if len(fields) < 6 or not int(fields[2], 16) & ARP_COMPLETE:
+                    continue
+                table[fields[3].lower()] = fields[0]
+    except (OSError, ValueError):
+        pass
+    return table
+
+
+def read_leases(path=DNSMASQ_LEASES):
+    """MAC -> (IP, hostname or None) from a dnsmasq leases file"""
+    leases = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                # Expiry, MAC, IP, hostname ("*" if none), client id
+                fields = line.split()
+                if len(fields) >= 4:
+                    leases[fields[1].lower()] = (fields[2], None if fields[3] == "*" else fields[3])
+    except OSError:
+        pass
+    return leases
+
+
+def parse_dhcp(frame):
+    """(MAC, hostname, requested IP) from an Ethernet frame carrying a
+    DHCP request, or None; hostname and IP may be None"""
+    if len(frame) < 14 + 20 or frame[12:14] != b"\x08\x00":
+        return None
+    ip_len = (frame[14] & 0x0F) * 4
+    bootp = 14 + ip_len + 8
+    if len(frame) < bootp + 240 or frame[bootp] != 1:  # BOOTREQUEST
+        return None
+    if frame[bootp + 236:bootp + 240] != DHCP_MAGIC:
+        return None
+    mac = ":".join(f"{b:02x}" for b in frame[bootp + 28:bootp + 34])
+    hostname = requested = None
+    i = bootp + 240
+    while i < len(frame):
+        code = frame[i]
+        if code == OPT_END:
+            break
+        if code == OPT_PAD:
+            i += 1
+            continue
+        if i + 1 >= len(frame):
+            break
+        length = frame[i + 1]
+        value = frame[i + 2:i + 2 + length]
+        if code == OPT_HOSTNAME:
+            hostname = value.decode("utf-8", "replace")
+        elif code == OPT_FQDN and len(value) > 3 and hostname is None:
+            hostname = _fqdn_name(value[3:])
+        elif code == OPT_REQUESTED_IP and length == 4:
+            requested = socket.inet_ntoa(value)
+        i += 2 + length
+    hostname = "".join(c for c in hostname or "" if c.isprintable()).strip() or None
+    return mac, hostname, requested
+
+
+def _fqdn_name(data):
+    """First label of an option 81 name (wire or ASCII encoding)"""
+    if data and data[0] < 64 and len(data) > data[0]:
+        return data[1:1 + data[0]].decode("utf-8", "replace")  # Wire format
+    return data.split(b".")[0].decode("utf-8", "replace")
+
+
+class HostnameStore:
+    """Snooped MAC -> hostname, kept in a small JSON file"""
+
+    def __init__(self, path=HOSTNAMES_FILE, limit=MAX_HOSTNAMES, clock=time.time):
+        self.path = path
+        self.limit = limit
+        self.clock = clock
+        self.entries = load_hostnames(path, with_times=True)
+
+    def update(self, mac, hostname, ip=None):
+        """Record a DHCP request; True if the stored name or IP changed"""
+        old = self.entries.get(mac, {})
+        entry = {"hostname": hostname or old.get("hostname"), "ip": ip or old.get("ip"),
+                 "seen": self.clock()}
+        self.entries[mac] = entry
+        if len(self.entries) > self.limit:
+            for stale in sorted(self.entries, key=lambda m: self.entries[m]["seen"])[
+                    :len(self.entries) - self.limit]:
+                del self.entries[stale]
+        return (old.get("hostname"), old.get("ip")) != (entry["hostname"], entry["ip"])
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".dhcp-hostnames.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.entries, f)
+            os.chmod(tmp, 0o644)  # The GUI reads it unprivileged
+            os.rename(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def load_hostnames(path=HOSTNAMES_FILE, with_times=False):
+    """Snooped MAC -> hostname (or the full entries with with_times)"""
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(entries, dict):
+        return {}
+    if with_times:
+        return entries
+    return {mac: e.get("hostname") for mac, e in entries.items() if isinstance(e, dict)}
+
+
+class DhcpSnooper:
+    """Listens on the bridge for DHCP requests and records client hostnames
+
+    Needs root (a raw packet socket). Runs on its own daemon thread;
+    on_update() is called after each new or changed hostname is saved.
+    """
+
+    def __init__(self, store=None, iface=BRIDGE, on_update=None):
+        self.store = store or HostnameStore()
+        self.iface = iface
+        self.on_update = on_update
+        self.sock = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        """Open the socket (raising OSError without root or bridge) and listen"""
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            # struct sock_fprog; the kernel copies the program on attach
+            program = ctypes.create_string_buffer(
+                b"".join(struct.pack("HBBI", *insn) for insn in DHCP_FILTER))
+            fprog = struct.pack("HP", len(DHCP_FILTER), ctypes.addressof(program))
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+            sock.bind((self.iface, ETH_P_ALL))
+            sock.settimeout(1.0)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            try:
+                frame = self.sock.recv(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            request = parse_dhcp(frame)
+            if request and self.store.update(*request):
+                try:
+                    self.store.save()
+                except OSError:
+                    continue
+                if self.on_update:
+                    self.on_update()
+        self.sock.close()
+
+
+class Roster:
+    """Joins stations with IP addresses and hostnames, re-reading the
+    tables at most once per ttl seconds"""
+
+    def __init__(self, proc=PROC, hostnames=HOSTNAMES_FILE, leases=DNSMASQ_LEASES,
+                 ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.proc = proc
+        self.hostnames_path = hostnames
+        self.leases_path = leases
+        self.ttl = ttl
+        self.clock = clock
+        self.loaded = None
+        self.ips = {}
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        now = self.clock()
+        if self.loaded is not None and now - self.loaded < self.ttl:
+            return
+        ips, names = {}, {}
+        for mac, (ip, hostname) in read_leases(self.leases_path).items():
+            ips[mac] = ip
+            if hostname:
+                names[mac] = hostname
+        for mac, hostname in load_hostnames(self.hostnames_path).items():
+            if hostname:
+                names[mac] = hostname
+        ips.update(read_arp(self.proc))  # The live table wins over leases
+        self.ips, self.names, self.loaded = ips, names, now
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded = None
+
+    def lookup(self, mac):
+        """{"ip": ..., "hostname": ...} for mac, either may be None"""
+        with self.lock:
+            self._refresh()
+            mac = mac.lower()
+            return {"ip": self.ips.get(mac), "hostname": self.names.get(mac)}
+
+    def annotate(self, stations):
+        """Add "ip" and "hostname" to each station dict in place"""
+        with self.lock:
+            self._refresh()
+            for station in stations:
+                mac = station["mac"].lower()
+                station["ip"] = self.ips.get(mac)
+                station["hostname"] = self.names.get(mac)
+        return stations
+
+    def name(self, mac):
+        """Hostname, else IP, else the MAC itself"""
+        entry = self.lookup(mac)
+        return entry["hostname"] or entry["ip"] or mac
+
+
+def format_roster(stations):
+    """One line per client: hostname, IP, MAC, interface and signal"""
+    lines = []
+    for s in sorted(stations, key=lambda s: ((s.get("hostname") or "~").lower(), s["mac"])):
+        signal = f"{s['signal']} dBm" if s.get("signal") is not None else ""
+        lines.append(f"{s.get('hostname') or '-':<20} {s.get('ip') or '-':<15} {s['mac']}"
+                     f"  {s.get('interface', ''):<6} {signal}".rstrip())
+    return lines
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - hostapd config engine
+One place that renders, parses, caches and writes /etc/hostapd/hostapd.conf
+for setup.sh, both GUIs and the command line. Reads are cached by mtime;
+writes touch only the keys that changed and replace the file atomically.
+Extra radios each get their own /etc/hostapd/<iface>.conf, run by the
+hostapd@<iface> service and bridged into the same br0. In routed mode
+(see routed.py) the main radio's config has no bridge= line.
+
+Usage: ./hostapd_config.py [--conf PATH] show [--json]
+       ./hostapd_config.py [--conf PATH] get KEY...
+       ./hostapd_config.py [--conf PATH] radios [--extra]
+       sudo ./hostapd_config.py [--conf PATH] write "SSID" "Password" CHANNEL COUNTRY BAND
+                                [--iface wlan0] [--no-bridge] [--dry-run]
+write prints the keys that changed (nothing if none); --dry-run only
+prints them. radios prints "iface band channel path" per radio, the main
+one first (--extra: only the others).
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+HOSTAPD_CONF = "/etc/hostapd/hostapd.conf"
+CTRL_DIR = "/var/run/hostapd"
+# hostapd hands its control sockets to this group; setup.sh puts the
+# desktop user in it so the GUI can attach for events without root
+CTRL_GROUP = "netdev"
+BRIDGE = "br0"
+
+# Keys render() owns; anything else in the file is left alone on write
+MANAGED_KEYS = {
+    "interface", "bridge", "driver", "ctrl_interface", "ctrl_interface_group",
+    "ssid", "hw_mode", "channel", "country_code", "wpa", "wpa_passphrase",
+    "wpa_key_mgmt", "rsn_pairwise", "wmm_enabled", "ieee80211n", "ieee80211ac",
+    "ht_capab", "vht_capab", "vht_oper_chwidth", "vht_oper_centr_freq_seg0_idx",
+}
+
+_cache = {}  # path -> ((mtime_ns, size, inode), HostapdConfig)
+
+
+class HostapdConfig:
+    """hostapd.conf kept as its original lines, with typed accessors
+
+    Comments and key order survive a load/modify/save round trip.
+    """
+
+    def __init__(self, text=""):
+        self.lines = text.splitlines()
+
+    def _find(self, key):
+        prefix = f"{key}="
+        for i in range(len(self.lines) - 1, -1, -1):
+            if self.lines[i].strip().startswith(prefix):
+                return i
+        return None
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        if i is None:
+            return default
+        return self.lines[i].split("=", 1)[1].strip()
+
+    def set(self, key, value):
+        """Set key in place (appending if new); None removes it"""
+        i = self._find(key)
+        if value is None:
+            if i is not None:
+                del self.lines[i]
+            return
+        line = f"{key}={value}"
+        if i is None:
+            self.lines.append(line)
+        else:
+            self.lines[i] = line
+
+    def as_dict(self):
+        settings = {}
+        for line in self.lines:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                settings[key] = value
+        return settings
+
+    def text(self):
+        return "\n".join(self.lines) + "\n" if self.lines else ""
+
+    def copy(self):
+        config = HostapdConfig()
+        config.lines = list(self.lines)
+        return config
+
+    def __bool__(self):
+        return bool(self.as_dict())
+
+    # Typed accessors for the settings the GUIs edit
+    @property
+    def ssid(self):
+        return self.get("ssid", "")
+
+    @property
+    def passphrase(self):
+        return self.get("wpa_passphrase", "")
+
+    @property
+    def channel(self):
+        try:
+            return int(self.get("channel"))
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def country(self):
+        return self.get("country_code", "")
+
+    @property
+    def band(self):
+        return self.get("hw_mode", "g")
+
+    @property
+    def interface(self):
+        return self.get("interface", "wlan0")
+
+    @property
+    def bridge(self):
+        return self.get("bridge")
+
+
+def render(ssid, password, channel, country, band, iface="wlan0", caps=None, bridge=BRIDGE):
+    """Build the config setup.sh and the GUIs apply
+
+    caps are the HT/VHT lines from phy_caps; without them 5 GHz falls
+    back to a bare ieee80211ac=1. bridge=None leaves the interface out of
+    any bridge, for routed mode.
+    """
+    lines = [f"interface={iface}"] + ([f"bridge={bridge}"] if bridge else []) + [
+        "driver=nl80211",
+        f"ctrl_interface={CTRL_DIR}",
+        f"ctrl_interface_group={CTRL_GROUP}",
+        f"ssid={ssid}",
+        f"hw_mode={band}",
+        f"channel={channel}",
+        f"country_code={country}",
+        "wpa=2",
+        f"wpa_passphrase={password}",
+        "wpa_key_mgmt=WPA-PSK",
+        "rsn_pairwise=CCMP",
+        "wmm_enabled=1",
+        "ieee80211n=1",
+    ]
+    if caps is None:
+        caps = ["ieee80211ac=1"] if band == "a" else []
+    lines.extend(caps)
+    return HostapdConfig("\n".join(lines))
+
+
+def parse(text):
+    return HostapdConfig(text)
+
+
+def load(path=HOSTAPD_CONF):
+    """Read path, reusing the last parse while the file is unchanged
+
+    A missing file gives an empty config; PermissionError is raised.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _cache.pop(path, None)
+        return HostapdConfig()
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1].copy()
+    with open(path) as f:
+        config = HostapdConfig(f.read())
+    _cache[path] = (stamp, config)
+    return config.copy()
+
+
+def radio_conf(iface, path=HOSTAPD_CONF):
+    """Config file of an extra radio, next to the main hostapd.conf"""
+    return os.path.join(os.path.dirname(path), f"{iface}.conf")
+
+
+def load_radios(path=HOSTAPD_CONF):
+    """[(path, config)] for the main radio and every extra one
+
+    Extra radios are the <iface>.conf files beside path whose interface
+    matches their name; the main radio comes first even if unconfigured.
+    """
+    radios = [(path, load(path))]
+    directory = os.path.dirname(path) or "."
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return radios
+    for name in names:
+        extra = os.path.join(directory, name)
+        if not name.endswith(".conf") or extra == path:
+            continue
+        try:
+            config = load(extra)
+        except OSError:
+            continue
+        if config.get("interface") == name[:-len(".conf")]:
+            radios.append((extra, config))
+    return radios
+
+
+def diff(old, new):
+    """Sorted keys whose values differ between two configs"""
+    a = old.as_dict()
+    b = new.as_dict()
+    return sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+
+
+def merge(current, new, owned=MANAGED_KEYS):
+    """Apply new's settings onto current, keeping everything else
+
+    Keys in owned that new lacks are removed; other keys of current are
+    left alone.
+    """
+    merged = current.copy()
+    wanted = new.as_dict()
+    for key in set(owned) - set(wanted):
+        merged.set(key, None)
+    for key, value in wanted.items():
+        if merged.get(key) != value:
+            merged.set(key, value)
+    return merged
+
+
+def save(config, path=HOSTAPD_CONF):
+    """Atomically replace path with config (mode 600); False if unchanged"""
+    text = config.text()
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".hostapd.conf.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o600)
+        os.rename(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _cache.pop(path, None)
+    return True
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    path = option("--conf", HOSTAPD_CONF)
+    if not args or args[0] not in ("show", "get", "radios", "write"):
+        print(__doc__.strip().split("\n\n", 1)[1], file=sys.stderr)
+        return 1
+    command, args = args[0], args[1:]
+    try:
+        if command == "write":
+            iface = option("--iface", "wlan0")
+            dry_run = "--dry-run" in args
+            bridge = None if "--no-bridge" in args else BRIDGE
+            args = [a for a in args if a not in ("--dry-run", "--no-bridge")]
+            if len(args) != 5:
+                print("Usage: sudo ./hostapd_config.py write \"SSID\" \"Password\" CHANNEL COUNTRY BAND",
+                      file=sys.stderr)
+                return 1
+            import phy_caps
+            ssid, password, channel, country, band = args
+            # A dry run leaves the regdomain alone too
+            caps = phy_caps.probe(iface, channel, band, None if dry_run else country) or None
+            new = render(ssid, password, channel, country, band, iface, caps, bridge)
+            current = load(path)
+            merged = merge(current, new)
+            changed = diff(current, merged)
+            if changed:
+                print(" ".join(changed))
+                if not dry_run:
+                    save(merged, path)
+            return 0
+
+        if command == "radios":
+            radios = load_radios(path)
+            for radio_path, config in radios[1:] if "--extra" in args else radios:
+                if config:
+                    print(config.interface, config.band, config.channel, radio_path)
+            return 0
+
+        config = load(path)
+        if command == "get":
+            for key in args:
+                print(config.get(key, ""))
+        elif "--json" in args:
+            print(json.dumps(config.as_dict(), indent=2))
+        else:
+            for key, value in config.as_dict().items():
+                print(f"{key}={value}")
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,248 @@
+"""
+Pi WiFi Extender - hostapd control interface
+Small client for hostapd's UNIX datagram control socket, plus a fake
+hostapd that answers on the same protocol so callers can be tested
+without a radio.
+"""
+
+import grp
+import itertools
+import os
+import socket
+import tempfile
+import threading
+
+CTRL_DIR = "/var/run/hostapd"
+
+_counter = itertools.count()
+
+
+class HostapdCtrlError(Exception):
+    """Control socket missing, unreachable or returned FAIL"""
+
+
+class HostapdCtrl:
+    """Client for hostapd's per-interface control socket"""
+
+    def __init__(self, iface="wlan0", ctrl_dir=CTRL_DIR, timeout=2.0):
+        self.iface = iface
+        self.ctrl_dir = ctrl_dir
+        self.timeout = timeout
+        self.sock = None
+        self.local_path = None
+
+    @property
+    def path(self):
+        return os.path.join(self.ctrl_dir, self.iface)
+
+    def available(self):
+        """True if hostapd has created the control socket"""
+        return os.path.exists(self.path)
+
+    def open(self):
+        if self.sock:
+            return self
+        self.local_path = os.path.join(
+            tempfile.gettempdir(),
+            f"wifi-extender-ctrl-{os.getpid()}-{next(_counter)}"
+        )
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self.local_path)
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            self._unlink_local()
+            raise HostapdCtrlError(f"Cannot connect to {self.path}: {e}")
+        sock.settimeout(self.timeout)
+        self.sock = sock
+        return self
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        self._unlink_local()
+
+    def _unlink_local(self):
+        if self.local_path:
+            try:
+                os.unlink(self.local_path)
+            except FileNotFoundError:
+                pass
+            self.local_path = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def request(self, cmd):
+        """Send a command and return the reply, skipping unsolicited events"""
+        self.open()
+        try:
+            self.sock.send(cmd.encode())
+            while True:
+                reply = self.sock.recv(4096).decode(errors="replace")
+                if not reply.startswith("<"):
+                    break
+        except OSError as e:
+            raise HostapdCtrlError(f"{cmd} failed: {e}")
+        if reply.startswith("FAIL"):
+            raise HostapdCtrlError(f"{cmd} failed: {reply.strip()}")
+        return reply
+
+    def ping(self):
+        try:
+            return self.request("PING").strip() == "PONG"
+        except HostapdCtrlError:
+            return False
+
+    def reload(self):
+        """Make hostapd re-read its config file"""
+        if self.request("RELOAD").strip() != "OK":
+            raise HostapdCtrlError("RELOAD was not acknowledged")
+
+    def status(self):
+        """Return hostapd's STATUS output as a dict"""
+        return parse_kv(self.request("STATUS"))
+
+    def stations(self):
+        """Return the MAC addresses of associated stations"""
+        macs = []
+        reply = self.request("STA-FIRST")
+        while reply.strip():
+            macs.append(reply.splitlines()[0])
+            reply = self.request(f"STA-NEXT {macs[-1]}")
+        return macs
+
+
+def parse_kv(text):
+    """Parse key=value lines as returned by STATUS and similar commands"""
+    result = {}
+    for line in text.splitlines():
+        if "=" in line:
+            key, value = line.split("=", 1)
+            result[key] = value
+    return result
+
+
+class FakeHostapd:
+    """Stand-in hostapd control socket for tests
+
+    Answers PING, STATUS, RELOAD, ATTACH, DETACH and the STA-FIRST/STA-NEXT
+    station walk like hostapd does and can push events to attached clients
+    with emit(). group, a name or gid, is applied to the directory and
+    socket the way hostapd applies ctrl_interface_group.
+    """
+
+    def __init__(self, ctrl_dir, iface="wlan0", state="ENABLED", group=None):
+        self.ctrl_dir = ctrl_dir
+        self.group = group
+        self.iface = iface
+        self.state = state
+        self.commands = []
+        self.stations = []
+        self.attached = set()
+        self.reload_delay = 0
+        self.sock = None
+        self.thread = None
+
+    @property
+    def path(self):
+        return os.path.join(self.ctrl_dir, self.iface)
+
+    def start(self):
+        os.makedirs(self.ctrl_dir, exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        if self.group is not None:
+            gid = self.group if isinstance(self.group, int) else grp.getgrnam(self.group).gr_gid
+            for path in (self.ctrl_dir, self.path):
+                os.chown(path, -1, gid)
+                os.chmod(path, 0o770)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.sock:
+            sock, self.sock = self.sock, None
+            # Wake the serving thread so it notices the shutdown
+            try:
+                wake = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                wake.sendto(b"", self.path)
+                wake.close()
+            except OSError:
+                pass
+            self.thread.join(1)
+            sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def emit(self, event, level=2):
+        """Send an unsolicited event to every attached client"""
+        for addr in list(self.attached):
+            try:
+                self.sock.sendto(f"<{level}>{event}".encode(), addr)
+            except OSError:
+                self.attached.discard(addr)
+
+    def _serve(self):
+        while self.sock:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            if not self.sock or not addr:
+                continue
+            cmd = data.decode()
+            self.commands.append(cmd)
+            self.sock.sendto(self._handle(cmd, addr).encode(), addr)
+
+    def _handle(self, cmd, addr):
+        if cmd == "PING":
+            return "PONG\n"
+        if cmd == "STATUS":
+            return f"state={self.state}\n"
+        if cmd == "RELOAD":
+            if self.reload_delay:
+                self.state = "DISABLED"
+                timer = threading.Timer(self.reload_delay, self._enable)
+                timer.daemon = True
+                timer.start()
+            return "OK\n"
+        if cmd == "STA-FIRST":
+            return self._station_reply(0)
+        if cmd.startswith("STA-NEXT "):
+            mac = cmd.split(" ", 1)[1]
+            if mac in self.stations:
+                return self._station_reply(self.stations.index(mac) + 1)
+            return "FAIL\n"
+        if cmd == "ATTACH":
+            self.attached.add(addr)
+            return "OK\n"
+        if cmd == "DETACH":
+            self.attached.discard(addr)
+            return "OK\n"
+        return "UNKNOWN COMMAND\n"
+
+    def _station_reply(self, index):
+        if index >= len(self.stations):
+            return ""
+        return f"{self.stations[index]}\nflags=[AUTH][ASSOC][AUTHORIZED]\n"
+
+    def _enable(self):
+        self.state = "ENABLED"
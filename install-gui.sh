@@ -13,6 +13,9 @@ sudo apt-get install -y python3-gi python3-gi-cairo gir1.2-gtk-3.0 polkitd pkexe
 # Make GUI executable
 chmod +x "$SCRIPT_DIR/wifi-extender-gui.py"
 
+# Privileged helper: one polkit prompt per GUI session instead of one per action
+sudo python3 "$SCRIPT_DIR/privileged_helper.py" --install
+
 # Install desktop shortcut
 mkdir -p ~/.local/share/applications
 sed "s|/home/pi/workspace/pi-wifi-extender|$SCRIPT_DIR|g" \
@@ -1,14 +1,33 @@
 #!/bin/bash
 # Install WiFi Extender to SD card boot partition (for Pi Imager users)
-# Usage: ./install-to-sdcard.sh /path/to/bootfs "SSID" "Password"
+# Usage: ./install-to-sdcard.sh [--debs DIR] /path/to/bootfs "SSID" "Password" [channel] [country] [band]
+#        ./install-to-sdcard.sh --manifest devices.csv [--jobs N] [--debs DIR]
+# --manifest provisions many mounted cards in parallel (see provision.py);
+# --debs bundles .deb packages so first boot needs no network.
 
 set -e
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+if [[ "$1" == "--manifest" ]]; then
+    shift
+    MANIFEST="$1"
+    shift
+    exec python3 "$SCRIPT_DIR/provision.py" "$MANIFEST" "$@"
+fi
+
+DEBS_ARGS=()
+if [[ "$1" == "--debs" ]]; then
+    DEBS_ARGS=(--debs "$2")
+    shift 2
+fi
+
 BOOT_PATH="$1"
 WIFI_SSID="${2:-PiExtender}"
 WIFI_PASSWORD="$3"
 WIFI_CHANNEL="${4:-6}"
 COUNTRY_CODE="${5:-IE}"
+WIFI_BAND="${6:-g}"
 
 # Find boot partition if not specified
 if [[ -z "$BOOT_PATH" ]]; then
@@ -18,7 +37,8 @@ if [[ -z "$BOOT_PATH" ]]; then
 fi
 
 if [[ ! -f "$BOOT_PATH/cmdline.txt" ]]; then
-    echo "Usage: $0 /path/to/bootfs \"SSID\" \"Password\" [channel] [country]"
+    echo "Usage: $0 [--debs DIR] /path/to/bootfs \"SSID\" \"Password\" [channel] [country] [band]"
+    echo "       $0 --manifest devices.csv [--jobs N] [--debs DIR]"
     echo "Example: $0 /media/user/bootfs \"MyNetwork\" \"MyPassword123\""
     exit 1
 fi
@@ -29,81 +49,10 @@ if [[ -z "$WIFI_PASSWORD" ]] || [[ ${#WIFI_PASSWORD} -lt 8 ]]; then
 fi
 
 echo "Installing to: $BOOT_PATH"
-echo "SSID: $WIFI_SSID | Channel: $WIFI_CHANNEL | Country: $COUNTRY_CODE"
-
-# Create firstrun script
-cat > "$BOOT_PATH/firstrun.sh" << 'FIRSTRUN_OUTER'
-#!/bin/bash
-# Clean up firstrun from both possible boot locations
-rm -f /boot/firstrun.sh /boot/firmware/firstrun.sh
-sed -i 's| systemd.run.*||g' /boot/cmdline.txt /boot/firmware/cmdline.txt 2>/dev/null
-
-apt-get update -qq && apt-get install -y -qq hostapd bridge-utils
-systemctl stop hostapd 2>/dev/null; rfkill unblock wlan 2>/dev/null
+echo "SSID: $WIFI_SSID | Channel: $WIFI_CHANNEL | Country: $COUNTRY_CODE | Band: $WIFI_BAND"
 
-# Write hostapd config
-FIRSTRUN_OUTER
-
-# Insert variables into the script
-cat >> "$BOOT_PATH/firstrun.sh" << EOF
-cat > /etc/hostapd/hostapd.conf << CONF
-interface=wlan0
-bridge=br0
-driver=nl80211
-ssid=$WIFI_SSID
-hw_mode=g
-channel=$WIFI_CHANNEL
-country_code=$COUNTRY_CODE
-wpa=2
-wpa_passphrase=$WIFI_PASSWORD
-wpa_key_mgmt=WPA-PSK
-rsn_pairwise=CCMP
-wmm_enabled=1
-ieee80211n=1
-CONF
-chmod 600 /etc/hostapd/hostapd.conf
-EOF
-
-# Continue with network configuration
-cat >> "$BOOT_PATH/firstrun.sh" << 'FIRSTRUN_INNER'
-
-# Detect network manager and configure accordingly
-if systemctl is-active --quiet NetworkManager; then
-    # NetworkManager (Bookworm+)
-    nmcli connection delete br0 2>/dev/null || true
-    nmcli connection delete bridge-br0 2>/dev/null || true
-    nmcli connection delete bridge-slave-eth0 2>/dev/null || true
-    
-    nmcli connection add type bridge ifname br0 con-name bridge-br0 \
-        ipv4.method auto ipv6.method auto
-    nmcli connection add type bridge-slave ifname eth0 master br0 \
-        con-name bridge-slave-eth0
-    
-    mkdir -p /etc/NetworkManager/conf.d
-    echo -e "[keyfile]\nunmanaged-devices=interface-name:wlan0" > /etc/NetworkManager/conf.d/10-hostapd.conf
-    systemctl reload NetworkManager
-else
-    # Legacy dhcpcd (Bullseye and older)
-    sed -i 's|^#\?DAEMON_CONF=.*|DAEMON_CONF="/etc/hostapd/hostapd.conf"|' /etc/default/hostapd
-    echo -e "\n# Pi WiFi Extender\ndenyinterfaces wlan0 eth0\ninterface br0" >> /etc/dhcpcd.conf
-    cat > /etc/network/interfaces.d/br0 << BR
-auto br0
-iface br0 inet dhcp
-    bridge_ports eth0
-    bridge_stp off
-    bridge_fd 0
-BR
-fi
-
-systemctl unmask hostapd && systemctl enable hostapd
-reboot
-FIRSTRUN_INNER
-
-chmod +x "$BOOT_PATH/firstrun.sh"
-
-# Add to cmdline.txt
-if ! grep -q "systemd.run=" "$BOOT_PATH/cmdline.txt"; then
-    sed -i 's/$/ systemd.run=\/boot\/firstrun.sh systemd.run_success_action=reboot systemd.unit=kernel-command-line.target/' "$BOOT_PATH/cmdline.txt"
-fi
+# firstrun.sh is rendered from the same template provision.py uses for fleets
+python3 "$SCRIPT_DIR/provision.py" device "$BOOT_PATH" "$WIFI_SSID" "$WIFI_PASSWORD" \
+    "$WIFI_CHANNEL" "$COUNTRY_CODE" "$WIFI_BAND" "${DEBS_ARGS[@]}"
 
 echo "✓ Done! Eject SD card, insert in Pi, and power on."
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Live apply
+Works out which hostapd settings changed and applies them with the least
+disruptive action: a RELOAD over the control socket, a restart of the
+hostapd service, or (when the bridge itself changes) a full setup and
+reboot.
+
+Usage: sudo ./live_apply.py [--reboot-if-needed] [--profile PROFILE] "SSID" "Password"
+                            [channel|auto] [country] [band]
+Exit status 3 means a full setup.sh run and reboot are needed instead.
+With --reboot-if-needed the config is written and the Pi rebooted from
+this same process, so callers need only one pkexec prompt.
+"""
+
+import subprocess
+import sys
+import time
+
+import channel_scan
+import hostapd_config
+import phy_caps
+import readiness
+import stage_timing
+from hostapd_config import HOSTAPD_CONF
+from hostapd_ctrl import HostapdCtrl, HostapdCtrlError
+
+EXIT_NEEDS_SETUP = 3
+
+# Settings hostapd picks up on RELOAD without dropping the interface
+RELOAD_KEYS = {
+    "ssid", "wpa_passphrase", "channel", "hw_mode", "wpa", "wpa_key_mgmt",
+    "rsn_pairwise", "wmm_enabled", "ieee80211n", "ieee80211ac",
+    "ht_capab", "vht_capab", "vht_oper_chwidth", "vht_oper_centr_freq_seg0_idx",
+}
+# Settings that change the bridge/network manager setup
+SETUP_KEYS = {"bridge"}
+# Channel for an extra radio that has none, as setup.sh defaults it
+RADIO_CHANNELS = {"a": 36, "g": 6}
+
+ACTION_NONE = "none"
+ACTION_RELOAD = "reload"
+ACTION_RESTART = "restart"
+ACTION_SETUP = "setup"
+
+
+def plan_changes(old, new):
+    """Return (action, changed keys) needed to go from old to new settings"""
+    if not old:
+        return ACTION_SETUP, sorted(new)
+    changed = sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+    if not changed:
+        return ACTION_NONE, changed
+    if SETUP_KEYS & set(changed):
+        return ACTION_SETUP, changed
+    if set(changed) <= RELOAD_KEYS:
+        return ACTION_RELOAD, changed
+    return ACTION_RESTART, changed
+
+
+def wait_enabled(ctrl, timeout=30, interval=0.1):
+    """Poll hostapd until the AP reports ENABLED; return True on success"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if ctrl.available() and ctrl.status().get("state") == "ENABLED":
+                return True
+        except HostapdCtrlError:
+            ctrl.close()
+        time.sleep(interval)
+    return False
+
+
+def restart_service():
+    subprocess.run(["systemctl", "restart", "hostapd"], check=True, timeout=60)
+
+
+def apply_config(config, path=HOSTAPD_CONF, ctrl=None, restart=restart_service,
+                 timeout=30, owned=hostapd_config.MANAGED_KEYS):
+    """Apply a HostapdConfig live
+
+    Only the keys that changed are rewritten; other lines in the file are
+    kept, except keys in owned that config lacks, which are removed.
+    Returns (action, changed keys, seconds the AP was down). Downtime is
+    None for ACTION_NONE and ACTION_SETUP, where nothing was touched.
+    """
+    current = hostapd_config.load(path)
+    new = hostapd_config.merge(current, config, owned)
+    action, changed = plan_changes(current.as_dict(), new.as_dict())
+    if action in (ACTION_NONE, ACTION_SETUP):
+        return action, changed, None
+
+    ctrl = ctrl or HostapdCtrl(current.interface)
+    hostapd_config.save(new, path)
+    started = time.monotonic()
+    try:
+        if action == ACTION_RELOAD and ctrl.available():
+            ctrl.reload()
+        else:
+            action = ACTION_RESTART
+            ctrl.close()
+            restart()
+        if not wait_enabled(ctrl, timeout):
+            raise HostapdCtrlError(f"AP not back after {timeout}s")
+    finally:
+        ctrl.close()
+    return action, changed, time.monotonic() - started
+
+
+def apply_settings(ssid, password, channel="6", country="IE", band="g",
+                   reboot_if_needed=False, profile=None, report=print):
+    """Render and apply settings, keeping the Auto channel timer in step
+
+    Returns (action, changed keys, downtime) like apply_config. With
+    reboot_if_needed a setup-level change is saved and the Pi rebooted.
+    profile, if given, is a tuning profile applied too; its changes are
+    passed to report() one line at a time, as are those of extra radios,
+    which take the new SSID, password and country on their own channel.
+    """
+    if len(password) < 8:
+        raise ValueError("Password must be at least 8 characters")
+    current = hostapd_config.load()
+    iface = current.interface
+    auto = channel == "auto"
+    if auto:
+        channel = channel_scan.pick_channel(iface, band, country, current.channel)
+    caps = phy_caps.probe(iface, channel, band, country) or None
+    # Stay in routed mode (no bridge) if that is how the AP was set up
+    bridge = current.bridge if current else hostapd_config.BRIDGE
+    config = hostapd_config.render(ssid, password, channel, country, band, iface, caps, bridge)
+    action, changed, downtime = apply_config(config)
+    if action == ACTION_SETUP:
+        if reboot_if_needed:
+            hostapd_config.save(hostapd_config.merge(current, config))
+            _tune(profile, iface, False, report)
+            subprocess.run(["reboot"], check=True, timeout=30)
+        return action, changed, downtime
+    _apply_radios(ssid, password, country, report)
+    _tune(profile, iface, True, report)
+    if auto:
+        channel_scan.install_timer(iface, band, country)
+    else:
+        channel_scan.remove_timer()
+    return action, changed, downtime
+
+
+def _apply_radios(ssid, password, country, report, path=HOSTAPD_CONF):
+    for radio_path, current in hostapd_config.load_radios(path)[1:]:
+        iface = current.interface
+        band = current.band
+        # No channel (or "auto", unsupported here): setup.sh's default for the band
+        channel = current.channel or RADIO_CHANNELS.get(band, 6)
+        caps = phy_caps.probe(iface, channel, band, country) or None
+        config = hostapd_config.render(ssid, password, channel, country, band, iface, caps)
+        action, changed, downtime = apply_config(
+            config, radio_path, HostapdCtrl(iface),
+            restart=lambda: subprocess.run(["systemctl", "restart", f"hostapd@{iface}"],
+                                           check=True, timeout=60))
+        if action != ACTION_NONE:
+            report(f"{iface}: {describe(action, changed, downtime)}")
+
+
+def _tune(profile, iface, restart, report):
+    if not profile:
+        return
+    import tuning  # Imports this module
+    for change in tuning.apply(profile, iface, restart=restart):
+        report(f"Tuning: {change}")
+
+
+def wait_ap_ready(iface, downtime=0.0, timeout=readiness.DEFAULT_TIMEOUT):
+    """Wait until the AP is fully back and record the time-to-ready
+
+    Measured from when the reload or restart began, downtime seconds ago.
+    """
+    state = readiness.SystemState(iface, readiness.configured_bridge())
+    try:
+        result = readiness.wait_ready(state, timeout, started=time.monotonic() - downtime)
+    finally:
+        state.close()
+    stage_timing.record("apply", "ready", time.time() - result.elapsed, result.elapsed,
+                        "ok" if result.ready else "timeout")
+    return result
+
+
+def describe(action, changed, downtime):
+    """One-line summary of an apply for the CLI and GUIs"""
+    if action == ACTION_NONE:
+        return "No changes to apply"
+    if action == ACTION_SETUP:
+        return "Bridge setup changed - full setup and reboot required"
+    return f"✓ Applied via {action} ({', '.join(changed)}) - AP down for {downtime:.1f}s"
+
+
+def main(argv):
+    reboot_if_needed = "--reboot-if-needed" in argv
+    argv = [a for a in argv if a != "--reboot-if-needed"]
+    profile = None
+    if "--profile" in argv[:-1]:
+        i = argv.index("--profile")
+        profile = argv[i + 1]
+        del argv[i:i + 2]
+    if len(argv) < 2:
+        print("Usage: sudo ./live_apply.py [--reboot-if-needed] [--profile PROFILE] "
+              "\"SSID\" \"Password\" [channel|auto] [country] [band]", file=sys.stderr)
+        return 1
+    try:
+        action, changed, downtime = apply_settings(*argv[:5], reboot_if_needed=reboot_if_needed,
+                                                   profile=profile)
+    except (OSError, ValueError, subprocess.SubprocessError, HostapdCtrlError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if action == ACTION_SETUP and reboot_if_needed:
+        print("Config saved - rebooting")
+        return 0
+    print(describe(action, changed, downtime))
+    if action == ACTION_SETUP:
+        return EXIT_NEEDS_SETUP
+    if downtime is not None:
+        result = wait_ap_ready(hostapd_config.load().interface, downtime)
+        print(result.describe())
+        return 0 if result.ready else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
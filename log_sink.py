@@ -0,0 +1,112 @@
+"""
+Pi WiFi Extender - Log sink
+Stages log lines from any thread so the GUI can insert them in one batch
+per frame, keeps at most max_lines pending, and optionally spills the full
+history to a size-rotated file on disk.
+"""
+
+import os
+import threading
+from collections import deque
+
+DEFAULT_MAX_LINES = 2000
+DEFAULT_HISTORY_BYTES = 1024 * 1024
+DEFAULT_HISTORY_BACKUPS = 3
+
+
+class RotatingFile:
+    """Append-only text file rotated to .1, .2, ... when it grows too big"""
+
+    def __init__(self, path, max_bytes=DEFAULT_HISTORY_BYTES,
+                 backups=DEFAULT_HISTORY_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, text):
+        self.file.write(text)
+        self.size += len(text.encode("utf-8", errors="replace"))
+
+    def flush(self):
+        self.file.flush()
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class LogSink:
+    """Thread-safe staging area between log producers and the log view"""
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, history_file=None,
+                 history_bytes=DEFAULT_HISTORY_BYTES,
+                 history_backups=DEFAULT_HISTORY_BACKUPS):
+        self.max_lines = max_lines
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=max_lines)
+        self.dropped = 0
+        self.history = None
+        if history_file:
+            try:
+                self.history = RotatingFile(history_file, history_bytes, history_backups)
+            except OSError:
+                pass  # Will be kept when running as root
+
+    def write(self, line):
+        """Queue a line; returns True if the caller should schedule a flush"""
+        with self.lock:
+            first = not self.pending and not self.dropped
+            if len(self.pending) == self.max_lines:
+                self.dropped += 1
+            self.pending.append(line)
+            if self.history:
+                # Producers are worker threads; a full or read-only disk
+                # must not reach them, so the history is given up instead
+                try:
+                    self.history.write(line + "\n")
+                except OSError:
+                    self._drop_history()
+        return first
+
+    def drain(self):
+        """Return everything queued since the last drain as one string"""
+        with self.lock:
+            lines = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+            if self.history:
+                try:
+                    self.history.flush()
+                except OSError:
+                    self._drop_history()
+        if dropped:
+            lines.insert(0, f"... {dropped} earlier lines not shown")
+        return "".join(line + "\n" for line in lines)
+
+    def close(self):
+        with self.lock:
+            if self.history:
+                self._drop_history()
+
+    def _drop_history(self):
+        history, self.history = self.history, None
+        try:
+            history.close()
+        except OSError:
+            pass  # Buffered lines that could not be written are lost
@@ -0,0 +1,199 @@
+"""
+Pi WiFi Extender - Prometheus metrics
+Renders status_collector snapshots in the Prometheus text format and
+serves them over HTTP. The text is rendered once per collection tick, so
+however often the endpoint is scraped it never touches the kernel or
+spawns anything.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 9477
+DEFAULT_ADDR = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "wifi_extender"
+
+# sysfs counter -> (metric suffix, help text)
+INTERFACE_COUNTERS = {
+    "rx_bytes": ("receive_bytes_total", "Bytes received"),
+    "tx_bytes": ("transmit_bytes_total", "Bytes transmitted"),
+    "rx_packets": ("receive_packets_total", "Packets received"),
+    "tx_packets": ("transmit_packets_total", "Packets transmitted"),
+    "rx_dropped": ("receive_drop_total", "Received packets dropped"),
+    "tx_dropped": ("transmit_drop_total", "Transmitted packets dropped"),
+}
+# Station field -> (metric suffix, type, help text)
+STATION_FIELDS = {
+    "signal": ("station_signal_dbm", "gauge", "Last signal strength"),
+    "tx_bitrate": ("station_transmit_bitrate_mbps", "gauge", "Bitrate to the station"),
+    "rx_bitrate": ("station_receive_bitrate_mbps", "gauge", "Bitrate from the station"),
+    "tx_bytes": ("station_transmit_bytes_total", "counter", "Bytes sent to the station"),
+    "rx_bytes": ("station_receive_bytes_total", "counter", "Bytes received from the station"),
+    "inactive_ms": ("station_inactive_milliseconds", "gauge", "Time since the station was last active"),
+}
+# Uplink sysfs counter -> (metric suffix, help text)
+UPLINK_COUNTERS = {
+    "rx_errors": ("uplink_receive_errors_total", "Receive errors on the uplink"),
+    "tx_errors": ("uplink_transmit_errors_total", "Transmit errors on the uplink"),
+    "rx_crc_errors": ("uplink_receive_crc_errors_total", "Frames with bad CRCs on the uplink"),
+    "carrier_changes": ("uplink_carrier_changes_total", "Times the uplink's carrier came or went"),
+}
+# Traffic shaping class field -> (metric suffix, type, help text)
+QOS_FIELDS = {
+    "bytes": ("qos_bytes_total", "counter", "Bytes sent through the client's shaping class"),
+    "packets": ("qos_packets_total", "counter", "Packets sent through the client's shaping class"),
+    "drops": ("qos_drops_total", "counter", "Packets dropped by the client's queue"),
+    "overlimits": ("qos_overlimits_total", "counter", "Times the client was held back by a cap"),
+    "backlog": ("qos_backlog_bytes", "gauge", "Bytes queued for the client"),
+    "qlen": ("qos_queue_packets", "gauge", "Packets queued for the client"),
+}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _radio_labels(radio):
+    return {"interface": radio["interface"], "band": radio["band"] or "",
+            "channel": radio["channel"] if radio["channel"] is not None else ""}
+
+
+def _station_labels(station):
+    labels = {"mac": station["mac"]}
+    if station.get("interface"):
+        labels["interface"] = station["interface"]
+    return labels
+
+
+def render(snapshot):
+    """Prometheus text exposition of one snapshot"""
+    lines = []
+
+    def metric(suffix, kind, help_text, samples):
+        name = f"{PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    hostapd = snapshot["hostapd"]
+    metric("hostapd_up", "gauge", "Whether hostapd is running",
+           [({}, int(hostapd["running"]))])
+    metric("ap_enabled", "gauge", "Whether hostapd reports the AP as ENABLED",
+           [({}, int(hostapd["state"] == "ENABLED"))])
+    metric("bridge_up", "gauge", "Whether the bridge's operstate is up",
+           [({"bridge": snapshot["bridge"]["name"]},
+             int(snapshot["bridge"]["operstate"] == "up"))])
+
+    interfaces = snapshot.get("interfaces", {})
+    for counter, (suffix, help_text) in INTERFACE_COUNTERS.items():
+        samples = [({"interface": name}, stats[counter])
+                   for name, stats in interfaces.items() if counter in stats]
+        if samples:
+            metric(f"interface_{suffix}", "counter", help_text, samples)
+
+    metric("stations", "gauge", "Associated stations", [({}, snapshot["clients"])])
+    radios = snapshot.get("radios", [])
+    if radios:
+        metric("radio_enabled", "gauge", "Whether hostapd reports the radio's AP as ENABLED",
+               [(_radio_labels(r), int(r["state"] == "ENABLED")) for r in radios])
+        metric("radio_stations", "gauge", "Stations associated per radio",
+               [(_radio_labels(r), r["clients"]) for r in radios])
+    stations = snapshot.get("stations", [])
+    for field, (suffix, kind, help_text) in STATION_FIELDS.items():
+        samples = [(_station_labels(s), s[field]) for s in stations if s.get(field) is not None]
+        if samples:
+            metric(suffix, kind, help_text, samples)
+
+    _render_uplink(snapshot.get("uplink"), metric)
+    _render_qos(snapshot.get("qos"), metric)
+
+    metric("snapshot_timestamp_seconds", "gauge", "When the snapshot was collected",
+           [({}, f"{snapshot['time']:.3f}")])
+    return "\n".join(lines) + "\n"
+
+
+def _render_uplink(summary, metric):
+    link = (summary or {}).get("link")
+    if link:
+        labels = {"interface": link["interface"]}
+        if link.get("carrier") is not None:
+            metric("uplink_carrier", "gauge", "Whether the uplink has carrier",
+                   [(labels, int(link["carrier"]))])
+        for counter, (suffix, help_text) in UPLINK_COUNTERS.items():
+            if link.get(counter) is not None:
+                metric(suffix, "counter", help_text, [(labels, link[counter])])
+    if not summary or not summary.get("sent"):
+        return
+    target = {"target": summary["target"]}
+    samples = [(dict(target, quantile=f"{p / 100:g}"), f"{summary[f'p{p}']:.6f}")
+               for p in (50, 95, 99) if summary.get(f"p{p}") is not None]
+    if samples:
+        metric("uplink_latency_seconds", "gauge",
+               "Gateway round-trip time percentiles over the probe window", samples)
+    metric("uplink_loss_ratio", "gauge", "Share of gateway probes lost over the window",
+           [(target, summary["loss"])])
+    metric("uplink_probes", "gauge", "Gateway probes in the window", [(target, summary["sent"])])
+
+
+def _render_qos(stats, metric):
+    """Per-class shaping counters; mac is empty for the shared default class"""
+    rows = [({"interface": iface, "direction": direction, "class": row["class"],
+              "mac": row["mac"] or ""}, row)
+            for iface, directions in (stats or {}).items()
+            for direction in ("down", "up") for row in directions[direction]]
+    if not rows:
+        return
+    for field, (suffix, kind, help_text) in QOS_FIELDS.items():
+        metric(suffix, kind, help_text, [(labels, row[field]) for labels, row in rows])
+
+
+class MetricsServer:
+    """Serves the last rendered snapshot on /metrics"""
+
+    def __init__(self, addr=DEFAULT_ADDR, port=DEFAULT_PORT):
+        self.body = b""
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                with server.lock:
+                    body = server.body
+                if not body:
+                    self.send_error(503, "No snapshot collected yet")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the journal
+
+        self.httpd = ThreadingHTTPServer((addr, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def update(self, snapshot):
+        """Render a new snapshot; called once per collection tick"""
+        body = render(snapshot).encode()
+        with self.lock:
+            self.body = body
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
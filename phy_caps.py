@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Radio capability probe
+Parses `iw phy` output and generates the widest safe channel width plus
+the matching ht_capab/vht_capab lines for hostapd, using only features
+the radio actually advertises.
+
+Usage: ./phy_caps.py [--iface wlan0 | --from-file DUMP] --channel N [--band g|a]
+
+2.4 GHz stays at 20 MHz: 40 MHz there overlaps most of the band and is
+what neighbours' coexistence scans force back down anyway. On 5 GHz the
+AP uses 80 MHz when the radio supports VHT and every channel in the block
+is enabled, otherwise 40 MHz, otherwise 20 MHz.
+"""
+
+import re
+import subprocess
+import sys
+import time
+
+# 5 GHz 80 MHz blocks: centre channel index -> member channels
+VHT80_BLOCKS = {
+    42: (36, 40, 44, 48),
+    58: (52, 56, 60, 64),
+    106: (100, 104, 108, 112),
+    122: (116, 120, 124, 128),
+    138: (132, 136, 140, 144),
+    155: (149, 153, 157, 161),
+}
+
+
+class BandCaps:
+    """HT/VHT capabilities and usable channels of one band of a phy"""
+
+    def __init__(self, number):
+        self.number = number
+        self.ht = set()       # HT capability lines, e.g. "RX HT20 SGI"
+        self.vht = set()      # VHT capability lines
+        self.has_vht = False
+        self.max_amsdu = None
+        self.max_mpdu = None
+        self.channels = {}    # channel -> "ok", "disabled" or "radar"
+
+    @property
+    def is_5ghz(self):
+        return any(ch > 14 for ch in self.channels)
+
+    def usable(self, channel):
+        return self.channels.get(channel) == "ok"
+
+
+def parse_phy(text):
+    """Parse `iw phy` output into {band number: BandCaps}"""
+    bands = {}
+    band = None
+    section = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        match = re.match(r"Band (\d+):", line)
+        if match and raw.startswith("\tBand"):
+            band = bands.setdefault(int(match.group(1)), BandCaps(int(match.group(1))))
+            section = None
+            continue
+        if band is None:
+            continue
+        if not raw.startswith("\t\t"):
+            band = None  # Left the band block
+            continue
+        if not raw.startswith("\t\t\t"):
+            if line.startswith("Capabilities:"):
+                section = "ht"
+            elif line.startswith("VHT Capabilities"):
+                section = "vht"
+                band.has_vht = True
+            elif line.startswith("Frequencies:"):
+                section = "freq"
+            else:
+                section = None
+            continue
+        if section == "ht":
+            band.ht.add(line)
+            match = re.match(r"Max AMSDU length: (\d+)", line)
+            if match:
+                band.max_amsdu = int(match.group(1))
+        elif section == "vht":
+            band.vht.add(line)
+            match = re.match(r"Max MPDU length: (\d+)", line)
+            if match:
+                band.max_mpdu = int(match.group(1))
+        elif section == "freq":
+            match = re.match(r"\* \d+(?:\.\d+)? MHz \[(\d+)\]", line)
+            if match:
+                if "disabled" in line:
+                    state = "disabled"
+                elif "radar" in line or "no IR" in line:
+                    state = "radar"
+                else:
+                    state = "ok"
+                band.channels[int(match.group(1))] = state
+    return bands
+
+
+def band_for(bands, band):
+    """Pick the BandCaps for hostapd hw_mode g or a"""
+    for caps in bands.values():
+        if caps.is_5ghz == (band == "a"):
+            return caps
+    return None
+
+
+def ht40_direction(channel):
+    """'+' or '-' for the 5 GHz HT40 pair containing channel, or None"""
+    for members in VHT80_BLOCKS.values():
+        if channel in members:
+            return "+" if members.index(channel) % 2 == 0 else "-"
+    return None
+
+
+def capability_lines(bands, channel, band="g"):
+    """hostapd.conf lines for the widest safe width on channel"""
+    caps = band_for(bands, band)
+    if caps is None or not str(channel).isdigit():
+        return []  # No radio for the band, or no fixed channel to size
+    channel = int(channel)
+    ht = caps.ht
+    flags = []
+    if "RX LDPC" in ht:
+        flags.append("[LDPC]")
+
+    width = 20
+    direction = ht40_direction(channel) if band == "a" else None
+    if direction and "HT20/HT40" in ht:
+        partner = channel + 4 if direction == "+" else channel - 4
+        if caps.usable(partner):
+            width = 40
+            flags.append(f"[HT40{direction}]")
+
+    if "RX HT20 SGI" in ht:
+        flags.append("[SHORT-GI-20]")
+    if width == 40 and "RX HT40 SGI" in ht:
+        flags.append("[SHORT-GI-40]")
+    if "TX STBC" in ht:
+        flags.append("[TX-STBC]")
+    for streams, flag in (("1", "[RX-STBC1]"), ("2", "[RX-STBC12]"), ("3", "[RX-STBC123]")):
+        if f"RX STBC {streams}-stream" in ht:
+            flags.append(flag)
+    if caps.max_amsdu == 7935:
+        flags.append("[MAX-AMSDU-7935]")
+
+    lines = []
+    if flags:
+        lines.append(f"ht_capab={''.join(flags)}")
+
+    if band == "a" and caps.has_vht:
+        lines.append("ieee80211ac=1")
+        vht = caps.vht
+        vht_flags = []
+        if caps.max_mpdu in (7991, 11454):
+            vht_flags.append(f"[MAX-MPDU-{caps.max_mpdu}]")
+        if "RX LDPC" in vht:
+            vht_flags.append("[RXLDPC]")
+        center = next((c for c, members in VHT80_BLOCKS.items() if channel in members), None)
+        if (width == 40 and center
+                and all(caps.usable(ch) for ch in VHT80_BLOCKS[center])):
+            width = 80
+            if "short GI (80 MHz)" in vht:
+                vht_flags.append("[SHORT-GI-80]")
+        if "TX STBC" in vht:
+            vht_flags.append("[TX-STBC-2BY1]")
+        if "SU Beamformee" in vht:
+            vht_flags.append("[SU-BEAMFORMEE]")
+        if "MU Beamformee" in vht:
+            vht_flags.append("[MU-BEAMFORMEE]")
+        if vht_flags:
+            lines.append(f"vht_capab={''.join(vht_flags)}")
+        if width == 80:
+            lines.append("vht_oper_chwidth=1")
+            lines.append(f"vht_oper_centr_freq_seg0_idx={center}")
+        else:
+            lines.append("vht_oper_chwidth=0")
+    return lines
+
+
+def phy_name(iface):
+    """phy backing a network interface, read from sysfs (no fork)"""
+    try:
+        with open(f"/sys/class/net/{iface}/phy80211/name") as f:
+            return f.read().strip()
+    except OSError:
+        return "phy0"
+
+
+def set_regdomain(country, timeout=1.0):
+    """Switch the kernel to country's regulatory rules, as hostapd would
+
+    `iw phy` marks channels disabled under the active regdomain, so it has
+    to be the new country's before probing for it. The switch lands
+    asynchronously; wait up to timeout seconds for `iw reg get` to show it.
+    """
+    try:
+        subprocess.run(["iw", "reg", "set", country], capture_output=True, timeout=5)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = subprocess.run(["iw", "reg", "get"], capture_output=True,
+                                    text=True, timeout=5)
+            if f"country {country}:" in result.stdout:
+                return True
+            time.sleep(0.1)
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return False
+
+
+def probe(iface="wlan0", channel=6, band="g", country=None):
+    """Capability lines for iface's radio; [] if it cannot be probed
+
+    With country, the regdomain is switched to it first so the channels
+    are checked against the rules hostapd will run under.
+    """
+    if country:
+        set_regdomain(country)
+    try:
+        result = subprocess.run(["iw", "phy", phy_name(iface), "info"],
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return capability_lines(parse_phy(result.stdout), channel, band)
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    iface = option("--iface", "wlan0")
+    dump_file = option("--from-file")
+    channel = option("--channel")
+    band = option("--band", "g")
+    if channel is None:
+        print("Usage: ./phy_caps.py [--iface wlan0 | --from-file DUMP] --channel N [--band g|a]",
+              file=sys.stderr)
+        return 1
+
+    if dump_file:
+        with open(dump_file) as f:
+            lines = capability_lines(parse_phy(f.read()), channel, band)
+    else:
+        lines = probe(iface, channel, band)
+    for line in lines:
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
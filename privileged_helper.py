@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Privileged helper
+A small root service, socket-activated by systemd, that runs the
+privileged operations for both GUIs. A GUI keeps one connection open and
+polkit is asked once, on the connection's first privileged request, so
+chained operations need no new pkexec processes or prompts.
+
+Protocol: one JSON object per line. Requests are {"op": ..., "args": {...}};
+the helper answers with any number of {"line": ...} output messages and
+then {"ok": true, "result": ...} or {"ok": false, "error": ..., "code": N}.
+
+Usage: sudo ./privileged_helper.py [--socket PATH]   (normally started by systemd)
+       ./privileged_helper.py --mock --socket PATH   (unprivileged, for testing)
+       sudo ./privileged_helper.py --install | --remove
+"""
+
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SOCKET_PATH = "/run/wifi-extender/helper.sock"
+SYSTEMD_DIR = "/etc/systemd/system"
+POLKIT_DIR = "/usr/share/polkit-1/actions"
+POLICY_FILE = "com.pi.wifi-extender.policy"
+POLKIT_ACTION = "com.pi.wifi-extender.helper"
+UNIT_NAME = "wifi-extender-helper"
+# A socket-activated helper exits after this long without connections
+IDLE_EXIT = 300
+
+OPS = ("ping", "station_stats", "apply_config", "restart_ap",
+       "setup", "set_qos", "revert", "uninstall", "reboot")
+# Operations any local user may call without authorisation
+READ_ONLY_OPS = {"ping", "station_stats"}
+# pkexec's exit status when authorisation is refused
+EXIT_NOT_AUTHORIZED = 126
+
+
+class HelperError(Exception):
+    """An operation failed; code mirrors the equivalent script's exit status"""
+
+    def __init__(self, message, code=1):
+        super().__init__(message)
+        self.code = code
+
+
+def qos_args(default=None, clients=None):
+    """qos.py arguments for the set_qos operation"""
+    if default == "off":
+        return ["off"]
+    args = ["set"] + (["--default", default] if default else [])
+    for mac, rates in (clients or {}).items():
+        args += ["--client", f"{mac}={rates}"]
+    return args
+
+
+class SystemBackend:
+    """Runs each operation for real; needs root"""
+
+    def __init__(self, conf=None):
+        self.conf = conf  # hostapd.conf path; None for the installed one
+        self.readers = {}  # iface -> StationReader, kept open between calls
+
+    def ping(self, on_line):
+        return "pong"
+
+    def station_stats(self, on_line, iface="wlan0"):
+        # Any local user may ask, so only configured radios get a reader
+        import hostapd_config
+        import station_stats
+        radios = {config.interface for _, config in
+                  hostapd_config.load_radios(self.conf or hostapd_config.HOSTAPD_CONF)}
+        if iface not in radios:
+            raise HelperError(f"Not a configured radio: {iface}")
+        for name in set(self.readers) - radios:
+            self.readers.pop(name).close()
+        reader = self.readers.get(iface)
+        if reader is None:
+            reader = self.readers[iface] = station_stats.StationReader(iface)
+        return [s.as_dict() for s in reader.stations()]
+
+    def apply_config(self, on_line, ssid, password, channel="6", country="IE",
+                     band="g", reboot_if_needed=False, profile=None):
+        import hostapd_config
+        import live_apply
+        action, changed, downtime = live_apply.apply_settings(
+            ssid, password, str(channel), country, band, reboot_if_needed,
+            profile=profile, report=on_line)
+        summary = live_apply.describe(action, changed, downtime)
+        if action == live_apply.ACTION_SETUP and not reboot_if_needed:
+            raise HelperError(summary, live_apply.EXIT_NEEDS_SETUP)
+        on_line(summary)
+        ready = None
+        if downtime is not None:
+            result = live_apply.wait_ap_ready(hostapd_config.load().interface, downtime)
+            on_line(result.describe())
+            ready = result.as_dict()
+        return {"action": action, "changed": changed, "downtime": downtime, "ready": ready}
+
+    def restart_ap(self, on_line):
+        import hostapd_config
+        import live_apply
+        started = time.monotonic()
+        live_apply.restart_service()
+        result = live_apply.wait_ap_ready(hostapd_config.load().interface,
+                                          time.monotonic() - started)
+        on_line(result.describe())
+        return result.as_dict()
+
+    def setup(self, on_line, ssid, password, channel="6", country="IE", band="g",
+              profile=None, mode=None, qos=None):
+        self._run([os.path.join(SCRIPT_DIR, "setup.sh")]
+                  + (["--profile", profile] if profile else [])
+                  + (["--mode", mode] if mode else [])
+                  + (["--qos", qos] if qos else [])
+                  + [ssid, password, str(channel), country, band], on_line)
+
+    def set_qos(self, on_line, default=None, clients=None):
+        """Change shaping: default "DOWN:UP" caps or "off", clients MAC -> caps"""
+        self._run([sys.executable, os.path.join(SCRIPT_DIR, "qos.py")]
+                  + qos_args(default, clients), on_line)
+
+    def revert(self, on_line):
+        self._run([os.path.join(SCRIPT_DIR, "setup.sh"), "--revert"], on_line)
+
+    def uninstall(self, on_line):
+        self._run([os.path.join(SCRIPT_DIR, "uninstall.sh")], on_line)
+
+    def reboot(self, on_line):
+        subprocess.run(["reboot"], check=True, timeout=30)
+
+    def _run(self, cmd, on_line):
+        """Run a script, streaming its output; kill it if the client goes away"""
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, start_new_session=True)
+        try:
+            for line in proc.stdout:
+                on_line(line.decode(errors="replace").rstrip("\n"))
+        except BaseException:
+            os.killpg(proc.pid, signal.SIGTERM)
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode:
+            raise HelperError(f"{os.path.basename(cmd[0])} exited with status "
+                              f"{proc.returncode}", proc.returncode)
+
+
+class MockBackend:
+    """Unprivileged stand-in that records calls, for tests and GUI work"""
+
+    def __init__(self):
+        self.calls = []
+        self.needs_setup = False
+        self.stations = []
+
+    def _record(self, op, **args):
+        self.calls.append((op, args))
+
+    def ping(self, on_line):
+        return "pong"
+
+    def station_stats(self, on_line, iface="wlan0"):
+        self._record("station_stats", iface=iface)
+        return list(self.stations)
+
+    def apply_config(self, on_line, ssid, password, channel="6", country="IE",
+                     band="g", reboot_if_needed=False, profile=None):
+        self._record("apply_config", ssid=ssid, channel=channel,
+                     reboot_if_needed=reboot_if_needed, profile=profile)
+        if self.needs_setup and not reboot_if_needed:
+            raise HelperError("Bridge setup changed - full setup and reboot required", 3)
+        on_line("✓ Applied via reload (ssid) - AP down for 0.0s")
+        return {"action": "reload", "changed": ["ssid"], "downtime": 0.0}
+
+    def restart_ap(self, on_line):
+        self._record("restart_ap")
+
+    def setup(self, on_line, ssid, password, channel="6", country="IE", band="g",
+              profile=None, mode=None, qos=None):
+        self._record("setup", ssid=ssid, profile=profile, mode=mode, qos=qos)
+        on_line("Setting up WiFi Extender...")
+
+    def set_qos(self, on_line, default=None, clients=None):
+        self._record("set_qos", default=default, clients=clients)
+        on_line("Saved /etc/wifi-extender/qos.json")
+
+    def revert(self, on_line):
+        self._record("revert")
+        on_line("Reverting to backup...")
+
+    def uninstall(self, on_line):
+        self._record("uninstall")
+
+    def reboot(self, on_line):
+        self._record("reboot")
+
+
+def polkit_authorize(pid, uid):
+    """Ask polkit, prompting in the caller's session if needed"""
+    if uid == 0:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            start_time = f.read().rsplit(")", 1)[1].split()[19]
+        result = subprocess.run(
+            ["pkcheck", "--action-id", POLKIT_ACTION,
+             "--process", f"{pid},{start_time},{uid}", "--allow-user-interaction"],
+            capture_output=True, timeout=300)
+    except (OSError, IndexError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0
+
+
+def activated_socket():
+    """The listening socket systemd passed us, if socket-activated"""
+    if (os.environ.get("LISTEN_PID") == str(os.getpid())
+            and os.environ.get("LISTEN_FDS") == "1"):
+        return socket.socket(fileno=3)
+    return None
+
+
+class HelperServer:
+    """Accepts GUI connections and runs their requests on a backend"""
+
+    def __init__(self, backend, path=SOCKET_PATH, authorize=polkit_authorize, sock=None):
+        self.backend = backend
+        self.path = path
+        self.authorize = authorize
+        self.op_lock = threading.Lock()  # One privileged operation at a time
+        self.count_lock = threading.Lock()
+        self.active = 0
+        self.sock = sock
+        if sock is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(path)
+            os.chmod(path, 0o666)  # Callers are authorised per connection
+            self.sock.listen()
+
+    def serve(self, idle_exit=None):
+        """Accept connections until stopped, or idle for idle_exit seconds"""
+        self.sock.settimeout(idle_exit)
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                if not self.active:
+                    return
+                continue
+            except OSError:
+                return  # Stopped
+            conn.settimeout(None)
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def start(self):
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def stop(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, conn):
+        with self.count_lock:
+            self.active += 1
+        pid, uid, _ = struct.unpack("3i", conn.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        authorized = False
+        reader = conn.makefile("rb")
+
+        def send(message):
+            conn.sendall(json.dumps(message).encode() + b"\n")
+
+        try:
+            for raw in reader:
+                try:
+                    request = json.loads(raw)
+                    op = request["op"]
+                    args = request.get("args") or {}
+                except (ValueError, KeyError, TypeError):
+                    send({"ok": False, "error": "Malformed request", "code": 1})
+                    continue
+                if op not in OPS:
+                    send({"ok": False, "error": f"Unknown operation: {op}", "code": 1})
+                    continue
+                if op not in READ_ONLY_OPS and not authorized:
+                    authorized = self.authorize(pid, uid)
+                    if not authorized:
+                        send({"ok": False, "error": "Not authorised",
+                              "code": EXIT_NOT_AUTHORIZED})
+                        continue
+                send(self.run(op, args, lambda text: send({"line": text})))
+        except OSError:
+            pass  # Client went away
+        finally:
+            reader.close()
+            conn.close()
+            with self.count_lock:
+                self.active -= 1
+
+    def run(self, op, args, on_line):
+        method = getattr(self.backend, op)
+        try:
+            if op in READ_ONLY_OPS:
+                result = method(on_line, **args)
+            else:
+                with self.op_lock:
+                    result = method(on_line, **args)
+        except HelperError as e:
+            return {"ok": False, "error": str(e), "code": e.code}
+        except ConnectionError:
+            raise  # Client went away mid-operation
+        except Exception as e:  # Bad arguments, OSError, HostapdCtrlError, ...
+            return {"ok": False, "error": str(e), "code": 1}
+        return {"ok": True, "result": result}
+
+
+class HelperClient:
+    """One long-lived connection to the helper, shared by a GUI
+
+    call() blocks, so GUIs run it off the main loop. Not authorised
+    operations and failures raise HelperError.
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def call(self, op, on_line=None, **args):
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.connect(self.path)
+                    self.reader = self.sock.makefile("rb")
+                self.sock.sendall(json.dumps({"op": op, "args": args}).encode() + b"\n")
+                for raw in self.reader:
+                    message = json.loads(raw)
+                    if "line" in message:
+                        if on_line:
+                            on_line(message["line"])
+                    elif message.get("ok"):
+                        return message.get("result")
+                    else:
+                        raise HelperError(message.get("error", "Failed"), message.get("code", 1))
+            except (OSError, ValueError) as e:
+                self._close()
+                raise HelperError(str(e)) from e
+            self._close()
+            raise HelperError("Helper closed the connection")
+
+    def cancel(self):
+        """Abort a running call; the helper stops the operation's script"""
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+def install_units(systemd_dir=SYSTEMD_DIR, polkit_dir=POLKIT_DIR, enable=True):
+    """Install the socket-activated helper and its polkit action"""
+    units = {
+        "socket": f"""[Unit]
+Description=Pi WiFi Extender - privileged helper socket
+
+[Socket]
+ListenStream={SOCKET_PATH}
+SocketMode=0666
+
+[Install]
+WantedBy=sockets.target
+""",
+        "service": f"""[Unit]
+Description=Pi WiFi Extender - privileged helper
+Requires={UNIT_NAME}.socket
+
+[Service]
+ExecStart={sys.executable} {os.path.join(SCRIPT_DIR, "privileged_helper.py")}
+""",
+    }
+    for suffix, text in units.items():
+        with open(os.path.join(systemd_dir, f"{UNIT_NAME}.{suffix}"), "w") as f:
+            f.write(text)
+    with open(os.path.join(SCRIPT_DIR, POLICY_FILE)) as f:
+        policy = f.read().replace("/home/pi/workspace/pi-wifi-extender", SCRIPT_DIR)
+    os.makedirs(polkit_dir, exist_ok=True)
+    with open(os.path.join(polkit_dir, POLICY_FILE), "w") as f:
+        f.write(policy)
+    if enable:
+        subprocess.run(["systemctl", "daemon-reload"], check=True, timeout=30)
+        subprocess.run(["systemctl", "enable", "--now", f"{UNIT_NAME}.socket"],
+                       check=True, timeout=30)
+
+
+def remove_units(systemd_dir=SYSTEMD_DIR, polkit_dir=POLKIT_DIR):
+    subprocess.run(["systemctl", "disable", "--now", f"{UNIT_NAME}.socket"],
+                   capture_output=True, timeout=30)
+    for path in (os.path.join(systemd_dir, f"{UNIT_NAME}.socket"),
+                 os.path.join(systemd_dir, f"{UNIT_NAME}.service"),
+                 os.path.join(polkit_dir, POLICY_FILE)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    subprocess.run(["systemctl", "daemon-reload"], capture_output=True, timeout=30)
+
+
+def main(argv):
+    args = list(argv)
+    path = SOCKET_PATH
+    if "--socket" in args:
+        i = args.index("--socket")
+        path = args[i + 1]
+        del args[i:i + 2]
+    try:
+        if "--install" in args:
+            install_units()
+            return 0
+        if "--remove" in args:
+            remove_units()
+            return 0
+        if "--mock" in args:
+            server = HelperServer(MockBackend(), path, authorize=lambda pid, uid: True)
+            server.serve()
+            return 0
+        if os.geteuid() != 0:
+            print("Run as root: sudo ./privileged_helper.py", file=sys.stderr)
+            return 1
+        sock = activated_socket()
+        server = HelperServer(SystemBackend(), path, sock=sock)
+        server.serve(IDLE_EXIT if sock else None)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Fleet provisioning
+Prepares many SD card boot partitions at once from a device manifest:
+each card gets a firstrun.sh rendered from the shared firstrun.sh.in
+template with its own SSID, passphrase, channel, country, band and
+interface, and its cmdline.txt set to run it on first boot. Bundled .deb
+packages are copied onto the card so first boot needs no network.
+
+Usage: ./provision.py MANIFEST [--jobs N] [--debs DIR] [--dry-run]
+       ./provision.py device BOOT "SSID" "Password" [channel] [country] [band]
+MANIFEST is a .csv file with a header row or a .json list of devices (or
+{"defaults": {...}, "devices": [...]}). Fields: boot (the mounted boot
+partition), ssid, password, channel, country, band, interface; empty
+fields take the defaults. Fetch packages for --debs with:
+  apt-get download hostapd bridge-utils
+"""
+
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import hostapd_config
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(SCRIPT_DIR, "firstrun.sh.in")
+PACKAGES = ["hostapd", "bridge-utils"]
+DEBS_DIR = "wifi-extender-debs"
+DEFAULTS = {"ssid": "PiExtender", "channel": "6", "country": "IE", "band": "g",
+            "interface": "wlan0"}
+FIELDS = ["boot", "ssid", "password", "channel", "country", "band", "interface"]
+CMDLINE_RUN = ("systemd.run=/boot/firstrun.sh systemd.run_success_action=reboot "
+               "systemd.unit=kernel-command-line.target")
+MAX_JOBS = 8
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def load_manifest(path):
+    """Device dicts from a CSV or JSON manifest, defaults filled in"""
+    defaults = dict(DEFAULTS)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            if isinstance(data, dict):
+                defaults.update(data.get("defaults", {}))
+                data = data.get("devices", [])
+            rows = data
+        else:
+            rows = list(csv.DictReader(f))
+    devices = []
+    for row in rows:
+        device = {key: str(value).strip() for key, value in defaults.items()}
+        device.update({key: str(value).strip() for key, value in row.items()
+                       if key and value not in (None, "")})
+        devices.append(device)
+    return devices
+
+
+def validate(devices):
+    """Raise ManifestError listing every bad device; checked before any write"""
+    errors = []
+    seen = set()
+    for n, device in enumerate(devices, 1):
+        boot = device.get("boot", "")
+        where = f"device {n} ({boot or 'no boot path'})"
+        unknown = set(device) - set(FIELDS)
+        if unknown:
+            errors.append(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+        if not os.path.isfile(os.path.join(boot, "cmdline.txt")):
+            errors.append(f"{where}: no cmdline.txt - not a mounted boot partition")
+        elif os.path.realpath(boot) in seen:
+            errors.append(f"{where}: listed twice")
+        seen.add(os.path.realpath(boot))
+        password = device.get("password", "")
+        if not 8 <= len(password) <= 63:
+            errors.append(f"{where}: password must be 8-63 characters")
+        ssid = device.get("ssid", "")
+        if not 1 <= len(ssid.encode()) <= 32:
+            errors.append(f"{where}: SSID must be 1-32 bytes")
+        if any(ord(c) < 32 for c in ssid + password):
+            errors.append(f"{where}: control characters in SSID or password")
+        if not device.get("channel", "").isdigit():
+            errors.append(f"{where}: channel must be a number")
+        if device.get("band") not in ("a", "g"):
+            errors.append(f"{where}: band must be a or g")
+        if not device.get("country", "").isalpha() or len(device["country"]) != 2:
+            errors.append(f"{where}: country must be a two-letter code")
+        if not device.get("interface", "").replace("_", "").replace("-", "").isalnum():
+            errors.append(f"{where}: bad interface name")
+    if errors:
+        raise ManifestError("\n".join(errors))
+
+
+def render_firstrun(device, template=None):
+    """firstrun.sh text for one device"""
+    if template is None:
+        with open(TEMPLATE, encoding="utf-8") as f:
+            template = f.read()
+    config = hostapd_config.render(device["ssid"], device["password"], device["channel"],
+                                   device["country"], device["band"], device["interface"])
+    return (template
+            .replace("@IFACE@", device["interface"])
+            .replace("@PACKAGES@", " ".join(PACKAGES))
+            .replace("@DEBS_DIR@", DEBS_DIR)
+            .replace("@HOSTAPD_CONF@", config.text().rstrip("\n")))
+
+
+def _write_atomic(path, text, mode=None):
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".provision.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            try:
+                os.chmod(tmp, mode)
+            except PermissionError:
+                pass  # FAT boot partitions take their modes from the mount
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def patch_cmdline(boot):
+    """Make cmdline.txt run firstrun.sh on first boot; False if it already does"""
+    path = os.path.join(boot, "cmdline.txt")
+    with open(path, encoding="utf-8") as f:
+        cmdline = f.read()
+    if "systemd.run=" in cmdline:
+        return False
+    lines = cmdline.split("\n")
+    lines[0] = f"{lines[0].rstrip()} {CMDLINE_RUN}".lstrip()
+    _write_atomic(path, "\n".join(lines), os.stat(path).st_mode & 0o777)
+    return True
+
+
+def copy_debs(debs, boot):
+    """Copy .deb files into the boot partition, skipping unchanged ones"""
+    target = os.path.join(boot, DEBS_DIR)
+    os.makedirs(target, exist_ok=True)
+    copied = 0
+    for deb in debs:
+        dest = os.path.join(target, os.path.basename(deb))
+        try:
+            if os.path.getsize(dest) == os.path.getsize(deb):
+                continue
+        except OSError:
+            pass
+        shutil.copyfile(deb, dest + ".part")
+        os.replace(dest + ".part", dest)
+        copied += 1
+    return copied
+
+
+def provision_device(device, template, debs=(), dry_run=False):
+    """Write one card; returns a summary line"""
+    boot = device["boot"]
+    text = render_firstrun(device, template)
+    summary = (f"{boot}: {device['ssid']} on {device['interface']}, "
+               f"{'5 GHz' if device['band'] == 'a' else '2.4 GHz'} channel {device['channel']}")
+    if dry_run:
+        return summary + (f", {len(debs)} bundled package(s)" if debs else "") + " (dry run)"
+    if debs:
+        copied = copy_debs(debs, boot)
+        summary += f", {len(debs)} bundled package(s) ({copied} copied)"
+    _write_atomic(os.path.join(boot, "firstrun.sh"), text, 0o755)
+    patch_cmdline(boot)
+    return summary
+
+
+def provision(devices, debs=(), jobs=None, dry_run=False, report=print):
+    """Validate every device, then write the cards in parallel
+
+    Returns the number of cards that failed; report() gets one line per card.
+    """
+    validate(devices)
+    with open(TEMPLATE, encoding="utf-8") as f:
+        template = f.read()
+    debs = sorted(debs)
+    jobs = jobs or min(MAX_JOBS, len(devices)) or 1
+    failed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [(device, pool.submit(provision_device, device, template, debs, dry_run))
+                   for device in devices]
+        for device, future in futures:
+            try:
+                report(f"✓ {future.result()}")
+            except OSError as e:
+                report(f"✗ {device['boot']}: {e}")
+                failed += 1
+    return failed
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    jobs = int(option("--jobs", 0)) or None
+    debs_dir = option("--debs")
+    dry_run = "--dry-run" in args
+    args = [a for a in args if a != "--dry-run"]
+    if not args:
+        print(__doc__.strip().split("\n\n", 1)[1], file=sys.stderr)
+        return 1
+    debs = []
+    if debs_dir:
+        debs = glob.glob(os.path.join(debs_dir, "*.deb"))
+        if not debs:
+            print(f"Error: no .deb files in {debs_dir}", file=sys.stderr)
+            return 1
+    try:
+        if args[0] == "device":
+            if len(args) < 4:
+                print(__doc__.strip().split("\n\n", 1)[1], file=sys.stderr)
+                return 1
+            device = dict(DEFAULTS)
+            device.update(zip(["boot", "ssid", "password", "channel", "country", "band"],
+                              args[1:]))
+            devices = [device]
+        else:
+            devices = load_manifest(args[0])
+        if not devices:
+            print("Error: manifest lists no devices", file=sys.stderr)
+            return 1
+        failed = provision(devices, debs, jobs, dry_run)
+    except ManifestError as e:
+        print(f"Error:\n{e}", file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if failed:
+        print(f"{failed} of {len(devices)} card(s) failed", file=sys.stderr)
+        return 1
+    if not dry_run and args[0] != "device":
+        print(f"✓ {len(devices)} card(s) ready. Eject them, insert in the Pis and power on.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
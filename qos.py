@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Per-client traffic shaping
+Keeps one busy client from taking the whole radio. Each client gets an
+HTB class of its own with an fq_codel leaf; classes are served one frame
+at a time in turn, so clients share the link evenly and flows within a
+client share its turn, and any client can be capped. Downloads are
+shaped as they leave the Wi-Fi interface and uploads on an ifb device
+the interface's ingress is redirected to. Bridged traffic never queues
+on br0 (only the Pi's own does), so the Wi-Fi side is where every
+client's traffic can be held back.
+
+Rules are rendered as a `tc -batch` script from the config and the
+connected stations; the status daemon re-renders them every tick and
+re-applies them when a client connects or leaves. Queue and drop
+counters are read back over rtnetlink, without running tc.
+
+Usage: ./qos.py show [--json]
+       sudo ./qos.py set [--default DOWN:UP] [--client MAC=DOWN:UP ...] [--total DOWN:UP]
+                         [--fairness clients|flows] [--iface wlan0] [--dry-run]
+       sudo ./qos.py apply [--iface wlan0] [--dry-run]
+       sudo ./qos.py off [--dry-run]
+  set and off change the config and apply it straight away; apply re-applies
+  it, or with --dry-run prints the tc batch it would run.
+  Rates are Mbit/s; 0 or an empty side (20:) means uncapped, and
+  --client MAC=off drops that client's own caps. --total is what the
+  radio really delivers: set it a little below a measured speed test so
+  the queue builds here, where it is shared fairly, not in the driver.
+  "clients" fairness gives every client a class; "flows" only capped
+  ones, the rest sharing one fq_codel queue flow by flow.
+"""
+
+import json
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+
+import hostapd_config
+import station_stats
+from station_stats import NLM_F_DUMP, NLM_F_REQUEST, NLMSG_DONE, NLMSG_ERROR, _attrs
+
+CONFIG_FILE = "/etc/wifi-extender/qos.json"
+STATE_FILE = "/run/wifi-extender/qos-state.json"
+FAIRNESS = ("clients", "flows")
+LINE_RATE = 1000  # Mbit/s standing in for "uncapped"; above any Wi-Fi link of a Pi
+MIN_RATE_KBIT = 64
+QUANTUM = 1514  # Bytes per class per round: one full frame, so turns are even
+DEFAULT_MINOR = 0xfff  # Unmatched traffic: broadcasts, and unshaped clients
+FIRST_MINOR = 0x10
+MAX_CLIENTS = DEFAULT_MINOR - FIRST_MINOR
+_MAC = re.compile(r"[0-9a-f]{2}(:[0-9a-f]{2}){5}")
+
+# rtnetlink constants (linux/rtnetlink.h, linux/pkt_sched.h, linux/gen_stats.h)
+NETLINK_ROUTE = 0
+RTM_GETQDISC = 38
+RTM_GETTCLASS = 42
+TCA_KIND = 1
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+
+
+def parse_rates(text):
+    """(down, up) Mbit/s from "DOWN:UP"; None for a side that is 0 or empty"""
+    parts = text.split(":")
+    if len(parts) != 2:
+        raise ValueError(f"{text!r}: expected DOWN:UP in Mbit/s")
+    rates = []
+    for part in parts:
+        try:
+            rate = float(part) if part.strip() else 0.0
+        except ValueError:
+            raise ValueError(f"{text!r}: rates must be numbers of Mbit/s") from None
+        if rate < 0:
+            raise ValueError(f"{text!r}: rates cannot be negative")
+        rates.append(rate or None)
+    return tuple(rates)
+
+
+def format_rates(rates):
+    return ":".join("0" if rate is None else f"{rate:g}" for rate in rates)
+
+
+class QosConfig:
+    """Caps as (down, up) pairs in Mbit/s, None meaning uncapped
+
+    clients maps a MAC address to its own caps, overriding default.
+    ValueError if anything is unusable.
+    """
+
+    def __init__(self, default=(None, None), clients=None, total=(None, None),
+                 fairness="clients"):
+        if fairness not in FAIRNESS:
+            raise ValueError(f"Unknown fairness {fairness!r} (choose from {', '.join(FAIRNESS)})")
+        self.fairness = fairness
+        self.default = self._rates(default)
+        self.total = self._rates(total)
+        self.clients = {}
+        for mac, rates in (clients or {}).items():
+            if not _MAC.fullmatch(mac.lower()):
+                raise ValueError(f"Bad MAC address {mac!r}")
+            self.clients[mac.lower()] = self._rates(rates)
+
+    @staticmethod
+    def _rates(rates):
+        down, up = rates
+        for rate in (down, up):
+            if rate is not None and not 0 < rate <= LINE_RATE:
+                raise ValueError(f"Rate {rate} Mbit/s out of range (0-{LINE_RATE})")
+        return (float(down) if down else None, float(up) if up else None)
+
+    def caps(self, mac):
+        return self.clients.get(mac.lower(), self.default)
+
+    def as_dict(self):
+        def pair(rates):
+            return {"down": rates[0], "up": rates[1]}
+        return {"fairness": self.fairness, "total": pair(self.total),
+                "default": pair(self.default),
+                "clients": {mac: pair(rates) for mac, rates in sorted(self.clients.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        def pair(value):
+            value = value or {}
+            return value.get("down"), value.get("up")
+        return cls(pair(data.get("default")),
+                   {mac: pair(rates) for mac, rates in (data.get("clients") or {}).items()},
+                   pair(data.get("total")), data.get("fairness", "clients"))
+
+    def __eq__(self, other):
+        return isinstance(other, QosConfig) and self.as_dict() == other.as_dict()
+
+
+def load(path=CONFIG_FILE):
+    """The saved QosConfig, or None when shaping is off"""
+    try:
+        with open(path) as f:
+            return QosConfig.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(data, path):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".qos.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save(config, path=CONFIG_FILE):
+    _write_json(config.as_dict(), path)
+
+
+def ifb_name(iface):
+    """The ifb device an interface's uploads are shaped on"""
+    return f"ifb-{iface}"[:15]
+
+
+def shaped_clients(config, stations):
+    """[(class minor, MAC)] of the stations given a class of their own"""
+    macs = sorted({mac.lower() for mac in stations})
+    if config.fairness == "flows":
+        macs = [mac for mac in macs if config.caps(mac) != (None, None)]
+    return [(FIRST_MINOR + i, mac) for i, mac in enumerate(macs[:MAX_CLIENTS])]
+
+
+def _kbit(mbit):
+    return max(MIN_RATE_KBIT, int(mbit * 1000))
+
+
+def _tree(dev, total, clients, match):
+    """HTB tree on dev: one class per (minor, MAC, cap) and a default class
+
+    Every class is guaranteed an equal share and may borrow up to its cap
+    (or the whole link) when others are idle.
+    """
+    total = _kbit(total or LINE_RATE)
+    share = max(MIN_RATE_KBIT, total // (len(clients) + 1))
+    lines = [f"qdisc replace dev {dev} root handle 1: htb default {DEFAULT_MINOR:x}",
+             f"class add dev {dev} parent 1: classid 1:1 htb rate {total}kbit ceil {total}kbit "
+             f"quantum {QUANTUM}"]
+    for minor, mac, cap in [(DEFAULT_MINOR, None, None)] + clients:
+        ceil = min(total, _kbit(cap)) if cap else total
+        lines.append(f"class add dev {dev} parent 1:1 classid 1:{minor:x} htb "
+                     f"rate {min(share, ceil)}kbit ceil {ceil}kbit quantum {QUANTUM}")
+        lines.append(f"qdisc add dev {dev} parent 1:{minor:x} handle {minor:x}: fq_codel")
+        if mac:
+            lines.append(f"filter add dev {dev} parent 1: protocol all prio 1 "
+                         f"flower {match} {mac} classid 1:{minor:x}")
+    return lines
+
+
+def render(config, iface, stations):
+    """tc batch lines shaping iface for the connected stations (MACs)
+
+    Downloads are classified by destination MAC on iface itself, uploads
+    by source MAC on its ifb device. Nothing is run here.
+    """
+    clients = shaped_clients(config, stations)
+    ifb = ifb_name(iface)
+    down = [(minor, mac, config.caps(mac)[0]) for minor, mac in clients]
+    up = [(minor, mac, config.caps(mac)[1]) for minor, mac in clients]
+    return (_tree(iface, config.total[0], down, "dst_mac")
+            + [f"qdisc add dev {iface} handle ffff: ingress",
+               f"filter add dev {iface} parent ffff: protocol all prio 1 matchall "
+               f"action mirred egress redirect dev {ifb}"]
+            + _tree(ifb, config.total[1], up, "src_mac"))
+
+
+def teardown(iface):
+    """tc commands removing the rules; each may fail if already gone"""
+    return [["qdisc", "del", "dev", iface, "root"],
+            ["qdisc", "del", "dev", iface, "ingress"],
+            ["qdisc", "del", "dev", ifb_name(iface), "root"]]
+
+
+def run(cmd, stdin=None):
+    return subprocess.run(cmd, input=stdin, capture_output=True, text=True, timeout=30)
+
+
+def apply(iface, lines, runner=run):
+    """Replace iface's rules with lines (none: remove them); RuntimeError
+    with tc's message if the batch fails"""
+    for cmd in teardown(iface):
+        runner(["tc", *cmd])
+    if not lines:
+        runner(["ip", "link", "del", ifb_name(iface)])
+        return
+    ifb = ifb_name(iface)
+    runner(["ip", "link", "add", "name", ifb, "type", "ifb"])  # Fails harmlessly if present
+    result = runner(["ip", "link", "set", ifb, "up"])
+    if result.returncode == 0:
+        result = runner(["tc", "-batch", "-"], "\n".join(lines) + "\n")
+    if result.returncode != 0:
+        raise RuntimeError(f"{iface}: {(result.stderr or result.stdout).strip()}")
+
+
+def load_state(path=STATE_FILE):
+    """Interface -> {"lines": tc batch applied, "classes": {classid: MAC}}"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class Shaper:
+    """Keeps every radio's rules in step with the config and its stations
+
+    What was applied is kept in a state file, so a restarted daemon knows
+    its rules (and the stats reader which class is which client).
+    """
+
+    def __init__(self, config=CONFIG_FILE, state=STATE_FILE, runner=run):
+        self.config = config
+        self.state = state
+        self.runner = runner
+        self.applied = load_state(state)
+
+    def shape(self, iface, config, stations, force=False):
+        """Apply config (None: no shaping) to iface if its rules changed,
+        or regardless with force; True if anything was run"""
+        lines = render(config, iface, stations) if config else []
+        applied = self.applied.get(iface)
+        if not lines and applied is None:
+            return False  # Never shaped here; leave the interface alone
+        if not force and applied and applied["lines"] == lines:
+            return False
+        apply(iface, lines, self.runner)
+        if lines:
+            self.applied[iface] = {"lines": lines, "classes": {
+                f"1:{minor:x}": mac for minor, mac in shaped_clients(config, stations)}}
+        else:
+            del self.applied[iface]
+        _write_json(self.applied, self.state)
+        return True
+
+    def update(self, snapshot):
+        """Re-apply where the rendered rules changed; called once per tick
+
+        Rules missing from the snapshot's stats (hostapd re-created the
+        interface, say) are put back too.
+        """
+        try:
+            config = load(self.config)
+        except (OSError, ValueError) as e:
+            print(f"Warning: {self.config}: {e}", file=sys.stderr)
+            return
+        shaped = snapshot.get("qos")
+        for radio in snapshot.get("radios", []):
+            iface = radio["interface"]
+            if radio.get("state") != "ENABLED":
+                continue
+            stations = [s["mac"] for s in snapshot.get("stations", [])
+                        if s.get("interface", iface) == iface]
+            try:
+                self.shape(iface, config, stations,
+                           force=shaped is not None and iface not in shaped)
+            except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+                print(f"Warning: shaping {e}", file=sys.stderr)
+
+
+def _handle(value):
+    return f"{value >> 16:x}:{value & 0xffff:x}"
+
+
+def parse_tc_message(message):
+    """Kind, handle, parent and counters of one qdisc or class message"""
+    _, ifindex, handle, parent, _ = struct.unpack_from("BxxxiIII", message)
+    record = {"ifindex": ifindex, "handle": _handle(handle), "parent": _handle(parent),
+              "kind": None, "bytes": 0, "packets": 0, "qlen": 0, "backlog": 0,
+              "drops": 0, "overlimits": 0}
+    for kind, payload in _attrs(message[20:]):
+        if kind == TCA_KIND:
+            record["kind"] = payload.rstrip(b"\0").decode()
+        elif kind == TCA_STATS2:
+            for stat, value in _attrs(payload):
+                if stat == TCA_STATS_BASIC and len(value) >= 12:
+                    record["bytes"], record["packets"] = struct.unpack_from("QI", value)
+                elif stat == TCA_STATS_QUEUE and len(value) >= 20:
+                    (record["qlen"], record["backlog"], record["drops"], _,
+                     record["overlimits"]) = struct.unpack_from("IIIII", value)
+    return record
+
+
+class TcStats:
+    """Long-lived rtnetlink socket dumping qdisc and class counters"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.seq = 0
+
+    def close(self):
+        self.sock.close()
+
+    def _dump(self, msg_type, ifindex):
+        self.seq += 1
+        body = struct.pack("BxxxiIII", socket.AF_UNSPEC, ifindex, 0, 0, 0)
+        self.sock.send(struct.pack("IHHII", 16 + len(body), msg_type,
+                                   NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0) + body)
+        records = []
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, kind, _, seq, _ = struct.unpack_from("IHHII", data, offset)
+                if length < 16:
+                    return records
+                message = data[offset + 16:offset + length]
+                offset += (length + 3) & ~3
+                if seq != self.seq:
+                    continue
+                if kind == NLMSG_DONE:
+                    return records
+                if kind == NLMSG_ERROR:
+                    error = struct.unpack_from("i", message)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return records
+                record = parse_tc_message(message)
+                if record["ifindex"] == ifindex:  # Qdisc dumps cover every device
+                    records.append(record)
+
+    def device(self, dev):
+        """(qdiscs, classes) of one device"""
+        ifindex = socket.if_nametoindex(dev)
+        return self._dump(RTM_GETQDISC, ifindex), self._dump(RTM_GETTCLASS, ifindex)
+
+
+def class_stats(qdiscs, classes, names):
+    """Rows per HTB leaf class, labelled from names (classid -> MAC)
+
+    Bytes, packets and overlimits (times held back by a cap) come from
+    the class; its fq_codel leaf holds the queue, and the drops, which
+    add to those of the class. None if dev has no HTB tree of ours.
+    """
+    if not any(q["kind"] == "htb" and q["handle"] == "1:0" for q in qdiscs):
+        return None
+    leaves = {q["parent"]: q for q in qdiscs}
+    rows = []
+    for c in classes:
+        if c["kind"] != "htb" or c["handle"] == "1:1":
+            continue
+        leaf = leaves.get(c["handle"], {})
+        rows.append({
+            "class": c["handle"],
+            "mac": names.get(c["handle"]),
+            "bytes": c["bytes"],
+            "packets": c["packets"],
+            "drops": c["drops"] + leaf.get("drops", 0),
+            "overlimits": c["overlimits"],
+            "backlog": leaf.get("backlog", c["backlog"]),
+            "qlen": leaf.get("qlen", c["qlen"]),
+        })
+    return sorted(rows, key=lambda row: int(row["class"].split(":")[1], 16))
+
+
+def read_stats(tc, state):
+    """Interface -> {"down": rows, "up": rows} for each shaped interface
+
+    Interfaces whose rules are gone are left out.
+    """
+    stats = {}
+    for iface, applied in state.items():
+        names = applied.get("classes", {})
+        try:
+            down = class_stats(*tc.device(iface), names)
+            up = class_stats(*tc.device(ifb_name(iface)), names)
+        except OSError:
+            continue
+        if down is not None and up is not None:
+            stats[iface] = {"down": down, "up": up}
+    return stats
+
+
+def format_summary(stats):
+    """One line: clients shaped, drops and what is queued right now"""
+    rows = [row for iface in stats.values() for direction in ("down", "up")
+            for row in iface[direction]]
+    clients = len({row["mac"] for row in rows if row["mac"]})
+    drops = sum(row["drops"] for row in rows)
+    backlog = sum(row["backlog"] for row in rows)
+    return (f"{clients} client{'s' if clients != 1 else ''} shaped · "
+            f"{drops} dropped · {backlog / 1000:.1f} kB queued")
+
+
+def format_table(stats):
+    lines = [f"{'Interface':<10} {'Dir':<4} {'Client':<17}  {'Bytes':>12}  {'Drops':>7}  "
+             f"{'Overlim':>7}  {'Backlog':>8}  {'Qlen':>5}"]
+    for iface, directions in stats.items():
+        for direction in ("down", "up"):
+            for row in directions[direction]:
+                lines.append(f"{iface:<10} {direction:<4} {row['mac'] or '(others)':<17}  "
+                             f"{row['bytes']:>12}  {row['drops']:>7}  {row['overlimits']:>7}  "
+                             f"{row['backlog']:>8}  {row['qlen']:>5}")
+    return "\n".join(lines)
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    iface = option("--iface")
+    default = option("--default")
+    total = option("--total")
+    fairness = option("--fairness")
+    client_specs = []
+    while "--client" in args:
+        client_specs.append(option("--client"))
+    dry_run = "--dry-run" in args
+    args = [a for a in args if a != "--dry-run"]
+    command = args[0] if args else "show"
+    if command not in ("show", "set", "apply", "off"):
+        print(__doc__.strip().split("\n\n", 2)[2], file=sys.stderr)
+        return 1
+
+    try:
+        if command == "show":
+            config = load()
+            tc = TcStats()
+            try:
+                stats = read_stats(tc, load_state())
+            finally:
+                tc.close()
+            if "--json" in args:
+                print(json.dumps({"config": config.as_dict() if config else None,
+                                  "stats": stats}, indent=2))
+                return 0
+            if config is None:
+                print("QoS: off")
+                return 0
+            print(f"QoS: {config.fairness} fairness, total {format_rates(config.total)}, "
+                  f"default {format_rates(config.default)} Mbit/s (down:up, 0 = uncapped)")
+            for mac, rates in sorted(config.clients.items()):
+                print(f"  {mac}  {format_rates(rates)}")
+            if stats:
+                print(format_table(stats))
+            return 0
+
+        if command == "off":
+            config = None
+            if os.path.exists(CONFIG_FILE):
+                if not dry_run:
+                    os.remove(CONFIG_FILE)
+                print(f"{'Would remove' if dry_run else 'Removed'} {CONFIG_FILE}")
+        elif command == "set":
+            config = load() or QosConfig()
+            clients = dict(config.clients)
+            for spec in client_specs:
+                mac, _, rates = spec.partition("=")
+                if rates == "off":
+                    clients.pop(mac.lower(), None)
+                else:
+                    clients[mac] = parse_rates(rates)
+            config = QosConfig(parse_rates(default) if default else config.default, clients,
+                               parse_rates(total) if total else config.total,
+                               fairness or config.fairness)
+            if config != load():
+                if not dry_run:
+                    save(config)
+                print(f"{'Would save' if dry_run else 'Saved'} {CONFIG_FILE}")
+        else:
+            config = load()
+
+        # Apply now rather than on the status daemon's next tick
+        shaper = Shaper()
+        if iface:
+            ifaces = [iface]
+        elif config is None:
+            ifaces = list(shaper.applied)
+        else:
+            ifaces = [radio.interface for _, radio in hostapd_config.load_radios() if radio]
+        for iface in ifaces:
+            if dry_run and command != "apply":
+                continue
+            # Unreadable stations (hostapd not up yet): the daemon adds them later
+            reader = station_stats.StationReader(iface)
+            try:
+                stations = [s.mac for s in reader.stations()]
+            except (OSError, subprocess.SubprocessError):
+                stations = []
+            finally:
+                reader.close()
+            if dry_run:
+                if config:
+                    print("\n".join(render(config, iface, stations)))
+                continue
+            if shaper.shape(iface, config, stations, force=command == "apply"):
+                count = len(shaped_clients(config, stations)) if config else 0
+                print(f"{iface}: {count} clients shaped" if config else f"{iface}: shaping removed")
+    except (OSError, ValueError, RuntimeError, subprocess.SubprocessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
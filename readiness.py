@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Readiness probe
+Polls, backing off exponentially, until the AP is really back after an
+apply or restart: hostapd running, the Wi-Fi interface in AP mode, the
+bridge up with an address and the Wi-Fi interface enslaved to it (in
+routed mode, the Wi-Fi interface holding the AP address itself). Reports
+the time-to-ready, or which conditions never came true.
+
+Usage: ./readiness.py [--timeout SECONDS] [--iface wlan0] [--json]
+"""
+
+import fcntl
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import hostapd_config
+import station_stats
+from status_collector import BRIDGE, PROC, SYSFS_NET, read_sysfs, running_processes
+
+DEFAULT_TIMEOUT = 30.0
+INITIAL_DELAY = 0.05
+MAX_DELAY = 2.0
+NL80211_IFTYPE_AP = 3
+SIOCGIFADDR = 0x8915
+
+# Condition -> what is still missing when it times out
+CONDITIONS = {
+    "hostapd": "hostapd is not running",
+    "ap_mode": "{iface} is not in AP mode",
+    "bridge": "{bridge} is not up with an address",
+    "enslaved": "{iface} is not part of {bridge}",
+}
+
+
+class SystemState:
+    """Reads the readiness conditions from /proc, sysfs and nl80211
+
+    bridge=None is routed mode: the interface must have the address and
+    there is nothing to be enslaved to.
+    """
+
+    def __init__(self, iface="wlan0", bridge=BRIDGE, sysfs=SYSFS_NET, proc=PROC):
+        self.iface = iface
+        self.bridge = bridge
+        self.sysfs = sysfs
+        self.proc = proc
+        self.nl = None
+
+    def hostapd(self):
+        return "hostapd" in running_processes(self.proc)
+
+    def ap_mode(self):
+        try:
+            if self.nl is None:
+                self.nl = station_stats.Nl80211()
+            return self.nl.interface_type(self.iface) == NL80211_IFTYPE_AP
+        except OSError:
+            self.close()
+        result = subprocess.run(["iw", "dev", self.iface, "info"],
+                                capture_output=True, text=True, timeout=5)
+        return "type AP" in result.stdout
+
+    def bridge_up(self):
+        name = self.bridge or self.iface
+        if read_sysfs(os.path.join(self.sysfs, name, "operstate")) != "up":
+            return False
+        return self.has_address(name)
+
+    def enslaved(self):
+        return self.bridge is None or os.path.exists(os.path.join(self.sysfs, self.bridge, "brif", self.iface))
+
+    def has_address(self, name):
+        """Whether name has an IPv4 address (or a global IPv6 one)"""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            try:
+                fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack("256s", name.encode()[:15]))
+                return True
+            except OSError:
+                pass
+        try:
+            with open(os.path.join(self.proc, "net", "if_inet6")) as f:
+                # Fields: address, index, prefix length, scope (0 = global), flags, name
+                return any(fields[5] == name and fields[3] == "00"
+                           for fields in (line.split() for line in f) if len(fields) == 6)
+        except OSError:
+            return False
+
+    def check(self):
+        """Condition name -> bool, for one poll"""
+        probes = {"hostapd": self.hostapd, "ap_mode": self.ap_mode,
+                  "bridge": self.bridge_up, "enslaved": self.enslaved}
+        result = {}
+        for name, probe in probes.items():
+            try:
+                result[name] = bool(probe())
+            except (OSError, subprocess.SubprocessError):
+                result[name] = False
+        return result
+
+    def close(self):
+        if self.nl:
+            self.nl.close()
+            self.nl = None
+
+
+class Readiness:
+    """Outcome of wait_ready"""
+
+    def __init__(self, ready, elapsed, met, pending, attempts, iface="wlan0", bridge=BRIDGE):
+        self.ready = ready
+        self.elapsed = elapsed
+        self.met = met          # Condition -> seconds until it first held
+        self.pending = pending  # Conditions that did not hold at the end
+        self.attempts = attempts
+        self.iface = iface
+        self.bridge = bridge
+
+    def describe(self):
+        if self.ready:
+            return f"✓ AP ready in {self.elapsed:.1f}s"
+        missing = "; ".join(CONDITIONS[name].format(iface=self.iface, bridge=self.bridge)
+                            for name in self.pending)
+        return f"AP not ready after {self.elapsed:.1f}s: {missing}"
+
+    def as_dict(self):
+        return {"ready": self.ready, "elapsed": round(self.elapsed, 3),
+                "met": {k: round(v, 3) for k, v in self.met.items()},
+                "pending": self.pending, "attempts": self.attempts}
+
+
+def wait_ready(state, timeout=DEFAULT_TIMEOUT, initial_delay=INITIAL_DELAY,
+               max_delay=MAX_DELAY, clock=time.monotonic, sleep=time.sleep, started=None):
+    """Poll state.check() until every condition holds at once or timeout
+
+    The delay between polls starts at initial_delay and doubles up to
+    max_delay, so a quick reload is measured finely while a slow boot
+    does not spin. Times are measured from started (a clock() reading,
+    e.g. when the restart began), or from now.
+    """
+    start = clock() if started is None else started
+    delay = initial_delay
+    met = {}
+    attempts = 0
+    while True:
+        attempts += 1
+        status = state.check()
+        elapsed = clock() - start
+        for name, ok in status.items():
+            if ok:
+                met.setdefault(name, elapsed)
+        pending = [name for name in CONDITIONS if not status.get(name)]
+        remaining = timeout - elapsed
+        if not pending or remaining <= 0:
+            iface = getattr(state, "iface", "wlan0")
+            return Readiness(not pending, elapsed, met, pending, attempts,
+                             iface, getattr(state, "bridge", BRIDGE) or iface)
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def configured_bridge(path=hostapd_config.HOSTAPD_CONF):
+    """The bridge hostapd.conf names, None in routed mode (br0 if unreadable)"""
+    try:
+        config = hostapd_config.load(path)
+    except PermissionError:
+        return BRIDGE
+    return config.bridge if config else BRIDGE
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    timeout = float(option("--timeout", DEFAULT_TIMEOUT))
+    iface = option("--iface")
+    if iface is None:
+        try:
+            iface = hostapd_config.load().interface
+        except PermissionError:
+            iface = "wlan0"
+    state = SystemState(iface, configured_bridge())
+    try:
+        result = wait_ready(state, timeout)
+    finally:
+        state.close()
+    if "--json" in args:
+        print(json.dumps(result.as_dict(), indent=2))
+    else:
+        print(result.describe())
+    return 0 if result.ready else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
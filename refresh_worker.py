@@ -0,0 +1,134 @@
+"""
+Pi WiFi Extender - Background status refresh
+One worker thread owns status collection for the GUI. Refresh requests
+that arrive while one is queued or running collapse into a single extra
+run after it, the probes of a run execute concurrently, a probe still
+running from an earlier run is waited on rather than started twice, and
+only the newest result is delivered. Periodic refreshes back off while
+the window is hidden.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_INTERVAL = 30.0
+MAX_HIDDEN_INTERVAL = 300.0
+PROBE_TIMEOUT = 5.0
+
+
+class RefreshWorker:
+    """Runs a set of named probes on request and on a schedule
+
+    probes maps a name to a callable; each run delivers a dict of name ->
+    value (None for a probe that failed or overran probe_timeout).
+    deliver(result) is handed to post(), which the GUI sets to
+    GLib.idle_add so results are applied on the main loop.
+    """
+
+    def __init__(self, probes, deliver, post=None, interval=DEFAULT_INTERVAL,
+                 max_hidden_interval=MAX_HIDDEN_INTERVAL, probe_timeout=PROBE_TIMEOUT):
+        self.probes = dict(probes)
+        self.deliver = deliver
+        self.post = post or (lambda fn, *args: fn(*args))
+        self.base_interval = interval
+        self.interval = interval
+        self.max_hidden_interval = max_hidden_interval
+        self.probe_timeout = probe_timeout
+        self.visible = True
+        self.cond = threading.Condition()
+        self.requested = 0   # Generation of the newest request
+        self.completed = 0   # Generation of the newest result handed over
+        self.delivered = 0   # Generation of the newest result applied
+        self.runs = 0
+        self.stopped = False
+        self.futures = {}    # name -> newest future of each probe
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.probes)),
+                                       thread_name_prefix="probe")
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        # The loop shuts the pool down itself once it sees stopped, so it
+        # never submits to a pool that is already shut down
+        if not self.thread.is_alive():
+            self.pool.shutdown(wait=False)
+
+    def request(self):
+        """Ask for a refresh; cheap and safe from any thread"""
+        with self.cond:
+            self.requested += 1
+            self.cond.notify()
+
+    def set_interval(self, interval):
+        """Seconds between periodic refreshes, or None for on-request only"""
+        with self.cond:
+            self.base_interval = self.interval = interval
+            self.cond.notify()
+
+    def set_visible(self, visible):
+        """Hidden windows refresh less and less often; showing refreshes now"""
+        with self.cond:
+            if visible == self.visible:
+                return
+            self.visible = visible
+            self.interval = self.base_interval
+            if visible:
+                self.requested += 1
+            self.cond.notify()
+
+    def _loop(self):
+        try:
+            while True:
+                with self.cond:
+                    deadline = None if self.interval is None else time.monotonic() + self.interval
+                    while not self.stopped and self.requested == self.completed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.requested += 1  # Periodic refresh
+                            if not self.visible and self.interval is not None:
+                                self.interval = min(self.interval * 2, self.max_hidden_interval)
+                            break
+                        self.cond.wait(remaining)
+                    if self.stopped:
+                        return
+                    generation = self.requested
+                result = self._run_probes()
+                with self.cond:
+                    if self.stopped:
+                        return
+                    # Requests made during the run leave requested ahead,
+                    # so this result goes out and one more run follows
+                    self.completed = generation
+                self.post(self._deliver, generation, result)
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_probes(self):
+        self.runs += 1
+        for name, probe in self.probes.items():
+            future = self.futures.get(name)
+            if future is None or future.done():
+                self.futures[name] = self.pool.submit(probe)
+        wait(self.futures.values(), timeout=self.probe_timeout)
+        result = {}
+        for name, future in self.futures.items():
+            try:
+                result[name] = future.result(timeout=0)
+            except Exception:  # Failed or still running
+                future.cancel()  # Only stops it if it never started
+                result[name] = None
+        return result
+
+    def _deliver(self, generation, result):
+        """Apply a result unless a newer one was already applied"""
+        if generation > self.delivered:
+            self.delivered = generation
+            self.deliver(result)
+        return False  # One-shot when used with GLib.idle_add
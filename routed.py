@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Routed (NAT) mode
+For uplinks that accept only one MAC address per port, where bridging
+clients onto eth0 fails: the AP gets a subnet of its own, served by
+dnsmasq (DHCP and DNS), and is masqueraded out of the uplink by nftables.
+Forwarded connections are added to a flowtable once established, so
+their packets skip the forward chain and most of the IP stack and routed
+throughput stays close to bridged. A oneshot service puts the AP address
+and ruleset in place after hostapd starts; every file is ours, so
+reverting is removing them.
+
+Usage: ./routed.py show
+       ./routed.py mode
+       sudo ./routed.py write [--iface wlan0] [--uplink eth0] [--address 192.168.50.1/24]
+                              [--dry-run]
+       sudo ./routed.py remove [--dry-run]
+write and remove print the files they change (nothing if none); write
+keeps the current address unless --address is given. mode prints
+"routed" or "bridge".
+"""
+
+import ipaddress
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+import uplink
+
+SERVICE_NAME = "wifi-extender-routed"
+SYSTEMD_DIR = "/etc/systemd/system"
+SERVICE_FILE = os.path.join(SYSTEMD_DIR, f"{SERVICE_NAME}.service")
+NFT_FILE = "/etc/wifi-extender/routed.nft"
+DNSMASQ_FILE = "/etc/dnsmasq.d/wifi-extender.conf"
+NFT_TABLE = "wifi_extender"
+DEFAULT_ADDRESS = "192.168.50.1/24"
+LEASE_TIME = "12h"
+
+
+class RoutedConfig:
+    """AP interface, uplink and the AP's address/prefix; ValueError if unusable"""
+
+    def __init__(self, iface="wlan0", uplink="eth0", address=DEFAULT_ADDRESS):
+        for name in (iface, uplink):
+            if not re.fullmatch(r"[a-zA-Z0-9_.-]{1,15}", name):
+                raise ValueError(f"Bad interface name {name!r}")
+        if iface == uplink:
+            raise ValueError("The AP and the uplink must be different interfaces")
+        self.iface = iface
+        self.uplink = uplink
+        self.address = ipaddress.ip_interface(address)
+        network = self.address.network
+        if self.address.version != 4 or not 16 <= network.prefixlen <= 29:
+            raise ValueError(f"{address}: need an IPv4 address with a /16 to /29 prefix")
+        if self.address.ip in (network.network_address, network.broadcast_address):
+            raise ValueError(f"{address}: the AP needs a host address, not {self.address.ip}")
+        if not network.is_private:
+            raise ValueError(f"{address}: not a private subnet")
+
+    @property
+    def network(self):
+        return self.address.network
+
+    def dhcp_range(self):
+        """First and last address handed out: the subnet less a few low ones
+        (dnsmasq itself never leases the AP's own address)"""
+        network = self.network
+        skip = 10 if network.num_addresses >= 64 else 1
+        first, last = network.network_address + skip, network.broadcast_address - 1
+        if self.address.ip == first:
+            first += 1
+        elif self.address.ip == last:
+            last -= 1
+        return first, last
+
+    def __eq__(self, other):
+        return (isinstance(other, RoutedConfig) and
+                (self.iface, self.uplink, self.address) == (other.iface, other.uplink, other.address))
+
+
+def render_nft(config):
+    """nftables ruleset: flowtable fast path, forwarding policy and masquerade"""
+    return f"""#!/usr/sbin/nft -f
+# Pi WiFi Extender routed mode - written by routed.py
+# Declaring then deleting the table makes reloading this file replace it.
+table inet {NFT_TABLE}
+delete table inet {NFT_TABLE}
+
+table inet {NFT_TABLE} {{
+    # Software fast path: established flows are forwarded from the
+    # ingress hook, skipping the forward chain and routing lookups
+    flowtable fastpath {{
+        hook ingress priority 0
+        devices = {{ "{config.iface}", "{config.uplink}" }}
+    }}
+
+    chain forward {{
+        type filter hook forward priority filter; policy accept;
+        meta l4proto {{ tcp, udp }} ct state established flow add @fastpath
+        ct state established,related accept
+        ct state invalid drop
+        iifname "{config.iface}" oifname "{config.uplink}" accept
+        iifname "{config.uplink}" oifname "{config.iface}" drop
+    }}
+
+    chain postrouting {{
+        type nat hook postrouting priority srcnat; policy accept;
+        ip saddr {config.network} oifname "{config.uplink}" masquerade
+    }}
+}}
+"""
+
+
+def render_dnsmasq(config):
+    """dnsmasq config: DHCP and a DNS forwarder on the AP interface only"""
+    first, last = config.dhcp_range()
+    return f"""# Pi WiFi Extender routed mode - written by routed.py
+interface={config.iface}
+bind-dynamic
+dhcp-range={first},{last},{config.network.netmask},{LEASE_TIME}
+dhcp-option=option:router,{config.address.ip}
+dhcp-option=option:dns-server,{config.address.ip}
+dhcp-authoritative
+"""
+
+
+def render_service(config):
+    """Oneshot unit bringing up the AP address, forwarding and the ruleset
+
+    Its Environment line is also where current() reads the settings back.
+    """
+    return f"""[Unit]
+Description=Pi WiFi Extender - routed mode (AP address and NAT)
+After=hostapd.service
+PartOf=hostapd.service
+Before=dnsmasq.service
+
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+Environment=AP_IFACE={config.iface} UPLINK={config.uplink} AP_ADDRESS={config.address}
+ExecStart=/sbin/sysctl -q -w net.ipv4.ip_forward=1
+ExecStart=/sbin/ip address replace ${{AP_ADDRESS}} dev ${{AP_IFACE}}
+ExecStart=/usr/sbin/nft -f {NFT_FILE}
+ExecStop=-/usr/sbin/nft delete table inet {NFT_TABLE}
+ExecStop=-/sbin/ip address del ${{AP_ADDRESS}} dev ${{AP_IFACE}}
+
+[Install]
+WantedBy=multi-user.target hostapd.service
+"""
+
+
+def files(config, service=SERVICE_FILE, nft=NFT_FILE, dnsmasq=DNSMASQ_FILE):
+    """Path -> text of every file routed mode needs"""
+    return {nft: render_nft(config), dnsmasq: render_dnsmasq(config),
+            service: render_service(config)}
+
+
+def current(service=SERVICE_FILE):
+    """RoutedConfig of the installed service, or None in bridge mode"""
+    try:
+        with open(service) as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    env = {}
+    for line in text.splitlines():
+        if line.startswith("Environment="):
+            env.update(item.split("=", 1) for item in shlex.split(line[len("Environment="):])
+                       if "=" in item)
+    try:
+        return RoutedConfig(env.get("AP_IFACE", "wlan0"), env.get("UPLINK", "eth0"),
+                            env.get("AP_ADDRESS", DEFAULT_ADDRESS))
+    except ValueError:
+        return None
+
+
+def mode(service=SERVICE_FILE):
+    return "routed" if os.path.exists(service) else "bridge"
+
+
+def check_uplink(config, proc=uplink.PROC):
+    """ValueError if the uplink's default gateway lies inside the AP subnet"""
+    gateway = uplink.default_gateway(config.uplink, proc)
+    if gateway and ipaddress.ip_address(gateway) in config.network:
+        raise ValueError(f"The uplink's gateway {gateway} is inside {config.network}; "
+                         f"pick another --address")
+
+
+def write(config, dry_run=False, service=SERVICE_FILE, nft=NFT_FILE, dnsmasq=DNSMASQ_FILE):
+    """Write the files that differ from config; returns their paths"""
+    changed = []
+    for path, text in files(config, service, nft, dnsmasq).items():
+        try:
+            with open(path) as f:
+                if f.read() == text:
+                    continue
+        except FileNotFoundError:
+            pass
+        changed.append(path)
+        if dry_run:
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    return changed
+
+
+def remove(dry_run=False, service=SERVICE_FILE, nft=NFT_FILE, dnsmasq=DNSMASQ_FILE,
+           stop=True):
+    """Stop the service (dropping the ruleset and AP address) and delete
+    every routed-mode file; returns the paths removed"""
+    present = [path for path in (service, nft, dnsmasq) if os.path.exists(path)]
+    if dry_run or not present:
+        return present
+    if stop and service in present:
+        subprocess.run(["systemctl", "disable", "--now", f"{SERVICE_NAME}.service"],
+                       capture_output=True, timeout=30)
+    for path in present:
+        os.remove(path)
+    if stop and service in present:
+        subprocess.run(["systemctl", "daemon-reload"], capture_output=True, timeout=30)
+    return present
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    iface = option("--iface", "wlan0")
+    uplink_iface = option("--uplink", "eth0")
+    address = option("--address")
+    dry_run = "--dry-run" in args
+    args = [a for a in args if a != "--dry-run"]
+    if not args or args[0] not in ("show", "mode", "write", "remove"):
+        print(__doc__.strip().split("\n\n", 1)[1], file=sys.stderr)
+        return 1
+    try:
+        if args[0] == "mode":
+            print(mode())
+        elif args[0] == "show":
+            config = current()
+            if config is None:
+                print("mode: bridge")
+            else:
+                first, last = config.dhcp_range()
+                print(f"mode: routed\nAP: {config.iface} {config.address}\n"
+                      f"uplink: {config.uplink} (NAT)\nDHCP: {first} - {last}")
+        elif args[0] == "write":
+            installed = current()
+            if address is None:  # Keep the subnet already in use
+                address = str(installed.address) if installed else DEFAULT_ADDRESS
+            config = RoutedConfig(iface, uplink_iface, address)
+            check_uplink(config)
+            for path in write(config, dry_run):
+                print(path)
+        else:
+            for path in remove(dry_run):
+                print(path)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,11 +3,24 @@
 
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
+from gi.repository import GLib, Gtk
 import subprocess
 import os
+import sys
+import threading
 
-HOSTAPD_CONF = "/etc/hostapd/hostapd.conf"
+import hostapd_config
+import live_apply
+import privileged_helper
+import qos
+import routed
+import tuning
+
+CHANNELS = ["1", "6", "11", "auto"]
+COUNTRIES = ["IE", "GB", "US", "DE", "FR"]
+LIVE_APPLY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "live_apply.py")
+SETUP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "setup.sh")
+QOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qos.py")
 
 class SettingsWindow(Gtk.Window):
     def __init__(self):
@@ -49,7 +62,7 @@ class SettingsWindow(Gtk.Window):
         # Channel
         grid.attach(Gtk.Label(label="Channel:", xalign=1), 0, 2, 1, 1)
         self.channel = Gtk.ComboBoxText()
-        for ch in ["1", "6", "11"]:
+        for ch in CHANNELS:
             self.channel.append_text(ch)
         self.channel.set_active(1)
         grid.attach(self.channel, 1, 2, 1, 1)
@@ -57,11 +70,45 @@ class SettingsWindow(Gtk.Window):
         # Country
         grid.attach(Gtk.Label(label="Country:", xalign=1), 0, 3, 1, 1)
         self.country = Gtk.ComboBoxText()
-        for c in ["IE", "GB", "US", "DE", "FR"]:
+        for c in COUNTRIES:
             self.country.append_text(c)
         self.country.set_active(0)
         grid.attach(self.country, 1, 3, 1, 1)
 
+        # Tuning profile
+        grid.attach(Gtk.Label(label="Tuning:", xalign=1), 0, 4, 1, 1)
+        self.profile = Gtk.ComboBoxText()
+        for name in tuning.PROFILES:
+            self.profile.append(name, name.replace("-", " ").capitalize())
+        self.profile.set_active_id(tuning.current_profile())
+        grid.attach(self.profile, 1, 4, 1, 1)
+
+        # Network mode
+        grid.attach(Gtk.Label(label="Mode:", xalign=1), 0, 5, 1, 1)
+        self.mode = Gtk.ComboBoxText()
+        self.mode.append("bridge", "Bridged")
+        self.mode.append("routed", "Routed (NAT)")
+        self.mode.set_active_id(routed.mode())
+        grid.attach(self.mode, 1, 5, 1, 1)
+
+        # Per-client caps with fair sharing (0: no cap)
+        grid.attach(Gtk.Label(label="Client cap:", xalign=1), 0, 6, 1, 1)
+        qos_box = Gtk.Box(spacing=5)
+        self.qos_on = Gtk.CheckButton()
+        self.qos_on.set_tooltip_text("Share the radio fairly between clients")
+        qos_box.pack_start(self.qos_on, False, False, 0)
+        self.qos_down = Gtk.SpinButton.new_with_range(0, qos.LINE_RATE, 1)
+        self.qos_up = Gtk.SpinButton.new_with_range(0, qos.LINE_RATE, 1)
+        for spin, arrow in ((self.qos_down, "↓"), (self.qos_up, "↑ Mbit/s")):
+            qos_box.pack_start(spin, False, False, 0)
+            qos_box.pack_start(Gtk.Label(label=arrow), False, False, 0)
+        config = qos.load()
+        self.qos_on.set_active(config is not None)
+        if config:
+            self.qos_down.set_value(config.default[0] or 0)
+            self.qos_up.set_value(config.default[1] or 0)
+        grid.attach(qos_box, 1, 6, 1, 1)
+
         # Status
         self.status = Gtk.Label()
         self.status.set_margin_top(10)
@@ -76,37 +123,34 @@ class SettingsWindow(Gtk.Window):
         restart_btn.connect("clicked", self.on_restart)
         btn_box.pack_start(restart_btn, True, True, 0)
 
-        save_btn = Gtk.Button(label="💾 Save & Reboot")
+        save_btn = Gtk.Button(label="💾 Save & Apply")
         save_btn.connect("clicked", self.on_save)
         btn_box.pack_start(save_btn, True, True, 0)
+        self.buttons = (restart_btn, save_btn)
 
+        self.hw_mode = "g"
+        # One connection to the privileged helper, authorised once
+        self.helper = privileged_helper.HelperClient()
+        self.connect("destroy", lambda w: self.helper.close())
         self.load_config()
         self.update_status()
 
     def load_config(self):
         """Load current settings from hostapd.conf"""
-        if not os.path.exists(HOSTAPD_CONF):
-            self.status.set_markup("<span color='red'>Not configured</span>")
-            return
         try:
-            with open(HOSTAPD_CONF) as f:
-                for line in f:
-                    if line.startswith("ssid="):
-                        self.ssid.set_text(line.strip().split("=", 1)[1])
-                    elif line.startswith("wpa_passphrase="):
-                        self.password.set_text(line.strip().split("=", 1)[1])
-                    elif line.startswith("channel="):
-                        ch = line.strip().split("=", 1)[1]
-                        for i, t in enumerate(["1", "6", "11"]):
-                            if ch == t:
-                                self.channel.set_active(i)
-                    elif line.startswith("country_code="):
-                        cc = line.strip().split("=", 1)[1]
-                        for i, t in enumerate(["IE", "GB", "US", "DE", "FR"]):
-                            if cc == t:
-                                self.country.set_active(i)
+            config = hostapd_config.load()
         except PermissionError:
-            pass
+            return
+        if not config:
+            self.status.set_markup("<span color='red'>Not configured</span>")
+            return
+        self.ssid.set_text(config.ssid)
+        self.password.set_text(config.passphrase)
+        self.hw_mode = config.band
+        if str(config.channel) in CHANNELS:
+            self.channel.set_active(CHANNELS.index(str(config.channel)))
+        if config.country in COUNTRIES:
+            self.country.set_active(COUNTRIES.index(config.country))
 
     def update_status(self):
         """Update status display"""
@@ -116,17 +160,70 @@ class SettingsWindow(Gtk.Window):
         else:
             self.status.set_markup("<span color='red'>● Stopped</span>")
 
+    def run_helper(self, message, work, on_done):
+        """Run work() off the main loop, then on_done(result) back on it
+
+        The helper calls and their pkexec fallbacks can take seconds; the
+        buttons stay insensitive meanwhile, so only one call at a time uses
+        the helper connection. Any exception from work (a HelperError, pkexec
+        missing, a malformed reply) is shown instead and the buttons return.
+        """
+        for button in self.buttons:
+            button.set_sensitive(False)
+        self.status.set_text(message)
+
+        def run():
+            result, error = None, "Failed"
+            try:
+                result, error = work(), None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            finally:
+                GLib.idle_add(finish, result, error)
+
+        def finish(result, error):
+            for button in self.buttons:
+                button.set_sensitive(True)
+            if error:
+                self.status.set_text("")
+                self.show_error(error)
+            else:
+                on_done(result)
+            return False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def elevated(cmd, failure):
+        """Run cmd through pkexec, raising HelperError with its output on failure"""
+        result = subprocess.run(["pkexec"] + cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise privileged_helper.HelperError(
+                result.stderr.strip() or result.stdout.strip() or failure, result.returncode)
+        return result.stdout.strip()
+
     def on_restart(self, btn):
         """Restart hostapd service"""
-        subprocess.run(["pkexec", "systemctl", "restart", "hostapd"])
-        self.update_status()
+        def work():
+            if self.helper.available():
+                return self.helper.call("restart_ap")
+            self.elevated(["systemctl", "restart", "hostapd"], "Failed to restart hostapd")
+
+        def done(ready):
+            if ready and not ready["ready"]:
+                self.status.set_text("AP not ready: waiting for " + ", ".join(ready["pending"]))
+            else:
+                self.update_status()
+
+        self.run_helper("Restarting AP...", work, done)
 
     def on_save(self, btn):
-        """Save config and reboot"""
+        """Save config and apply it live, rebooting only if needed"""
         ssid = self.ssid.get_text().strip()
         password = self.password.get_text()
         channel = self.channel.get_active_text()
         country = self.country.get_active_text()
+        profile = self.profile.get_active_id()
 
         if not ssid:
             self.show_error("Enter a network name")
@@ -135,32 +232,69 @@ class SettingsWindow(Gtk.Window):
             self.show_error("Password must be at least 8 characters")
             return
 
-        # Write new config
-        config = f"""interface=wlan0
-bridge=br0
-driver=nl80211
-ssid={ssid}
-hw_mode=g
-channel={channel}
-country_code={country}
-wpa=2
-wpa_passphrase={password}
-wpa_key_mgmt=WPA-PSK
-rsn_pairwise=CCMP
-wmm_enabled=1
-ieee80211n=1
-"""
-        # Save via pkexec
-        try:
-            proc = subprocess.Popen(
-                ["pkexec", "tee", HOSTAPD_CONF],
-                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
-            )
-            proc.communicate(config.encode())
-            subprocess.run(["pkexec", "chmod", "600", HOSTAPD_CONF])
-            subprocess.run(["pkexec", "reboot"])
-        except Exception as e:
-            self.show_error(str(e))
+        # Switching between bridged and routed is a setup.sh run and a reboot
+        mode = self.mode.get_active_id()
+        qos_setting = self.qos_setting()
+        if mode != routed.mode():
+            def setup():
+                self.setup(mode, ssid, password, channel, country, profile, qos_setting)
+                return f"Switched to {mode} mode - reboot to activate"
+            self.run_helper(f"Switching to {mode} mode...", setup, self.status.set_text)
+            return
+
+        def apply():
+            self.apply_qos(qos_setting)
+            return self.apply_config(ssid, password, channel, country, profile)
+        self.run_helper("Applying settings...", apply, self.status.set_text)
+
+    def apply_config(self, ssid, password, channel, country, profile):
+        """Apply the settings and return a status line; runs off the main loop"""
+        # One elevated call: push only what changed via hostapd's control
+        # socket, or write the config and reboot if the bridge needs setting up
+        if not self.helper.available():
+            return self.elevated(
+                [sys.executable, LIVE_APPLY, "--reboot-if-needed"]
+                + (["--profile", profile] if profile else [])
+                + [ssid, password, channel, country, self.hw_mode],
+                "Failed to apply settings")
+        result = self.helper.call(
+            "apply_config", ssid=ssid, password=password, channel=channel,
+            country=country, band=self.hw_mode, reboot_if_needed=True,
+            profile=profile)
+        text = live_apply.describe(result["action"], result["changed"], result["downtime"])
+        if result.get("ready"):
+            text += f"\nAP ready in {result['ready']['elapsed']:.1f}s" \
+                if result["ready"]["ready"] else "\nAP not ready yet"
+        return text
+
+    def qos_setting(self):
+        """setup.sh's --qos value for the widgets: "DOWN:UP" or "off" """
+        if not self.qos_on.get_active():
+            return "off"
+        return qos.format_rates((self.qos_down.get_value() or None,
+                                 self.qos_up.get_value() or None))
+
+    def apply_qos(self, setting):
+        """Change the per-client caps if edited; runs off the main loop"""
+        installed = qos.load()
+        if setting == (qos.format_rates(installed.default) if installed else "off"):
+            return
+        if self.helper.available():
+            self.helper.call("set_qos", default=setting)
+        else:
+            self.elevated([sys.executable, QOS] + privileged_helper.qos_args(setting),
+                          "Failed to set client caps")
+
+    def setup(self, mode, ssid, password, channel, country, profile, qos_setting):
+        """Re-run setup in the new mode; the reboot is left to the user"""
+        if self.helper.available():
+            self.helper.call("setup", ssid=ssid, password=password, channel=channel,
+                             country=country, band=self.hw_mode, profile=profile,
+                             mode=mode, qos=qos_setting)
+        else:
+            self.elevated([SETUP] + (["--profile", profile] if profile else [])
+                          + ["--mode", mode, "--qos", qos_setting,
+                             ssid, password, channel, country, self.hw_mode], "Setup failed")
 
     def show_error(self, msg):
         dialog = Gtk.MessageDialog(
@@ -1,17 +1,67 @@
 #!/bin/bash
 # Pi WiFi Extender - Setup Script
-# Usage: sudo ./setup.sh "MySSID" "MyPassword" [channel] [country] [band]
+# Usage: sudo ./setup.sh [--dry-run] [--profile PROFILE] [--radio IFACE[:BAND[:CHANNEL]]]...
+#                        [--mode bridge|routed] [--address CIDR]
+#                        [--qos DOWN:UP|off] [--qos-client MAC=DOWN:UP]...
+#                        "MySSID" "MyPassword" [channel|auto] [country] [band]
 #        sudo ./setup.sh --revert
+#
+# Re-runs are incremental: packages, bridge connections and files already
+# in the wanted state are left alone, and only affected services restart.
+# --dry-run prints that plan without changing anything. --profile picks a
+# tuning profile (balanced, low-latency, max-throughput; see tuning.py);
+# without it the current profile is kept. Each --radio adds a radio serving
+# the same SSID on its own band (default a) and channel, bridged into br0;
+# without any the extra radios already set up are kept, --radio none
+# removes them. --mode routed gives the AP its own subnet (--address, default
+# 192.168.50.1/24) with DHCP from dnsmasq and NAT onto eth0, for uplinks
+# that allow one MAC address per port (see routed.py); without --mode the
+# current mode is kept. --qos shares the radio fairly between clients and
+# caps each at DOWN:UP Mbit/s (0 for no cap), --qos-client caps one client
+# on its own and --qos off removes shaping (see qos.py); without them the
+# current shaping is kept.
 
 set -e
 
 BACKUP_DIR="/var/lib/wifi-extender-backup"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Colors
 RED='\033[0;31m'
 GREEN='\033[0;32m'
 NC='\033[0m'
 
+REBOOT_FLAG="/run/wifi-extender/reboot-required"
+
+# Options may appear anywhere; the rest are positional
+DRY_RUN=false
+PROFILE=""
+MODE=""
+AP_ADDRESS=""
+QOS=""
+QOS_CLIENTS=()
+RADIOS=()
+RADIOS_GIVEN=false
+ARGS=()
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --dry-run) DRY_RUN=true ;;
+        --profile) PROFILE="$2"; shift ;;
+        --radio) RADIOS_GIVEN=true; [[ "$2" != "none" ]] && RADIOS+=("$2"); shift ;;
+        --mode) MODE="$2"; shift ;;
+        --address) AP_ADDRESS="$2"; shift ;;
+        --qos) QOS="$2"; shift ;;
+        --qos-client) QOS_CLIENTS+=("$2"); shift ;;
+        *) ARGS+=("$1") ;;
+    esac
+    shift
+done
+set -- "${ARGS[@]}"
+
+# Per-stage timing events (see stages.sh); dry runs are not recorded
+source "$SCRIPT_DIR/stages.sh"
+$DRY_RUN && STAGE_HISTORY=""
+
 # Check root
 if [[ $EUID -ne 0 ]]; then
     echo -e "${RED}Run as root: sudo $0 \"SSID\" \"Password\"${NC}"
@@ -26,17 +76,40 @@ if [[ "$1" == "--revert" ]]; then
     fi
     
     echo "Reverting to backup..."
+    stages_begin revert
     
+    stage services
+    # Tuning first: it restores power save, queue and bridge defaults
+    python3 "$SCRIPT_DIR/tuning.py" revert --no-restart 2>/dev/null || true
+    python3 "$SCRIPT_DIR/qos.py" off 2>/dev/null || true
     systemctl stop hostapd 2>/dev/null || true
     systemctl disable hostapd 2>/dev/null || true
+    # Extra radios: their hostapd@ instances and configs
+    python3 "$SCRIPT_DIR/hostapd_config.py" radios --extra 2>/dev/null | \
+        while read -r R_IFACE _ _ R_CONF; do
+            systemctl disable --now "hostapd@$R_IFACE" 2>/dev/null || true
+            rm -f "$R_CONF"
+        done
+    python3 "$SCRIPT_DIR/channel_scan.py" --remove-timer 2>/dev/null || true
+    python3 "$SCRIPT_DIR/status_collector.py" --remove-service 2>/dev/null || true
+    # Routed mode: its service drops the NAT table and AP address on stop
+    python3 "$SCRIPT_DIR/routed.py" remove 2>/dev/null || true
+    if [[ -f "$BACKUP_DIR/dnsmasq-installed" ]]; then
+        systemctl disable --now dnsmasq 2>/dev/null || true
+        rm -f "$BACKUP_DIR/dnsmasq-installed"
+    else
+        systemctl try-restart dnsmasq 2>/dev/null || true
+    fi
     
     # Restore files
+    stage restore
     [[ -f "$BACKUP_DIR/dhcpcd.conf" ]] && cp "$BACKUP_DIR/dhcpcd.conf" /etc/dhcpcd.conf
     [[ -f "$BACKUP_DIR/hostapd.conf" ]] && cp "$BACKUP_DIR/hostapd.conf" /etc/hostapd/ || rm -f /etc/hostapd/hostapd.conf
     [[ -f "$BACKUP_DIR/hostapd-default" ]] && cp "$BACKUP_DIR/hostapd-default" /etc/default/hostapd
     rm -f /etc/network/interfaces.d/br0
     
     # NetworkManager cleanup
+    stage network
     if systemctl is-active --quiet NetworkManager; then
         rm -f /etc/NetworkManager/conf.d/10-hostapd.conf
         nmcli connection delete bridge-slave-eth0 2>/dev/null || true
@@ -45,8 +118,10 @@ if [[ "$1" == "--revert" ]]; then
     fi
     
     # Remove bridge
+    stage bridge
     ip link set br0 down 2>/dev/null || true
     ip link delete br0 type bridge 2>/dev/null || true
+    stages_end
     
     echo -e "${GREEN}✓ Reverted to backup${NC}"
     echo "Reboot to complete: sudo reboot"
@@ -59,6 +134,13 @@ WIFI_CHANNEL="${3:-6}"
 COUNTRY_CODE="${4:-IE}"
 WIFI_BAND="${5:-g}"  # g = 2.4GHz, a = 5GHz
 
+# Auto channel is picked from a neighbour scan once input is validated
+AUTO_CHANNEL=false
+if [[ "$WIFI_CHANNEL" == "auto" ]]; then
+    AUTO_CHANNEL=true
+    WIFI_CHANNEL=""
+fi
+
 # Validate band and adjust settings
 if [[ "$WIFI_BAND" == "a" ]]; then
     HW_MODE="a"
@@ -74,37 +156,167 @@ else
     fi
 fi
 
-# Detect WiFi interface
-WIFI_IFACE=$(iw dev 2>/dev/null | awk '$1=="Interface"{print $2; exit}')
+if [[ -n "$PROFILE" && ! "$PROFILE" =~ ^(balanced|low-latency|max-throughput)$ ]]; then
+    echo -e "${RED}Unknown profile: $PROFILE (balanced, low-latency or max-throughput)${NC}"
+    exit 1
+fi
+
+# Network mode: the installed one unless --mode picks another
+CURRENT_MODE=$(python3 "$SCRIPT_DIR/routed.py" mode 2>/dev/null || echo bridge)
+MODE=${MODE:-$CURRENT_MODE}
+if [[ ! "$MODE" =~ ^(bridge|routed)$ ]]; then
+    echo -e "${RED}Unknown mode: $MODE (bridge or routed)${NC}"
+    exit 1
+fi
+if [[ "$MODE" == "routed" ]]; then
+    # Extra radios are bridged into br0, which routed mode does without
+    if [[ ${#RADIOS[@]} -gt 0 ]]; then
+        echo -e "${RED}--radio needs bridge mode${NC}"
+        exit 1
+    fi
+    RADIOS_GIVEN=true
+fi
+
+RATES='[0-9]*\.?[0-9]*:[0-9]*\.?[0-9]*'
+if [[ -n "$QOS" && "$QOS" != "off" && ! "$QOS" =~ ^$RATES$ ]]; then
+    echo -e "${RED}Bad --qos $QOS (expected DOWN:UP in Mbit/s, or off)${NC}"
+    exit 1
+fi
+for spec in "${QOS_CLIENTS[@]}"; do
+    if [[ "$QOS" == "off" || ! "$spec" =~ ^([0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}=($RATES|off)$ ]]; then
+        echo -e "${RED}Bad --qos-client $spec (expected MAC=DOWN:UP in Mbit/s, without --qos off)${NC}"
+        exit 1
+    fi
+done
+
+RADIO_IFACES=()
+for spec in "${RADIOS[@]}"; do
+    if [[ ! "$spec" =~ ^[a-zA-Z0-9_-]+(:(a|g)(:[0-9]+)?)?$ ]]; then
+        echo -e "${RED}Bad --radio $spec (expected IFACE[:a|g[:CHANNEL]])${NC}"
+        exit 1
+    fi
+    RADIO_IFACES+=("${spec%%:*}")
+done
+
+# Detect WiFi interface: keep the one hostapd.conf already serves, so reruns
+# without --radio (GUI, mode switches) stay put; otherwise the first one not
+# serving as an extra radio, given now or set up by an earlier run
+EXISTING_RADIOS=$(python3 "$SCRIPT_DIR/hostapd_config.py" radios --extra 2>/dev/null || true)
+NOT_MAIN=("${RADIO_IFACES[@]}")
+while read -r R_IFACE _; do
+    [[ -n "$R_IFACE" ]] && NOT_MAIN+=("$R_IFACE")
+done <<< "$EXISTING_RADIOS"
+IW_IFACES=$(iw dev 2>/dev/null | awk '$1=="Interface"{print $2}' || true)
+WIFI_IFACE=$(python3 "$SCRIPT_DIR/hostapd_config.py" get interface 2>/dev/null || true)
+if [[ -z "$WIFI_IFACE" || " ${RADIO_IFACES[*]} " == *" $WIFI_IFACE "* ]] || \
+        { [[ -n "$IW_IFACES" ]] && ! grep -qxF "$WIFI_IFACE" <<< "$IW_IFACES"; }; then
+    WIFI_IFACE=$(grep -vxF -f <(printf '%s\n' "${NOT_MAIN[@]}") <<< "$IW_IFACES" | head -n 1 || true)
+fi
 WIFI_IFACE=${WIFI_IFACE:-wlan0}
 
 # Check password
 if [[ -z "$WIFI_PASSWORD" ]] || [[ ${#WIFI_PASSWORD} -lt 8 ]]; then
-    echo "Usage: sudo $0 \"SSID\" \"Password\" [channel] [country] [band]"
+    echo "Usage: sudo $0 [--dry-run] [--profile PROFILE] [--radio IFACE[:BAND[:CHANNEL]]]..."
+    echo "                [--mode bridge|routed] [--address CIDR]"
+    echo "                [--qos DOWN:UP|off] [--qos-client MAC=DOWN:UP]..."
+    echo "                \"SSID\" \"Password\" [channel|auto] [country] [band]"
     echo "       sudo $0 --revert"
     echo ""
     echo "  Password must be at least 8 characters"
-    echo "  Channel: 1-13 for 2.4GHz, 36/40/44/48/149/153/157/161 for 5GHz"
+    echo "  Channel: 1-13 for 2.4GHz, 36/40/44/48/149/153/157/161 for 5GHz,"
+    echo "           or auto to pick the least congested one"
     echo "  Country: IE, GB, US, DE (default: IE)"
     echo "  Band: g (2.4GHz) or a (5GHz) (default: g)"
+    echo "  Profile: balanced, low-latency or max-throughput (default: keep current)"
+    echo "  Radio: extra radio with the same SSID, e.g. --radio wlan1:a:36 (none removes them)"
+    echo "  Mode: bridge (clients share eth0's network) or routed (own subnet, NAT)"
+    echo "  Address: AP address and subnet in routed mode (default: 192.168.50.1/24)"
+    echo "  QoS: per-client caps in Mbit/s with fair sharing, e.g. --qos 20:5 (off removes it)"
     exit 1
 fi
 
-echo -e "${GREEN}Setting up WiFi Extender...${NC}"
+stages_begin setup
+
+# Auto channel: pick the least congested channel from a neighbour scan
+if $AUTO_CHANNEL; then
+    stage scan
+    echo "Scanning for the least congested channel..."
+    BEST_CHANNEL=$(python3 "$SCRIPT_DIR/channel_scan.py" "$WIFI_IFACE" \
+        --band "$HW_MODE" --country "$COUNTRY_CODE" --best 2>/dev/null) && WIFI_CHANNEL=$BEST_CHANNEL
+fi
+
+echo -e "${GREEN}Setting up WiFi Extender...${NC}$($DRY_RUN && echo " (dry run - nothing will be changed)")"
 echo "  SSID: $WIFI_SSID"
-echo "  Channel: $WIFI_CHANNEL"
+echo "  Channel: $WIFI_CHANNEL$($AUTO_CHANNEL && echo " (auto)")"
 echo "  Band: $([ "$HW_MODE" = "a" ] && echo "5GHz" || echo "2.4GHz")"
 echo "  Country: $COUNTRY_CODE"
 echo "  Interface: $WIFI_IFACE"
+echo "  Mode: $MODE"
+
+# What changed decides which services are touched at the end
+HOSTAPD_CHANGED=false
+NETWORK_CHANGED=false
+ROUTED_CHANGED=false
+
+# Run a command, or only show it in a dry run
+run() {
+    if $DRY_RUN; then
+        echo "  would run: $*"
+    else
+        "$@"
+    fi
+}
+
+# Replace a file with stdin only if its content differs; true if it did
+write_file() {
+    local path="$1" tmp
+    tmp=$(mktemp)
+    cat > "$tmp"
+    if [[ -f "$path" ]] && cmp -s "$tmp" "$path"; then
+        rm -f "$tmp"
+        return 1
+    fi
+    if $DRY_RUN; then
+        echo "  would update: $path"
+        rm -f "$tmp"
+    else
+        mkdir -p "$(dirname "$path")"
+        chmod 644 "$tmp"
+        mv "$tmp" "$path"
+        echo "  updated: $path"
+    fi
+    return 0
+}
+
+# Legacy hostapd packaging reads its config path from /etc/default/hostapd
+set_daemon_conf() {
+    if ! grep -q '^DAEMON_CONF="/etc/hostapd/hostapd.conf"' /etc/default/hostapd 2>/dev/null; then
+        if $DRY_RUN; then
+            echo "  would update: /etc/default/hostapd"
+        else
+            sed -i 's|^#\?DAEMON_CONF=.*|DAEMON_CONF="/etc/hostapd/hostapd.conf"|' /etc/default/hostapd 2>/dev/null
+            grep -q '^DAEMON_CONF=' /etc/default/hostapd 2>/dev/null || \
+              echo 'DAEMON_CONF="/etc/hostapd/hostapd.conf"' >> /etc/default/hostapd
+        fi
+        HOSTAPD_CHANGED=true
+    fi
+}
 
 # Create backup (only on first run)
+stage backup
 if [[ ! -d "$BACKUP_DIR" ]]; then
-    echo "Creating backup..."
-    mkdir -p "$BACKUP_DIR"
-    cp /etc/dhcpcd.conf "$BACKUP_DIR/" 2>/dev/null || true
-    cp /etc/hostapd/hostapd.conf "$BACKUP_DIR/" 2>/dev/null || true
-    cp /etc/default/hostapd "$BACKUP_DIR/hostapd-default" 2>/dev/null || true
-    echo "Backup saved to $BACKUP_DIR"
+    if $DRY_RUN; then
+        echo "  would back up current config to $BACKUP_DIR"
+    else
+        echo "Creating backup..."
+        mkdir -p "$BACKUP_DIR"
+        cp /etc/dhcpcd.conf "$BACKUP_DIR/" 2>/dev/null || true
+        cp /etc/hostapd/hostapd.conf "$BACKUP_DIR/" 2>/dev/null || true
+        cp /etc/default/hostapd "$BACKUP_DIR/hostapd-default" 2>/dev/null || true
+        echo "Backup saved to $BACKUP_DIR"
+    fi
+else
+    stage_result skipped
 fi
 
 # Detect network manager
@@ -116,92 +328,356 @@ else
     echo "Detected: dhcpcd (Legacy)"
 fi
 
-# Install packages
-apt-get update -qq
-apt-get install -y -qq hostapd bridge-utils
-
-# Stop hostapd and unblock wifi
-systemctl stop hostapd 2>/dev/null || true
-rfkill unblock wlan 2>/dev/null || true
-
-# Configure hostapd
-cat > /etc/hostapd/hostapd.conf << EOF
-interface=$WIFI_IFACE
-bridge=br0
-driver=nl80211
-ssid=${WIFI_SSID}
-hw_mode=${HW_MODE}
-channel=${WIFI_CHANNEL}
-country_code=${COUNTRY_CODE}
-wpa=2
-wpa_passphrase=${WIFI_PASSWORD}
-wpa_key_mgmt=WPA-PSK
-rsn_pairwise=CCMP
-wmm_enabled=1
-ieee80211n=1
-EOF
+# Install packages that are missing (no apt-get update when none are)
+stage packages
+PACKAGES=(hostapd bridge-utils)
+[[ "$MODE" == "routed" ]] && PACKAGES=(hostapd dnsmasq nftables)
+MISSING=()
+for pkg in "${PACKAGES[@]}"; do
+    if ! dpkg-query -W -f='${Status}' "$pkg" 2>/dev/null | grep -q "install ok installed"; then
+        MISSING+=("$pkg")
+    fi
+done
+if [[ ${#MISSING[@]} -gt 0 ]]; then
+    echo "Installing: ${MISSING[*]}"
+    run apt-get update -qq
+    run apt-get install -y -qq "${MISSING[@]}"
+    # dnsmasq installed for routed mode is stopped again on revert
+    if [[ " ${MISSING[*]} " == *" dnsmasq "* ]] && ! $DRY_RUN; then
+        touch "$BACKUP_DIR/dnsmasq-installed"
+    fi
+    NETWORK_CHANGED=true
+else
+    echo "Packages: already installed"
+    stage_result skipped
+fi
+
+run rfkill unblock wlan 2>/dev/null || true
 
-# Add 802.11ac for 5GHz
-if [[ "$HW_MODE" == "a" ]]; then
-    echo "ieee80211ac=1" >> /etc/hostapd/hostapd.conf
+# Configure hostapd: shared renderer, widest safe channel width and HT/VHT
+# capabilities for this radio under the chosen country's regulatory rules,
+# written atomically (mode 600) touching only the settings that changed
+stage hostapd-config
+run iw reg set "$COUNTRY_CODE" 2>/dev/null || true
+# hostapd gives its control sockets to netdev (ctrl_interface_group) so the
+# desktop user's GUI can attach for live events without root
+getent group netdev >/dev/null || run groupadd --system netdev
+DESKTOP_USER=${SUDO_USER:-$(id -nu "${PKEXEC_UID:-0}" 2>/dev/null || true)}
+if [[ -n "$DESKTOP_USER" && "$DESKTOP_USER" != "root" ]] && \
+        ! id -nG "$DESKTOP_USER" 2>/dev/null | grep -qw netdev; then
+    echo "Adding $DESKTOP_USER to netdev (takes effect at next login)"
+    run usermod -aG netdev "$DESKTOP_USER"
+fi
+CHANGED_KEYS=$(python3 "$SCRIPT_DIR/hostapd_config.py" write "$WIFI_SSID" "$WIFI_PASSWORD" \
+    "$WIFI_CHANNEL" "$COUNTRY_CODE" "$HW_MODE" --iface "$WIFI_IFACE" \
+    $([[ "$MODE" == "routed" ]] && echo --no-bridge) $($DRY_RUN && echo --dry-run))
+if [[ -n "$CHANGED_KEYS" ]]; then
+    echo "  $($DRY_RUN && echo "would change" || echo "changed") hostapd.conf: $CHANGED_KEYS"
+    HOSTAPD_CHANGED=true
+    [[ " $CHANGED_KEYS " == *" bridge "* ]] && NETWORK_CHANGED=true
+else
+    echo "hostapd.conf: unchanged"
+    stage_result skipped
 fi
 
-chmod 600 /etc/hostapd/hostapd.conf
+# Extra radios: one hostapd@<iface> instance each (/etc/hostapd/<iface>.conf),
+# same SSID and password, own band and channel, all bridged into br0
+stage radios
+RADIO_RESTARTS=()
+if $RADIOS_GIVEN; then
+    while read -r R_IFACE _ _ R_CONF; do
+        [[ -z "$R_IFACE" || " ${RADIO_IFACES[*]} " == *" $R_IFACE "* ]] && continue
+        echo "Removing radio $R_IFACE"
+        run systemctl disable --now "hostapd@$R_IFACE" 2>/dev/null || true
+        run rm -f "$R_CONF"
+    done <<< "$EXISTING_RADIOS"
+else
+    while read -r R_IFACE R_BAND R_CHANNEL _; do
+        [[ -n "$R_IFACE" ]] && RADIOS+=("$R_IFACE:$R_BAND:$R_CHANNEL") && RADIO_IFACES+=("$R_IFACE")
+    done <<< "$EXISTING_RADIOS"
+fi
+for spec in "${RADIOS[@]}"; do
+    IFS=: read -r R_IFACE R_BAND R_CHANNEL <<< "$spec"
+    R_BAND=${R_BAND:-a}
+    R_CHANNEL=${R_CHANNEL:-$([ "$R_BAND" = "a" ] && echo 36 || echo 6)}
+    R_CHANGES=$(python3 "$SCRIPT_DIR/hostapd_config.py" --conf "/etc/hostapd/$R_IFACE.conf" write \
+        "$WIFI_SSID" "$WIFI_PASSWORD" "$R_CHANNEL" "$COUNTRY_CODE" "$R_BAND" --iface "$R_IFACE" \
+        $($DRY_RUN && echo --dry-run))
+    if [[ "$(systemctl is-enabled "hostapd@$R_IFACE" 2>/dev/null)" != "enabled" ]]; then
+        run systemctl enable "hostapd@$R_IFACE"
+        R_CHANGES=${R_CHANGES:-enabled}
+    fi
+    if [[ -n "$R_CHANGES" ]]; then
+        echo "  $($DRY_RUN && echo "would change" || echo "changed") $R_IFACE ($R_BAND, channel $R_CHANNEL): $R_CHANGES"
+        RADIO_RESTARTS+=("$R_IFACE")
+    fi
+done
+[[ ${#RADIOS[@]} -eq 0 || ${#RADIO_RESTARTS[@]} -eq 0 ]] && stage_result skipped
+UNMANAGED="interface-name:$WIFI_IFACE"
+for R_IFACE in "${RADIO_IFACES[@]}"; do
+    UNMANAGED+=";interface-name:$R_IFACE"
+done
 
-# Configure based on network manager
-if $USE_NETWORKMANAGER; then
+# Leaving routed mode: its service, ruleset and DHCP config go
+if [[ "$MODE" == "bridge" && "$CURRENT_MODE" == "routed" ]]; then
+    stage routing
+    echo "Switching from routed to bridge mode"
+    run python3 "$SCRIPT_DIR/routed.py" remove
+    run systemctl try-restart dnsmasq 2>/dev/null || true
+    if grep -qx "# Pi WiFi Extender (routed)" /etc/dhcpcd.conf 2>/dev/null; then
+        run sed -i '/^# Pi WiFi Extender (routed)$/,+1d' /etc/dhcpcd.conf
+    fi
+    NETWORK_CHANGED=true
+fi
+
+# Configure based on mode and network manager
+if [[ "$MODE" == "routed" ]]; then
+    # Routed mode, the same under either network manager: eth0 stays a plain
+    # DHCP uplink and the AP interface gets its own subnet, dnsmasq and NAT
+    stage routing
+    stage_result skipped
+    if $USE_NETWORKMANAGER; then
+        if nmcli connection show bridge-br0 &>/dev/null || \
+           nmcli connection show bridge-slave-eth0 &>/dev/null; then
+            run nmcli connection delete bridge-slave-eth0 2>/dev/null || true
+            run nmcli connection delete bridge-br0 2>/dev/null || true
+            NETWORK_CHANGED=true
+        fi
+        if write_file /etc/NetworkManager/conf.d/10-hostapd.conf << EOF
+[keyfile]
+unmanaged-devices=$UNMANAGED
+EOF
+        then
+            run systemctl reload NetworkManager
+            NETWORK_CHANGED=true
+        fi
+    else
+        set_daemon_conf
+        if grep -qx "interface br0" /etc/dhcpcd.conf 2>/dev/null; then
+            [[ ! -f /etc/dhcpcd.conf.backup ]] && run cp /etc/dhcpcd.conf /etc/dhcpcd.conf.backup
+            run sed -i '/^# Pi WiFi Extender$/,/^interface br0$/d' /etc/dhcpcd.conf
+            NETWORK_CHANGED=true
+        fi
+        if ! grep -qx "# Pi WiFi Extender (routed)" /etc/dhcpcd.conf 2>/dev/null; then
+            if $DRY_RUN; then
+                echo "  would update: /etc/dhcpcd.conf"
+            else
+                [[ ! -f /etc/dhcpcd.conf.backup ]] && cp /etc/dhcpcd.conf /etc/dhcpcd.conf.backup
+                echo -e "\n# Pi WiFi Extender (routed)\ndenyinterfaces $WIFI_IFACE" >> /etc/dhcpcd.conf
+            fi
+            NETWORK_CHANGED=true
+        fi
+        if [[ -f /etc/network/interfaces.d/br0 ]]; then
+            run rm -f /etc/network/interfaces.d/br0
+            NETWORK_CHANGED=true
+        fi
+    fi
+    # AP address, forwarding, the nftables flowtable and NAT, and dnsmasq
+    ROUTED_FILES=$(python3 "$SCRIPT_DIR/routed.py" write --iface "$WIFI_IFACE" \
+        ${AP_ADDRESS:+--address "$AP_ADDRESS"} $($DRY_RUN && echo --dry-run)) || exit 1
+    if [[ -n "$ROUTED_FILES" ]]; then
+        echo "  $($DRY_RUN && echo "would update" || echo "updated"): $(echo $ROUTED_FILES)"
+        run systemctl daemon-reload
+        run systemctl enable wifi-extender-routed dnsmasq
+        ROUTED_CHANGED=true
+    fi
+    ($NETWORK_CHANGED || $ROUTED_CHANGED) && stage_result ok
+elif $USE_NETWORKMANAGER; then
     # NetworkManager configuration (Bookworm+)
     
-    # Create bridge connection
-    nmcli connection delete br0 2>/dev/null || true
-    nmcli connection delete bridge-br0 2>/dev/null || true
-    nmcli connection delete bridge-slave-eth0 2>/dev/null || true
-    
-    nmcli connection add type bridge ifname br0 con-name bridge-br0 \
-        ipv4.method auto ipv6.method auto
-    nmcli connection add type bridge-slave ifname eth0 master br0 \
-        con-name bridge-slave-eth0
+    # Bridge connections: recreate only if missing or pointing elsewhere
+    stage bridge
+    if [[ "$(nmcli -g connection.interface-name connection show bridge-br0 2>/dev/null)" == "br0" && \
+          "$(nmcli -g connection.master connection show bridge-slave-eth0 2>/dev/null)" == "br0" ]]; then
+        echo "Bridge connections: already configured"
+        stage_result skipped
+    else
+        run nmcli connection delete br0 2>/dev/null || true
+        run nmcli connection delete bridge-br0 2>/dev/null || true
+        run nmcli connection delete bridge-slave-eth0 2>/dev/null || true
+        
+        run nmcli connection add type bridge ifname br0 con-name bridge-br0 \
+            ipv4.method auto ipv6.method auto
+        run nmcli connection add type bridge-slave ifname eth0 master br0 \
+            con-name bridge-slave-eth0
+        NETWORK_CHANGED=true
+    fi
     
     # Prevent NetworkManager from managing WiFi interface (hostapd will)
-    mkdir -p /etc/NetworkManager/conf.d
-    cat > /etc/NetworkManager/conf.d/10-hostapd.conf << EOF
+    stage networkmanager-reload
+    stage_result skipped
+    if write_file /etc/NetworkManager/conf.d/10-hostapd.conf << EOF
 [keyfile]
-unmanaged-devices=interface-name:$WIFI_IFACE
+unmanaged-devices=$UNMANAGED
 EOF
-    
-    # Reload NetworkManager
-    systemctl reload NetworkManager
+    then
+        run systemctl reload NetworkManager
+        stage_result ok
+        NETWORK_CHANGED=true
+    fi
     
     # Bring up bridge
-    nmcli connection up bridge-br0 2>/dev/null || true
+    if $NETWORK_CHANGED; then
+        stage bridge-up
+        run nmcli connection up bridge-br0 2>/dev/null || true
+    fi
 else
     # Legacy dhcpcd configuration (Bullseye and older)
-    sed -i 's|^#\?DAEMON_CONF=.*|DAEMON_CONF="/etc/hostapd/hostapd.conf"|' /etc/default/hostapd 2>/dev/null || \
-      echo 'DAEMON_CONF="/etc/hostapd/hostapd.conf"' >> /etc/default/hostapd
+    stage bridge
+    set_daemon_conf
     
     # Backup and configure dhcpcd
-    [[ ! -f /etc/dhcpcd.conf.backup ]] && cp /etc/dhcpcd.conf /etc/dhcpcd.conf.backup
     if ! grep -q "denyinterfaces $WIFI_IFACE eth0" /etc/dhcpcd.conf; then
-        echo -e "\n# Pi WiFi Extender\ndenyinterfaces $WIFI_IFACE eth0\ninterface br0" >> /etc/dhcpcd.conf
+        if $DRY_RUN; then
+            echo "  would update: /etc/dhcpcd.conf"
+        else
+            [[ ! -f /etc/dhcpcd.conf.backup ]] && cp /etc/dhcpcd.conf /etc/dhcpcd.conf.backup
+            echo -e "\n# Pi WiFi Extender\ndenyinterfaces $WIFI_IFACE eth0\ninterface br0" >> /etc/dhcpcd.conf
+        fi
+        NETWORK_CHANGED=true
     fi
     
+    # Extra radios are left to their hostapd@ instances too
+    for R_IFACE in "${RADIO_IFACES[@]}"; do
+        if ! grep -qx "denyinterfaces $R_IFACE" /etc/dhcpcd.conf; then
+            $DRY_RUN && echo "  would update: /etc/dhcpcd.conf" || \
+                echo "denyinterfaces $R_IFACE" >> /etc/dhcpcd.conf
+            NETWORK_CHANGED=true
+        fi
+    done
+    
     # Configure bridge via interfaces
-    cat > /etc/network/interfaces.d/br0 << EOF
+    if write_file /etc/network/interfaces.d/br0 << EOF
 auto br0
 iface br0 inet dhcp
     bridge_ports eth0
     bridge_stp off
     bridge_fd 0
 EOF
+    then
+        NETWORK_CHANGED=true
+    fi
 fi
 
 # Enable hostapd
-systemctl unmask hostapd
-systemctl enable hostapd
+stage hostapd-enable
+if [[ "$(systemctl is-enabled hostapd 2>/dev/null)" != "enabled" ]]; then
+    run systemctl unmask hostapd
+    run systemctl enable hostapd
+    HOSTAPD_CHANGED=true
+else
+    stage_result skipped
+fi
+
+# Tuning profile: power save, txqueuelen, bridge multicast and WMM, kept
+# across hostapd restarts by a drop-in; hostapd is restarted below if needed
+stage tuning
+if [[ -n "$PROFILE" ]]; then
+    TUNING_CHANGES=$(python3 "$SCRIPT_DIR/tuning.py" apply "$PROFILE" --iface "$WIFI_IFACE" \
+        --no-restart $($DRY_RUN && echo --dry-run))
+    if [[ -n "$TUNING_CHANGES" ]]; then
+        echo "Tuning ($PROFILE):"
+        echo "$TUNING_CHANGES"
+        [[ "$TUNING_CHANGES" == *"hostapd.conf"* ]] && HOSTAPD_CHANGED=true
+    else
+        echo "Tuning: already $PROFILE"
+        stage_result skipped
+    fi
+else
+    stage_result skipped
+fi
+
+# Per-client shaping and fair queuing on the Wi-Fi interface; the status
+# daemon re-applies it as clients connect and leave
+stage qos
+QOS_COMMAND=()
+if [[ "$QOS" == "off" ]]; then
+    QOS_COMMAND=(off)
+elif [[ -n "$QOS" || ${#QOS_CLIENTS[@]} -gt 0 ]]; then
+    QOS_COMMAND=(set --iface "$WIFI_IFACE")
+    [[ -n "$QOS" ]] && QOS_COMMAND+=(--default "$QOS")
+    for spec in "${QOS_CLIENTS[@]}"; do
+        QOS_COMMAND+=(--client "$spec")
+    done
+fi
+QOS_CHANGES=""
+# The config is saved first, so if applying fails the daemon retries it
+if [[ ${#QOS_COMMAND[@]} -gt 0 ]] && ! QOS_CHANGES=$(python3 "$SCRIPT_DIR/qos.py" \
+        "${QOS_COMMAND[@]}" $($DRY_RUN && echo --dry-run)); then
+    stage_result failed
+elif [[ -z "$QOS_CHANGES" ]]; then
+    stage_result skipped
+fi
+if [[ -n "$QOS_CHANGES" ]]; then
+    echo "QoS:"
+    echo "$QOS_CHANGES" | sed 's/^/  /'
+fi
+
+# Periodic channel re-scoring in auto mode
+stage channel-timer
+if $AUTO_CHANNEL; then
+    run python3 "$SCRIPT_DIR/channel_scan.py" "$WIFI_IFACE" --band "$HW_MODE" \
+        --country "$COUNTRY_CODE" --install-timer || true
+else
+    run python3 "$SCRIPT_DIR/channel_scan.py" --remove-timer 2>/dev/null || true
+fi
+
+# Status daemon: keeps a snapshot in /run for instant status.sh reads
+# (left alone if already installed, e.g. with a metrics port)
+stage status-service
+if [[ ! -f /etc/systemd/system/wifi-extender-status.service ]]; then
+    run python3 "$SCRIPT_DIR/status_collector.py" --install-service || true
+else
+    stage_result skipped
+fi
+
+# Restart only what the changes affect: the bridge or a mode switch needs
+# a reboot, a hostapd-only change on a running bridge just a hostapd restart
+stage activate
+stage_result skipped
+REBOOT=false
+if $NETWORK_CHANGED || { [[ "$MODE" == "bridge" ]] && ! ip link show br0 &>/dev/null; }; then
+    REBOOT=true
+    if ! $DRY_RUN; then
+        mkdir -p "$(dirname "$REBOOT_FLAG")"
+        touch "$REBOOT_FLAG"
+    fi
+    stage_result reboot-required
+elif $HOSTAPD_CHANGED || $ROUTED_CHANGED || [[ ${#RADIO_RESTARTS[@]} -gt 0 ]]; then
+    if $HOSTAPD_CHANGED; then
+        run systemctl restart hostapd
+    fi
+    for R_IFACE in "${RADIO_RESTARTS[@]}"; do
+        run systemctl restart "hostapd@$R_IFACE"
+    done
+    # hostapd restarts take the routed service along (PartOf=)
+    if $ROUTED_CHANGED; then
+        run systemctl restart wifi-extender-routed dnsmasq
+    fi
+    HOSTAPD_CHANGED=true
+    stage_result restarted
+    if ! $DRY_RUN; then
+        # Time until hostapd, AP mode and the bridge are all back
+        stage ready
+        python3 "$SCRIPT_DIR/readiness.py" --iface "$WIFI_IFACE" || stage_result timeout
+    fi
+fi
+stages_end
 
 echo ""
+if $DRY_RUN; then
+    echo -e "${GREEN}✓ Dry run complete${NC} - $($REBOOT && echo "a reboot would be needed" || \
+        ($HOSTAPD_CHANGED && echo "hostapd would be restarted" || echo "nothing to do"))"
+    exit 0
+fi
 echo -e "${GREEN}✓ Setup complete!${NC}"
 echo "  SSID: $WIFI_SSID | Channel: $WIFI_CHANNEL | Country: $COUNTRY_CODE"
 echo ""
-echo "Reboot to activate: sudo reboot"
+if $REBOOT; then
+    echo "Reboot to activate: sudo reboot"
+elif $HOSTAPD_CHANGED; then
+    echo "hostapd restarted - no reboot needed"
+else
+    echo "Already up to date - nothing changed"
+fi
 echo "To revert changes:  sudo ./setup.sh --revert"
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Stage timing
+setup.sh and uninstall.sh report every stage they finish (see stages.sh)
+as a JSON line on stdout prefixed with "@stage ", and append it to a
+history file. This parses those events into per-run timelines and
+compares a run against the typical duration of each stage, so a slow
+apt, nmcli or NetworkManager reload shows up across updates.
+
+Usage: ./stage_timing.py [--json] [--runs N] [--script setup|revert|uninstall]
+"""
+
+import json
+import os
+import statistics
+import sys
+
+EVENT_PREFIX = "@stage "
+HISTORY_FILE = "/var/lib/wifi-extender-backup/stage-history.jsonl"
+DEFAULT_RUNS = 5
+BASELINE_RUNS = 10
+SLOWER_FACTOR = 1.5  # Flag stages this much slower than usual...
+SLOWER_MIN = 1.0     # ...and at least this many seconds slower
+
+
+def parse_event(line):
+    """The event dict of an "@stage {...}" line, or None for other lines"""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        event = json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+    if not isinstance(event, dict) or not {"stage", "duration"} <= event.keys():
+        return None
+    return event
+
+
+class Timeline:
+    """Stages of one run, in the order they finished"""
+
+    def __init__(self, script=None, run=None, events=None):
+        self.script = script
+        self.run = run
+        self.events = []
+        for event in events or []:
+            self.add(event)
+
+    def add(self, event):
+        if self.script is None:
+            self.script = event.get("script")
+            self.run = event.get("run")
+        self.events.append(event)
+
+    @property
+    def total(self):
+        return sum(e["duration"] for e in self.events)
+
+    @property
+    def failed(self):
+        return any(e.get("result") == "failed" for e in self.events)
+
+    def slowest(self):
+        return max(self.events, key=lambda e: e["duration"], default=None)
+
+    def as_dict(self):
+        return {"script": self.script, "run": self.run, "total": round(self.total, 6),
+                "stages": self.events}
+
+
+def record(script, stage, start, duration, result="ok", path=HISTORY_FILE):
+    """Append one event to the history as stages.sh does; False if unwritable"""
+    event = {"script": script, "run": int(start), "stage": stage,
+             "start": round(start, 6), "duration": round(duration, 6), "result": result}
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+    except OSError:
+        return False
+    return True
+
+
+def load_runs(path=HISTORY_FILE, script=None):
+    """Timelines from the history file, oldest first"""
+    runs = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                event = parse_event(EVENT_PREFIX + line.strip())
+                if event is None or (script and event.get("script") != script):
+                    continue
+                key = (event.get("script"), event.get("run"))
+                runs.setdefault(key, Timeline()).add(event)
+    except OSError:
+        return []
+    return sorted(runs.values(), key=lambda t: t.run or 0)
+
+
+def typical_durations(runs):
+    """Median duration of each stage over runs, skipping failed stages"""
+    durations = {}
+    for timeline in runs:
+        for event in timeline.events:
+            if event.get("result") != "failed":
+                durations.setdefault(event["stage"], []).append(event["duration"])
+    return {stage: statistics.median(values) for stage, values in durations.items()}
+
+
+def is_slower(duration, typical):
+    return (typical is not None and duration >= typical * SLOWER_FACTOR
+            and duration - typical >= SLOWER_MIN)
+
+
+def format_duration(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms"
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+    return f"{int(seconds // 60)} min {seconds % 60:.0f} s"
+
+
+def format_event(event, typical=None):
+    """One timeline line, e.g. "packages     12.3 s  ok  (usually 1.1 s)" """
+    text = f"{event['stage']:<22} {format_duration(event['duration']):>9}  {event.get('result', '')}"
+    if is_slower(event["duration"], typical):
+        text += f"  (usually {format_duration(typical)})"
+    return text
+
+
+def format_run(timeline, typical=None):
+    typical = typical or {}
+    lines = [f"{timeline.script} run {timeline.run}: {format_duration(timeline.total)}"
+             + (" (failed)" if timeline.failed else "")]
+    lines += ["  " + format_event(e, typical.get(e["stage"])) for e in timeline.events]
+    return "\n".join(lines)
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    count = int(option("--runs", DEFAULT_RUNS))
+    runs = load_runs(script=option("--script"))
+    if not runs:
+        print("No recorded runs", file=sys.stderr)
+        return 1
+    shown = runs[-count:]
+    if "--json" in args:
+        print(json.dumps([t.as_dict() for t in shown], indent=2))
+        return 0
+    for i, timeline in enumerate(shown):
+        # Compare each run against the runs of the same script before it
+        index = runs.index(timeline)
+        baseline = [t for t in runs[:index] if t.script == timeline.script][-BASELINE_RUNS:]
+        if i:
+            print()
+        print(format_run(timeline, typical_durations(baseline)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+# Pi WiFi Extender - Stage timing for setup.sh and uninstall.sh
+# Sourced, not run. Each finished stage is printed as one JSON line
+# prefixed with "@stage " (the GUI turns these into a timeline) and
+# appended to $STAGE_HISTORY, which stage_timing.py reads back.
+#
+#   stages_begin setup     # name this run
+#   stage packages         # close the previous stage (ok) and open this one
+#   stage_result skipped   # result of the open stage: ok, skipped, failed...
+#   stages_end             # close the last stage
+
+STAGE_HISTORY="${STAGE_HISTORY-/var/lib/wifi-extender-backup/stage-history.jsonl}"
+STAGE_HISTORY_MAX_BYTES=262144
+
+# Microseconds since the epoch; EPOCHREALTIME (bash 5) avoids a fork
+_stage_now() {
+    if [[ -n "$EPOCHREALTIME" ]]; then
+        _STAGE_NOW=${EPOCHREALTIME//[!0-9]/}
+    else
+        _STAGE_NOW=$(date +%s%6N)
+    fi
+}
+
+_stage_emit() {
+    local result="$1" duration line
+    _stage_now
+    duration=$((_STAGE_NOW - STAGE_START))
+    printf -v line '{"script": "%s", "run": %d, "stage": "%s", "start": %d.%06d, "duration": %d.%06d, "result": "%s"}' \
+        "$STAGE_SCRIPT" "$STAGE_RUN" "$STAGE_NAME" \
+        $((STAGE_START / 1000000)) $((STAGE_START % 1000000)) \
+        $((duration / 1000000)) $((duration % 1000000)) "$result"
+    echo "@stage $line"
+    if [[ -n "$STAGE_HISTORY" ]]; then
+        { mkdir -p "$(dirname "$STAGE_HISTORY")" && echo "$line" >> "$STAGE_HISTORY"; } 2>/dev/null || true
+    fi
+    STAGE_NAME=""
+}
+
+# Close the open stage as failed if the script exits with an error
+_stage_exit() {
+    local status=$?
+    if [[ -n "$STAGE_NAME" ]]; then
+        _stage_emit "$([[ $status -eq 0 ]] && echo "$STAGE_RESULT" || echo failed)"
+    fi
+    return $status
+}
+
+stages_begin() {
+    STAGE_SCRIPT="$1"
+    STAGE_NAME=""
+    _stage_now
+    STAGE_RUN=$((_STAGE_NOW / 1000000))
+    # Keep the history to roughly the last thousand stages
+    if [[ -n "$STAGE_HISTORY" && -f "$STAGE_HISTORY" ]] && \
+       [[ $(wc -c < "$STAGE_HISTORY") -gt $STAGE_HISTORY_MAX_BYTES ]]; then
+        tail -n 1000 "$STAGE_HISTORY" > "$STAGE_HISTORY.tmp" && mv "$STAGE_HISTORY.tmp" "$STAGE_HISTORY"
+    fi
+    trap _stage_exit EXIT
+}
+
+stage() {
+    [[ -n "$STAGE_NAME" ]] && _stage_emit "$STAGE_RESULT"
+    STAGE_NAME="$1"
+    STAGE_RESULT="ok"
+    _stage_now
+    STAGE_START=$_STAGE_NOW
+}
+
+stage_result() {
+    STAGE_RESULT="$1"
+}
+
+stages_end() {
+    [[ -n "$STAGE_NAME" ]] && _stage_emit "$STAGE_RESULT"
+    return 0
+}
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Station statistics
+Reads per-station counters (signal, bitrates, bytes, retries, inactive
+time) straight from nl80211 over a long-lived generic netlink socket, with
+a parser for `iw dev <iface> station dump` output as fallback and for
+working offline from recorded dumps.
+
+Usage: ./station_stats.py [interface] [--json | --count] [--from-file DUMP]
+"""
+
+import json
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+
+# Generic netlink / nl80211 constants (linux/netlink.h, linux/nl80211.h)
+NETLINK_GENERIC = 16
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_STATION = 17
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NLA_F_NESTED = 0x8000
+
+STA_INACTIVE_TIME = 1
+STA_RX_BYTES = 2
+STA_TX_BYTES = 3
+STA_SIGNAL = 7
+STA_TX_BITRATE = 8
+STA_RX_PACKETS = 9
+STA_TX_PACKETS = 10
+STA_TX_RETRIES = 11
+STA_TX_FAILED = 12
+STA_SIGNAL_AVG = 13
+STA_RX_BITRATE = 14
+STA_CONNECTED_TIME = 16
+STA_RX_BYTES64 = 23
+STA_TX_BYTES64 = 24
+RATE_BITRATE = 1
+RATE_BITRATE32 = 5
+
+
+class Station:
+    """Counters for one associated station"""
+
+    __slots__ = (
+        "mac", "inactive_ms", "rx_bytes", "tx_bytes", "rx_packets",
+        "tx_packets", "tx_retries", "tx_failed", "signal", "signal_avg",
+        "tx_bitrate", "rx_bitrate", "connected_s",
+    )
+
+    def __init__(self, mac, **values):
+        self.mac = mac
+        for field in self.__slots__[1:]:
+            setattr(self, field, values.get(field))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"Station({self.mac}, signal={self.signal}, tx={self.tx_bitrate})"
+
+
+# `iw station dump` field label -> (Station attribute, converter)
+_DUMP_FIELDS = {
+    "inactive time": ("inactive_ms", int),
+    "rx bytes": ("rx_bytes", int),
+    "tx bytes": ("tx_bytes", int),
+    "rx packets": ("rx_packets", int),
+    "tx packets": ("tx_packets", int),
+    "tx retries": ("tx_retries", int),
+    "tx failed": ("tx_failed", int),
+    "signal": ("signal", int),
+    "signal avg": ("signal_avg", int),
+    "tx bitrate": ("tx_bitrate", float),
+    "rx bitrate": ("rx_bitrate", float),
+    "connected time": ("connected_s", int),
+}
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_station_dump(text):
+    """Parse `iw dev <iface> station dump` output into Station records"""
+    stations = []
+    station = None
+    for line in text.splitlines():
+        if line.startswith("Station "):
+            station = Station(line.split()[1])
+            stations.append(station)
+            continue
+        if station is None or ":" not in line:
+            continue
+        label, value = line.split(":", 1)
+        field = _DUMP_FIELDS.get(label.strip())
+        if field:
+            match = _NUMBER.search(value)
+            if match:
+                setattr(station, field[0], field[1](match.group()))
+    return stations
+
+
+def _attrs(data):
+    """Yield (type, payload) for each netlink attribute in data"""
+    offset = 0
+    while offset + 4 <= len(data):
+        length, kind = struct.unpack_from("HH", data, offset)
+        if length < 4:
+            break
+        yield kind & ~NLA_F_NESTED, data[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+
+
+def _attr(kind, payload):
+    length = 4 + len(payload)
+    return struct.pack("HH", length, kind) + payload + b"\0" * (-length % 4)
+
+
+def _bitrate(payload):
+    """Mbit/s from a nested rate_info attribute"""
+    rates = dict(_attrs(payload))
+    if RATE_BITRATE32 in rates:
+        return struct.unpack("I", rates[RATE_BITRATE32][:4])[0] / 10
+    if RATE_BITRATE in rates:
+        return struct.unpack("H", rates[RATE_BITRATE][:2])[0] / 10
+    return None
+
+
+def _station_from_attrs(mac, payload):
+    info = dict(_attrs(payload))
+
+    def u32(kind):
+        return struct.unpack("I", info[kind][:4])[0] if kind in info else None
+
+    def u64(kind):
+        return struct.unpack("Q", info[kind][:8])[0] if kind in info else None
+
+    def s8(kind):
+        return struct.unpack("b", info[kind][:1])[0] if kind in info else None
+
+    rx_bytes = u64(STA_RX_BYTES64)
+    tx_bytes = u64(STA_TX_BYTES64)
+    return Station(
+        mac,
+        inactive_ms=u32(STA_INACTIVE_TIME),
+        rx_bytes=rx_bytes if rx_bytes is not None else u32(STA_RX_BYTES),
+        tx_bytes=tx_bytes if tx_bytes is not None else u32(STA_TX_BYTES),
+        rx_packets=u32(STA_RX_PACKETS),
+        tx_packets=u32(STA_TX_PACKETS),
+        tx_retries=u32(STA_TX_RETRIES),
+        tx_failed=u32(STA_TX_FAILED),
+        signal=s8(STA_SIGNAL),
+        signal_avg=s8(STA_SIGNAL_AVG),
+        tx_bitrate=_bitrate(info[STA_TX_BITRATE]) if STA_TX_BITRATE in info else None,
+        rx_bitrate=_bitrate(info[STA_RX_BITRATE]) if STA_RX_BITRATE in info else None,
+        connected_s=u32(STA_CONNECTED_TIME),
+    )
+
+
+class Nl80211:
+    """Long-lived generic netlink socket for nl80211 station dumps"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.sock.bind((0, 0))
+        self.seq = 0
+        self.family = self._resolve_family(b"nl80211\0")
+
+    def close(self):
+        self.sock.close()
+
+    def _request(self, msg_type, flags, cmd, payload):
+        """Send one genl request and return the payloads of every reply"""
+        self.seq += 1
+        body = struct.pack("BBH", cmd, 1, 0) + payload
+        self.sock.send(struct.pack("IHHII", 16 + len(body), msg_type,
+                                   flags | NLM_F_REQUEST, self.seq, 0) + body)
+        replies = []
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, kind, _, seq, _ = struct.unpack_from("IHHII", data, offset)
+                if length < 16:
+                    return replies
+                message = data[offset + 16:offset + length]
+                offset += (length + 3) & ~3
+                if seq != self.seq:
+                    continue
+                if kind == NLMSG_DONE:
+                    return replies
+                if kind == NLMSG_ERROR:
+                    error = struct.unpack_from("i", message)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return replies
+                replies.append(message[4:])
+            if not flags & NLM_F_DUMP and replies:
+                return replies
+
+    def _resolve_family(self, name):
+        for reply in self._request(GENL_ID_CTRL, 0, CTRL_CMD_GETFAMILY,
+                                   _attr(CTRL_ATTR_FAMILY_NAME, name)):
+            attrs = dict(_attrs(reply))
+            if CTRL_ATTR_FAMILY_ID in attrs:
+                return struct.unpack("H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+        raise OSError("nl80211 generic netlink family not found")
+
+    def interface_type(self, iface):
+        """nl80211 iftype of iface (NL80211_IFTYPE_AP is 3), or None"""
+        ifindex = struct.pack("I", socket.if_nametoindex(iface))
+        for reply in self._request(self.family, 0, NL80211_CMD_GET_INTERFACE,
+                                   _attr(NL80211_ATTR_IFINDEX, ifindex)):
+            attrs = dict(_attrs(reply))
+            if NL80211_ATTR_IFTYPE in attrs:
+                return struct.unpack("I", attrs[NL80211_ATTR_IFTYPE][:4])[0]
+        return None
+
+    def stations(self, iface):
+        ifindex = struct.pack("I", socket.if_nametoindex(iface))
+        stations = []
+        for reply in self._request(self.family, NLM_F_DUMP, NL80211_CMD_GET_STATION,
+                                   _attr(NL80211_ATTR_IFINDEX, ifindex)):
+            attrs = dict(_attrs(reply))
+            if NL80211_ATTR_MAC in attrs and NL80211_ATTR_STA_INFO in attrs:
+                mac = ":".join(f"{b:02x}" for b in attrs[NL80211_ATTR_MAC][:6])
+                stations.append(_station_from_attrs(mac, attrs[NL80211_ATTR_STA_INFO]))
+        return stations
+
+
+class StationReader:
+    """Reads station stats for one interface, reusing a single netlink socket
+
+    Falls back to parsing `iw` output when netlink is unavailable.
+    """
+
+    def __init__(self, iface="wlan0"):
+        self.iface = iface
+        self.nl = None
+        self.use_iw = False
+
+    def stations(self):
+        if not self.use_iw:
+            try:
+                if self.nl is None:
+                    self.nl = Nl80211()
+                return self.nl.stations(self.iface)
+            except OSError:
+                self.close()
+                if not os.path.exists(f"/sys/class/net/{self.iface}"):
+                    return []
+                self.use_iw = True
+        result = subprocess.run(
+            ["iw", "dev", self.iface, "station", "dump"],
+            capture_output=True, text=True, timeout=5
+        )
+        return parse_station_dump(result.stdout)
+
+    def close(self):
+        if self.nl:
+            self.nl.close()
+            self.nl = None
+
+
+def format_table(stations):
+    lines = [f"{'Station':<17}  {'Signal':>6}  {'TX Mb/s':>7}  {'RX Mb/s':>7}  "
+             f"{'TX bytes':>12}  {'RX bytes':>12}  {'Retries':>7}  {'Idle ms':>7}"]
+    for s in stations:
+        lines.append(
+            f"{s.mac:<17}  {_show(s.signal):>6}  {_show(s.tx_bitrate):>7}  "
+            f"{_show(s.rx_bitrate):>7}  {_show(s.tx_bytes):>12}  "
+            f"{_show(s.rx_bytes):>12}  {_show(s.tx_retries):>7}  "
+            f"{_show(s.inactive_ms):>7}"
+        )
+    return "\n".join(lines)
+
+
+def _show(value):
+    return "-" if value is None else str(value)
+
+
+def main(argv):
+    args = [a for a in argv if not a.startswith("--")]
+    iface = "wlan0"
+    dump_file = None
+    if "--from-file" in argv:
+        dump_file = argv[argv.index("--from-file") + 1]
+        args.remove(dump_file)
+    if args:
+        iface = args[0]
+
+    if dump_file:
+        with open(dump_file) as f:
+            stations = parse_station_dump(f.read())
+    else:
+        reader = StationReader(iface)
+        try:
+            stations = reader.stations()
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            reader.close()
+
+    if "--count" in argv:
+        print(len(stations))
+    elif "--json" in argv:
+        print(json.dumps([s.as_dict() for s in stations], indent=2))
+    else:
+        print(format_table(stations))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,44 +1,8 @@
 #!/bin/bash
 # Pi WiFi Extender - Status
+# Thin wrapper: status_collector.py gathers everything in one process
+# (and answers from the status daemon's cached snapshot when it runs).
 
-GREEN='\033[0;32m'
-RED='\033[0;31m'
-NC='\033[0m'
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
-echo "📡 WiFi Extender Status"
-echo "─────────────────────────"
-
-# Services
-if systemctl is-active --quiet hostapd; then
-    echo -e "hostapd: ${GREEN}● running${NC}"
-else
-    echo -e "hostapd: ${RED}● stopped${NC}"
-fi
-
-if ip link show br0 &>/dev/null && [[ $(cat /sys/class/net/br0/operstate 2>/dev/null) == "up" ]]; then
-    echo -e "bridge:  ${GREEN}● active${NC}"
-else
-    echo -e "bridge:  ${RED}● inactive${NC}"
-fi
-
-# Network manager detection
-if systemctl is-active --quiet NetworkManager; then
-    echo -e "netmgr:  NetworkManager (Bookworm+)"
-elif systemctl is-active --quiet dhcpcd; then
-    echo -e "netmgr:  dhcpcd (Legacy)"
-fi
-
-# Config
-if [[ -f /etc/hostapd/hostapd.conf ]]; then
-    ssid=$(grep ^ssid= /etc/hostapd/hostapd.conf | cut -d= -f2)
-    channel=$(grep ^channel= /etc/hostapd/hostapd.conf | cut -d= -f2)
-    echo "─────────────────────────"
-    echo "SSID:    $ssid"
-    echo "Channel: $channel"
-fi
-
-# Clients
-if systemctl is-active --quiet hostapd; then
-    clients=$(iw dev wlan0 station dump 2>/dev/null | grep -c "Station" || echo 0)
-    echo "Clients: $clients"
-fi
+exec python3 "$SCRIPT_DIR/status_collector.py" "$@"
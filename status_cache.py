@@ -0,0 +1,81 @@
+"""
+Pi WiFi Extender - GUI startup cache
+Keeps the last known status on disk next to gui-config.json, so the GUI
+can paint something useful before its first live probe, and times how
+long startup takes when asked to.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+STATUS_CACHE_FILE = "/var/lib/wifi-extender-backup/gui-status.json"
+
+
+def load(path=STATUS_CACHE_FILE):
+    """Last saved status dict (with its "time"), or None"""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+
+def save(state, path=STATUS_CACHE_FILE, previous=None):
+    """Atomically save state; skipped when it matches previous
+
+    Returns the saved dict (stamped with "time"), or previous when
+    nothing was written.
+    """
+    if previous is not None and {k: v for k, v in previous.items() if k != "time"} == state:
+        return previous
+    stamped = dict(state, time=time.time())
+    directory = os.path.dirname(path) or "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".gui-status.")
+    except OSError:
+        return previous  # Will be saved when running as root
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(stamped, f)
+        os.rename(tmp, path)
+    except OSError:
+        os.unlink(tmp)
+        return previous
+    return stamped
+
+
+def age_text(saved, now=None):
+    """'just now', '5 min ago', '3 h ago' or '2 days ago'"""
+    seconds = max(0, (time.time() if now is None else now) - saved)
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} days ago"
+
+
+class StartupProfile:
+    """Records how long after started each startup milestone was reached"""
+
+    def __init__(self, started, enabled=False, out=sys.stderr, clock=time.monotonic):
+        self.started = started
+        self.enabled = enabled
+        self.out = out
+        self.clock = clock
+        self.marks = {}
+
+    def mark(self, name):
+        """Record name the first time it is reached; later calls are ignored"""
+        if name in self.marks:
+            return
+        self.marks[name] = self.clock() - self.started
+        if self.enabled:
+            print(f"startup: {name} after {self.marks[name] * 1000:.0f} ms",
+                  file=self.out, flush=True)
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Status collector
+Gathers service state, bridge operstate, the hostapd config and station
+stats of every radio in one pass without forking: processes are found in /proc, link
+state in /sys/class/net, AP state over hostapd's control socket,
+stations over nl80211 and traffic shaping counters over rtnetlink. Run
+it one-shot, or as a daemon that keeps the latest snapshot in /run for
+instant reads from cron or SSH; the daemon also keeps qos.py's per-client
+shaping in step with the clients connected.
+
+Usage: ./status_collector.py [--json] [--fresh] [--clients]
+       sudo ./status_collector.py --daemon [--interval SECONDS] [--metrics-port PORT]
+                                  [--metrics-addr ADDR] [--uplink-interval SECONDS]
+                                  [--uplink-target IP] [--uplink-method icmp|tcp:PORT]
+       sudo ./status_collector.py --install-service [daemon options] | --remove-service
+  --fresh         ignore the daemon's cached snapshot and collect now
+  --clients       list each client's hostname, IP, MAC and signal too
+  --metrics-port  also serve the snapshot as Prometheus metrics on /metrics
+                  (listening on 127.0.0.1 unless --metrics-addr is given)
+  --uplink-*      how the daemon probes the gateway for latency and loss
+                  (every second by default; an interval of 0 turns it off)
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import client_roster
+import hostapd_config
+import qos
+import routed
+import station_stats
+import uplink
+from hostapd_ctrl import CTRL_DIR, HostapdCtrl, HostapdCtrlError
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SYSFS_NET = "/sys/class/net"
+PROC = "/proc"
+CACHE_FILE = "/run/wifi-extender/status.json"
+SYSTEMD_DIR = "/etc/systemd/system"
+SERVICE_NAME = "wifi-extender-status"
+DEFAULT_INTERVAL = 5.0
+BRIDGE = "br0"
+STAT_COUNTERS = ("rx_bytes", "tx_bytes", "rx_packets", "tx_packets",
+                 "rx_dropped", "tx_dropped")
+
+
+def read_sysfs(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def interface_stats(sysfs, name):
+    """Byte, packet and drop counters for one interface, or None if absent"""
+    base = os.path.join(sysfs, name, "statistics")
+    if not os.path.isdir(base):
+        return None
+    stats = {}
+    for counter in STAT_COUNTERS:
+        value = read_sysfs(os.path.join(base, counter))
+        if value is not None:
+            stats[counter] = int(value)
+    return stats
+
+
+def running_processes(proc=PROC):
+    """Command names of all running processes, read from /proc"""
+    names = set()
+    try:
+        pids = [p for p in os.listdir(proc) if p.isdigit()]
+    except OSError:
+        return names
+    for pid in pids:
+        name = read_sysfs(os.path.join(proc, pid, "comm"))
+        if name:
+            names.add(name)
+    return names
+
+
+class StatusCollector:
+    """Collects status snapshots, keeping sockets open between passes"""
+
+    def __init__(self, conf=hostapd_config.HOSTAPD_CONF, sysfs=SYSFS_NET, proc=PROC,
+                 ctrl_dir=CTRL_DIR, reader_factory=station_stats.StationReader, roster=None,
+                 uplink_monitor=None, qos_state=qos.STATE_FILE):
+        self.conf = conf
+        self.sysfs = sysfs
+        self.proc = proc
+        self.ctrl_dir = ctrl_dir
+        self.reader_factory = reader_factory
+        self.readers = {}  # iface -> StationReader
+        self.roster = roster or client_roster.Roster(proc)  # IPs and hostnames
+        self.uplink_monitor = uplink_monitor  # Gateway probes; daemon only
+        self.qos_state = qos_state  # Which interfaces qos.py shapes
+        self.tc = None  # qos.TcStats, opened once something is shaped
+
+    def collect(self):
+        processes = running_processes(self.proc)
+        if "NetworkManager" in processes:
+            network_manager = "NetworkManager"
+        elif "dhcpcd" in processes:
+            network_manager = "dhcpcd"
+        else:
+            network_manager = None
+
+        try:
+            config = hostapd_config.load(self.conf)
+        except PermissionError:
+            config = None
+        iface = config.interface if config else self._wifi_iface()
+        # Routed mode's hostapd.conf has no bridge; unreadable, ask routed.py
+        mode = ("bridge" if config.bridge else "routed") if config else routed.mode()
+
+        running = "hostapd" in processes
+        polled = self.radios(running)
+        if not polled:  # Config unreadable: still report the Wi-Fi interface
+            polled = [self._radio(iface, None, running)]
+        radios = [radio for radio, _ in polled]
+        stations = self.roster.annotate(
+            [s for _, radio_stations in polled for s in radio_stations])
+
+        interfaces = {}
+        for name in [BRIDGE] + self._bridge_ports() + [r["interface"] for r in radios]:
+            stats = interface_stats(self.sysfs, name)
+            if stats is not None:
+                interfaces[name] = stats
+
+        return {
+            "time": time.time(),
+            "hostapd": {"running": running, "state": radios[0]["state"]},
+            "bridge": {
+                "name": BRIDGE,
+                "operstate": read_sysfs(os.path.join(self.sysfs, BRIDGE, "operstate")),
+            },
+            "network_manager": network_manager,
+            "mode": mode,
+            "interface": iface,
+            "config": {
+                "ssid": config.ssid,
+                "channel": config.channel,
+                "band": config.band,
+                "country": config.country,
+            } if config else None,
+            "radios": radios,
+            "uplink": (self.uplink_monitor.summary() if self.uplink_monitor
+                       else {"link": uplink.link_stats(sysfs=self.sysfs)}),
+            "interfaces": interfaces,
+            "qos": self.shaping(),
+            "clients": len(stations),
+            "stations": stations,
+        }
+
+    def radios(self, running=True):
+        """[(radio, stations)] for every configured radio, main radio first
+
+        radio holds the interface, band, channel, AP state and client count.
+        """
+        try:
+            configs = hostapd_config.load_radios(self.conf)
+        except PermissionError:
+            return []
+        return [self._radio(config.interface, config, running)
+                for _, config in configs if config]
+
+    def _radio(self, iface, config, running):
+        state = None
+        if running:
+            ctrl = HostapdCtrl(iface, self.ctrl_dir)
+            try:
+                if ctrl.available():
+                    state = ctrl.status().get("state")
+            except HostapdCtrlError:
+                pass
+            finally:
+                ctrl.close()
+
+        stations = []
+        if running:
+            try:
+                reader = self.readers.get(iface)
+                if reader is None:
+                    reader = self.readers[iface] = self.reader_factory(iface)
+                stations = [dict(s.as_dict(), interface=iface) for s in reader.stations()]
+            except (OSError, subprocess.SubprocessError):
+                pass
+        return {
+            "interface": iface,
+            "band": config.band if config else None,
+            "channel": config.channel if config else None,
+            "state": state,
+            "clients": len(stations),
+        }, stations
+
+    def shaping(self):
+        """Queue and drop counters per shaped interface ({} if none is);
+        None if they cannot be read"""
+        state = qos.load_state(self.qos_state)
+        if not state:
+            return {}
+        try:
+            if self.tc is None:
+                self.tc = qos.TcStats()
+            return qos.read_stats(self.tc, state)
+        except OSError:
+            return None
+
+    def _bridge_ports(self):
+        """Wired ports enslaved to the bridge (eth0 unless it is gone)"""
+        try:
+            return sorted(os.listdir(os.path.join(self.sysfs, BRIDGE, "brif")))
+        except OSError:
+            return ["eth0"]
+
+    def _wifi_iface(self):
+        """First wireless interface in sysfs, for when the config is unreadable"""
+        try:
+            for name in sorted(os.listdir(self.sysfs)):
+                if os.path.exists(os.path.join(self.sysfs, name, "wireless")):
+                    return name
+        except OSError:
+            pass
+        return "wlan0"
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+        if self.tc:
+            self.tc.close()
+            self.tc = None
+
+
+def write_cache(snapshot, path=CACHE_FILE):
+    """Atomically replace the cached snapshot"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".status.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_cache(path=CACHE_FILE, now=None):
+    """The daemon's snapshot, or None if missing or older than three ticks"""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    if now - snapshot.get("time", 0) > 3 * snapshot.get("interval", DEFAULT_INTERVAL):
+        return None
+    return snapshot
+
+
+def each(callbacks):
+    """on_snapshot calling every callback in turn
+
+    A callback that raises is logged and the rest still run, so a failing
+    tc call in the shaper cannot leave the metrics endpoint stale.
+    """
+    def on_snapshot(snapshot):
+        for callback in callbacks:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Warning: {e}", file=sys.stderr)
+    return on_snapshot
+
+
+def run_daemon(collector, interval=DEFAULT_INTERVAL, cache=CACHE_FILE, stopped=None,
+               on_snapshot=None):
+    """Collect every interval seconds into cache until stopped is set
+
+    on_snapshot(snapshot), if given, is called after each collection.
+    """
+    stopped = stopped or threading.Event()
+    next_tick = time.monotonic()
+    while not stopped.is_set():
+        # One bad tick (a vanished interface, a failing callback) is logged
+        # and skipped; the daemon keeps its schedule
+        try:
+            snapshot = collector.collect()
+            snapshot["interval"] = interval
+            try:
+                write_cache(snapshot, cache)
+            except OSError as e:
+                print(f"Error: {e}", file=sys.stderr)
+            if on_snapshot:
+                on_snapshot(snapshot)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+        next_tick += interval
+        stopped.wait(max(0, next_tick - time.monotonic()))
+    collector.close()
+
+
+def format_status(snapshot):
+    """Human-readable status in the layout status.sh always printed"""
+    green, red, nc = "\033[0;32m", "\033[0;31m", "\033[0m"
+    lines = ["📡 WiFi Extender Status", "─────────────────────────"]
+    if snapshot["hostapd"]["running"]:
+        lines.append(f"hostapd: {green}● running{nc}")
+    else:
+        lines.append(f"hostapd: {red}● stopped{nc}")
+    if snapshot.get("mode") == "routed":
+        lines.append("mode:    routed (own subnet, NAT)")
+    elif snapshot["bridge"]["operstate"] == "up":
+        lines.append(f"bridge:  {green}● active{nc}")
+    else:
+        lines.append(f"bridge:  {red}● inactive{nc}")
+    if snapshot["network_manager"] == "NetworkManager":
+        lines.append("netmgr:  NetworkManager (Bookworm+)")
+    elif snapshot["network_manager"] == "dhcpcd":
+        lines.append("netmgr:  dhcpcd (Legacy)")
+    config = snapshot["config"]
+    if config:
+        lines.append("─────────────────────────")
+        lines.append(f"SSID:    {config['ssid']}")
+        lines.append(f"Channel: {config['channel']}")
+    radios = snapshot.get("radios", [])
+    if len(radios) > 1:
+        lines.append("─────────────────────────")
+        for radio in radios:
+            band = "5GHz" if radio["band"] == "a" else "2.4GHz"
+            dot = f"{green}●{nc}" if radio["state"] == "ENABLED" else f"{red}●{nc}"
+            lines.append(f"{radio['interface']:<8} {dot} {band:<6} ch {radio['channel']}"
+                         f"  {radio['clients']} clients")
+    elif snapshot["hostapd"]["running"]:
+        lines.append(f"Clients: {snapshot['clients']} on {snapshot['interface']}")
+    if snapshot.get("qos"):
+        lines.append(f"QoS:     {qos.format_summary(snapshot['qos'])}")
+    if snapshot.get("uplink"):
+        lines.append("─────────────────────────")
+        first, *rest = uplink.format_uplink(snapshot["uplink"]).split("\n")
+        lines.append(f"Uplink:  {first}")
+        lines.extend(f"         {line}" for line in rest)
+    return "\n".join(lines)
+
+
+def install_service(interval=DEFAULT_INTERVAL, metrics_port=None, metrics_addr=None,
+                    systemd_dir=SYSTEMD_DIR, enable=True, uplink_options=()):
+    """Install a systemd service running the collector as a daemon
+
+    uplink_options are --uplink-* arguments passed through to the daemon.
+    """
+    options = f"--daemon --interval {interval:g}"
+    if metrics_port:
+        options += f" --metrics-port {metrics_port}"
+        if metrics_addr:
+            options += f" --metrics-addr {metrics_addr}"
+    if uplink_options:
+        options += " " + " ".join(uplink_options)
+    service = f"""[Unit]
+Description=Pi WiFi Extender - status collector
+After=hostapd.service
+
+[Service]
+ExecStart={sys.executable} {os.path.join(SCRIPT_DIR, "status_collector.py")} {options}
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+    with open(os.path.join(systemd_dir, f"{SERVICE_NAME}.service"), "w") as f:
+        f.write(service)
+    if enable:
+        subprocess.run(["systemctl", "daemon-reload"], check=True, timeout=30)
+        subprocess.run(["systemctl", "enable", "--now", f"{SERVICE_NAME}.service"],
+                       check=True, timeout=30)
+
+
+def remove_service(systemd_dir=SYSTEMD_DIR):
+    path = os.path.join(systemd_dir, f"{SERVICE_NAME}.service")
+    if not os.path.exists(path):
+        return
+    subprocess.run(["systemctl", "disable", "--now", f"{SERVICE_NAME}.service"],
+                   capture_output=True, timeout=30)
+    os.remove(path)
+    subprocess.run(["systemctl", "daemon-reload"], capture_output=True, timeout=30)
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    interval = float(option("--interval", DEFAULT_INTERVAL))
+    metrics_port = option("--metrics-port")
+    metrics_addr = option("--metrics-addr")
+    uplink_options = []
+    for name in ("--uplink-interval", "--uplink-target", "--uplink-method"):
+        value = option(name)
+        if value is not None:
+            uplink_options += [name, value]
+    uplink_args = dict(zip(uplink_options[::2], uplink_options[1::2]))
+
+    try:
+        if "--install-service" in args:
+            install_service(interval, metrics_port, metrics_addr,
+                            uplink_options=uplink_options)
+            return 0
+        if "--remove-service" in args:
+            remove_service()
+            return 0
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    collector = StatusCollector()
+    if "--daemon" in args:
+        # In routed mode clients are on the AP interface and the gateway on the uplink
+        ap = routed.current()
+        try:
+            client_roster.DhcpSnooper(iface=ap.iface if ap else BRIDGE,
+                                      on_update=collector.roster.invalidate).start()
+        except OSError as e:
+            print(f"Warning: not snooping DHCP hostnames: {e}", file=sys.stderr)
+        uplink_interval = float(uplink_args.get("--uplink-interval", uplink.DEFAULT_INTERVAL))
+        if uplink_interval > 0:
+            try:
+                collector.uplink_monitor = uplink.UplinkMonitor(
+                    uplink_args.get("--uplink-target"),
+                    uplink_args.get("--uplink-method", "icmp"), uplink_interval,
+                    bridge=ap.uplink if ap else BRIDGE).start()
+            except (OSError, ValueError) as e:
+                print(f"Warning: not probing the uplink: {e}", file=sys.stderr)
+        # Re-shape as clients come and go, then publish the snapshot
+        callbacks = [qos.Shaper().update]
+        if metrics_port:
+            import metrics
+            try:
+                server = metrics.MetricsServer(metrics_addr or metrics.DEFAULT_ADDR,
+                                               int(metrics_port)).start()
+            except OSError as e:
+                print(f"Error: metrics endpoint: {e}", file=sys.stderr)
+                return 1
+            callbacks.append(server.update)
+        run_daemon(collector, interval, on_snapshot=each(callbacks))
+        return 0
+
+    snapshot = None if "--fresh" in args else read_cache()
+    if snapshot is None:
+        snapshot = collector.collect()
+        collector.close()
+    if "--json" in args:
+        print(json.dumps(snapshot, indent=2))
+    else:
+        print(format_status(snapshot))
+        if "--clients" in args and snapshot["stations"]:
+            print("─────────────────────────")
+            print("\n".join(client_roster.format_roster(snapshot["stations"])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,239 @@
+"""
+Pi WiFi Extender - Event-driven status
+Follows hostapd control-socket events and systemd unit state changes and
+reports status deltas, so the GUI never has to poll or fork to stay current.
+"""
+
+import socket
+
+try:
+    from gi.repository import GLib, Gio
+except ImportError:  # Headless use and tests
+    GLib = Gio = None
+
+from hostapd_ctrl import CTRL_DIR, HostapdCtrl, HostapdCtrlError
+
+SYSTEMD_BUS = "org.freedesktop.systemd1"
+SYSTEMD_PATH = "/org/freedesktop/systemd1"
+SYSTEMD_MANAGER = "org.freedesktop.systemd1.Manager"
+SYSTEMD_UNIT = "org.freedesktop.systemd1.Unit"
+DBUS_PROPERTIES = "org.freedesktop.DBus.Properties"
+
+
+class StatusMonitor:
+    """Tracks AP status and reports what changed to on_change(delta)
+
+    The delta is a dict holding only the fields that changed, out of
+    hostapd_active, ap_enabled and clients.
+    """
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.hostapd_active = None
+        self.ap_enabled = None
+        self.stations = frozenset()
+
+    def snapshot(self):
+        return {
+            "hostapd_active": self.hostapd_active,
+            "ap_enabled": self.ap_enabled,
+            "clients": len(self.stations),
+        }
+
+    def _apply(self, **changes):
+        before = self.snapshot()
+        for key, value in changes.items():
+            setattr(self, key, value)
+        after = self.snapshot()
+        delta = {k: v for k, v in after.items() if before[k] != v}
+        if delta:
+            self.on_change(delta)
+        return delta
+
+    def unit_changed(self, active_state):
+        """Handle a systemd ActiveState value for the hostapd unit"""
+        if active_state == "active":
+            return self._apply(hostapd_active=True)
+        if active_state in ("activating", "reloading", "deactivating"):
+            return {}
+        return self._apply(hostapd_active=False, ap_enabled=False,
+                           stations=frozenset())
+
+    def attached(self, enabled, stations):
+        """Seed state from a freshly attached control socket"""
+        return self._apply(hostapd_active=True, ap_enabled=enabled,
+                           stations=frozenset(stations))
+
+    def hostapd_event(self, message):
+        """Handle one hostapd event line, e.g. 'AP-STA-CONNECTED <mac>'"""
+        parts = message.split()
+        if not parts:
+            return {}
+        name = parts[0]
+        if name == "AP-STA-CONNECTED" and len(parts) > 1:
+            return self._apply(stations=self.stations | {parts[1]})
+        if name == "AP-STA-DISCONNECTED" and len(parts) > 1:
+            return self._apply(stations=self.stations - {parts[1]})
+        if name == "AP-ENABLED":
+            return self._apply(ap_enabled=True)
+        if name == "AP-DISABLED":
+            return self._apply(ap_enabled=False, stations=frozenset())
+        return {}
+
+
+class HostapdEvents:
+    """Control socket attached to hostapd for unsolicited events"""
+
+    def __init__(self, iface="wlan0", ctrl_dir=CTRL_DIR):
+        self.iface = iface
+        self.ctrl_dir = ctrl_dir
+        self.ctrl = None
+
+    def attach(self):
+        """Attach and return (AP enabled, associated stations)"""
+        self.close()
+        with HostapdCtrl(self.iface, self.ctrl_dir) as ctrl:
+            enabled = ctrl.status().get("state") == "ENABLED"
+            stations = ctrl.stations()
+        self.ctrl = HostapdCtrl(self.iface, self.ctrl_dir).open()
+        if self.ctrl.request("ATTACH").strip() != "OK":
+            self.close()
+            raise HostapdCtrlError("ATTACH was not acknowledged")
+        self.ctrl.sock.setblocking(False)
+        return enabled, stations
+
+    def fileno(self):
+        return self.ctrl.fileno()
+
+    def read(self):
+        """Drain pending events, with the '<level>' prefix removed"""
+        events = []
+        while self.ctrl:
+            try:
+                data = self.ctrl.sock.recv(4096)
+            except (BlockingIOError, socket.timeout):
+                break
+            except OSError:
+                self.close()
+                break
+            message = data.decode(errors="replace").strip()
+            if message.startswith("<") and ">" in message:
+                events.append(message.split(">", 1)[1])
+        return events
+
+    def close(self):
+        if self.ctrl:
+            self.ctrl.close()
+            self.ctrl = None
+
+
+class StatusWatcher:
+    """Feeds a StatusMonitor from the GLib main loop
+
+    Subscribes to the hostapd unit's ActiveState over D-Bus and watches the
+    attached hostapd control socket with an IO watch. Nothing is forked and
+    no thread is started. on_attach_failed is called if hostapd is running
+    without a usable control socket (e.g. no ctrl_interface in its config).
+    """
+
+    ATTACH_RETRY_MS = 500
+    ATTACH_ATTEMPTS = 20
+
+    def __init__(self, monitor, iface="wlan0", ctrl_dir=CTRL_DIR,
+                 unit="hostapd.service", on_attach_failed=None):
+        self.monitor = monitor
+        self.on_attach_failed = on_attach_failed
+        self.events = HostapdEvents(iface, ctrl_dir)
+        self.unit = unit
+        self.bus = None
+        self.subscription = None
+        self.io_watch = None
+        self.retry_source = None
+        self.attempts = 0
+
+    def start(self):
+        """Start watching; raises if D-Bus or GLib are unavailable"""
+        if Gio is None:
+            raise RuntimeError("PyGObject is required for status events")
+        self.bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        self._call(SYSTEMD_PATH, SYSTEMD_MANAGER, "Subscribe")
+        path = self._call(SYSTEMD_PATH, SYSTEMD_MANAGER, "LoadUnit",
+                          GLib.Variant("(s)", (self.unit,)))[0]
+        self.subscription = self.bus.signal_subscribe(
+            SYSTEMD_BUS, DBUS_PROPERTIES, "PropertiesChanged", path, None,
+            Gio.DBusSignalFlags.NONE, self._on_properties_changed
+        )
+        state = self._call(path, DBUS_PROPERTIES, "Get",
+                           GLib.Variant("(ss)", (SYSTEMD_UNIT, "ActiveState")))[0]
+        self.monitor.unit_changed(state)
+        if state == "active":
+            self._schedule_attach()
+
+    def stop(self):
+        self._detach()
+        if self.retry_source:
+            GLib.source_remove(self.retry_source)
+            self.retry_source = None
+        if self.subscription is not None:
+            self.bus.signal_unsubscribe(self.subscription)
+            self.subscription = None
+
+    def _call(self, path, interface, method, params=None):
+        result = self.bus.call_sync(
+            SYSTEMD_BUS, path, interface, method, params, None,
+            Gio.DBusCallFlags.NONE, -1, None
+        )
+        return result.unpack() if result else ()
+
+    def _on_properties_changed(self, conn, sender, path, interface, signal, params):
+        iface, changed, invalidated = params.unpack()
+        if iface != SYSTEMD_UNIT or "ActiveState" not in changed:
+            return
+        state = changed["ActiveState"]
+        self.monitor.unit_changed(state)
+        if state == "active":
+            self._schedule_attach()
+        elif state in ("inactive", "failed"):
+            self._detach()
+
+    def _schedule_attach(self):
+        # hostapd creates its control socket shortly after the unit is active
+        self.attempts = 0
+        if not self.retry_source and self._try_attach():
+            self.retry_source = GLib.timeout_add(self.ATTACH_RETRY_MS, self._try_attach)
+
+    def _try_attach(self):
+        """Attach to hostapd; returns True while another attempt is needed"""
+        self._detach()
+        self.attempts += 1
+        try:
+            enabled, stations = self.events.attach()
+        except HostapdCtrlError:
+            if self.attempts < self.ATTACH_ATTEMPTS:
+                return True
+            self.retry_source = None
+            if self.on_attach_failed:
+                self.on_attach_failed()
+            return False
+        self.monitor.attached(enabled, stations)
+        self.io_watch = GLib.io_add_watch(
+            self.events.fileno(), GLib.PRIORITY_DEFAULT,
+            GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self._on_io
+        )
+        self.retry_source = None
+        return False
+
+    def _on_io(self, fd, condition):
+        for message in self.events.read():
+            self.monitor.hostapd_event(message)
+        if condition & (GLib.IO_HUP | GLib.IO_ERR) or not self.events.ctrl:
+            self.io_watch = None
+            self.events.close()
+            return False
+        return True
+
+    def _detach(self):
+        if self.io_watch:
+            GLib.source_remove(self.io_watch)
+            self.io_watch = None
+        self.events.close()
@@ -64,11 +64,14 @@ else
 fi
 
 # Test: Python syntax is valid
-if python3 -m py_compile "$SCRIPT_DIR/settings-gui.py" 2>/dev/null; then
-    pass "settings-gui.py has valid Python syntax"
-else
-    fail "settings-gui.py has syntax errors"
-fi
+for path in "$SCRIPT_DIR"/*.py; do
+    script=$(basename "$path")
+    if python3 -m py_compile "$path" 2>/dev/null; then
+        pass "$script has valid Python syntax"
+    else
+        fail "$script has syntax errors"
+    fi
+done
 
 # Test: Python imports work (GTK may not be available)
 if python3 -c "import subprocess, os" 2>/dev/null; then
@@ -78,7 +81,7 @@ else
 fi
 
 # Test: Shell scripts have valid syntax
-for script in setup.sh uninstall.sh status.sh install-to-sdcard.sh; do
+for script in setup.sh uninstall.sh status.sh install-to-sdcard.sh stages.sh; do
     if bash -n "$SCRIPT_DIR/$script" 2>/dev/null; then
         pass "$script has valid bash syntax"
     else
@@ -86,6 +89,1422 @@ for script in setup.sh uninstall.sh status.sh install-to-sdcard.sh; do
     fi
 done
 
+# Test: hostapd config engine caches reads and writes minimal diffs atomically
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, stat, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import hostapd_config
+
+tmp = tempfile.mkdtemp()
+conf = os.path.join(tmp, "hostapd.conf")
+with open(conf, "w") as f:
+    f.write("# site notes\nssid=Old\nchannel=6\nmacaddr_acl=0\nieee80211ac=1\n")
+config = hostapd_config.load(conf)
+assert config.ssid == "Old" and config.channel == 6
+assert conf in hostapd_config._cache
+config.set("ssid", "Mutated")  # Callers get copies, not the cached parse
+assert hostapd_config.load(conf).ssid == "Old"
+
+new = hostapd_config.render("New", "Password1", 11, "IE", "g")
+merged = hostapd_config.merge(config, new)
+text = merged.text()
+assert text.startswith("# site notes\nssid=New\nchannel=11\nmacaddr_acl=0\n"), text
+assert "ieee80211ac" not in text
+assert "channel" in hostapd_config.diff(config, merged)
+assert hostapd_config.save(merged, conf)
+assert stat.S_IMODE(os.stat(conf).st_mode) == 0o600
+assert not hostapd_config.save(merged, conf)  # Unchanged: no write
+assert hostapd_config.load(conf).ssid == "New"
+assert os.listdir(tmp) == ["hostapd.conf"]
+assert not hostapd_config.load(os.path.join(tmp, "missing.conf"))
+EOF
+then
+    pass "hostapd config engine caches and writes minimal diffs"
+else
+    fail "hostapd config engine should cache reads and write minimal diffs"
+fi
+
+# Test: live_apply reloads changed settings over a fake control socket
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, live_apply
+from hostapd_ctrl import FakeHostapd, HostapdCtrl
+
+tmp = tempfile.mkdtemp()
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Old", "Password1", 6, "IE", "g"), conf)
+with FakeHostapd(os.path.join(tmp, "ctrl")) as fake:
+    fake.reload_delay = 0.2
+    new = hostapd_config.render("New", "Password1", 11, "IE", "g")
+    action, changed, downtime = live_apply.apply_config(
+        new, conf, HostapdCtrl(ctrl_dir=fake.ctrl_dir))
+    assert action == "reload" and changed == ["channel", "ssid"], (action, changed)
+    assert 0.2 <= downtime < 5, downtime
+    assert "RELOAD" in fake.commands
+assert hostapd_config.load(conf).ssid == "New"
+old = new.as_dict()
+assert live_apply.plan_changes(old, dict(old, country_code="GB"))[0] == "restart"
+assert live_apply.plan_changes(old, dict(old, bridge="br1"))[0] == "setup"
+assert live_apply.plan_changes({}, old)[0] == "setup"
+EOF
+then
+    pass "live_apply reloads only changed settings"
+else
+    fail "live_apply should reload changed settings over the control socket"
+fi
+
+# Test: status events follow a fake hostapd without polling
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, select, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+from hostapd_ctrl import FakeHostapd
+from status_events import HostapdEvents, StatusMonitor
+
+deltas = []
+monitor = StatusMonitor(deltas.append)
+with FakeHostapd(os.path.join(tempfile.mkdtemp(), "ctrl")) as fake:
+    fake.stations = ["aa:bb:cc:00:00:01"]
+    events = HostapdEvents(ctrl_dir=fake.ctrl_dir)
+    monitor.attached(*events.attach())
+    assert deltas[-1] == {"hostapd_active": True, "ap_enabled": True, "clients": 1}, deltas
+    fake.emit("AP-STA-CONNECTED aa:bb:cc:00:00:02")
+    fake.emit("AP-STA-DISCONNECTED aa:bb:cc:00:00:01")
+    fake.emit("AP-DISABLED")
+    received = []
+    while len(received) < 3 and select.select([events], [], [], 2)[0]:
+        received += events.read()
+    for message in received:
+        monitor.hostapd_event(message)
+    events.close()
+assert deltas[1:] == [{"clients": 2}, {"clients": 1}, {"ap_enabled": False, "clients": 0}], deltas
+assert monitor.unit_changed("failed") == {"hostapd_active": False}
+
+# The socket group (netdev on a real AP) lets a non-root user attach
+import hostapd_config
+assert f"ctrl_interface_group={hostapd_config.CTRL_GROUP}" in \
+    hostapd_config.render("Net", "Password1", 6, "IE", "g").text()
+if os.geteuid() == 0:
+    base = tempfile.mkdtemp()
+    os.chmod(base, 0o755)
+    with FakeHostapd(os.path.join(base, "ctrl"), group=4242) as fake:
+        def attach_as_nobody(groups):
+            pid = os.fork()
+            if pid == 0:
+                os.setgroups(groups)
+                os.setgid(65534)
+                os.setuid(65534)
+                try:
+                    HostapdEvents(ctrl_dir=fake.ctrl_dir).attach()
+                    os._exit(0)
+                except Exception:
+                    os._exit(1)
+            return os.waitpid(pid, 0)[1] == 0
+        assert attach_as_nobody([4242]) and not attach_as_nobody([])
+EOF
+then
+    pass "status events track hostapd state changes"
+else
+    fail "status events should track hostapd state changes"
+fi
+
+# Test: station stats parse recorded dumps and nl80211 attributes
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, struct, sys
+sys.path.insert(0, sys.argv[1])
+import station_stats as ss
+
+with open(os.path.join(sys.argv[1], "testdata", "station-dump.txt")) as f:
+    stations = ss.parse_station_dump(f.read())
+assert [s.mac for s in stations] == ["3c:22:fb:12:34:56", "a4:83:e7:ab:cd:ef"]
+first = stations[0]
+assert (first.signal, first.signal_avg, first.tx_bitrate, first.rx_bitrate) == (-42, -43, 72.2, 65.0)
+assert (first.tx_bytes, first.tx_retries, first.inactive_ms, first.connected_s) == (190143355, 1204, 304, 3612)
+
+rate = ss._attr(ss.RATE_BITRATE32, struct.pack("I", 866))
+info = (ss._attr(ss.STA_SIGNAL, struct.pack("b", -55))
+        + ss._attr(ss.STA_RX_BYTES, struct.pack("I", 1))
+        + ss._attr(ss.STA_RX_BYTES64, struct.pack("Q", 5 << 32))
+        + ss._attr(ss.STA_TX_BITRATE | ss.NLA_F_NESTED, rate))
+station = ss._station_from_attrs("aa:bb:cc:dd:ee:ff", info)
+assert (station.signal, station.rx_bytes, station.tx_bitrate) == (-55, 5 << 32, 86.6)
+EOF
+then
+    pass "station_stats parses dumps and netlink attributes"
+else
+    fail "station_stats should parse dumps and netlink attributes"
+fi
+
+# Test: throughput sampler turns counter deltas into bounded per-client rates
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import sys
+sys.path.insert(0, sys.argv[1])
+from station_stats import Station
+from throughput import ThroughputSampler
+
+sampler = ThroughputSampler(history=4)
+assert sampler.sample([Station("a", rx_bytes=0, tx_bytes=0)], now=0) == []
+for t in range(1, 11):
+    rows = sampler.sample([Station("a", rx_bytes=t * 125000, tx_bytes=t * t * 125000)], now=t)
+assert (round(rows[0].down, 3), round(rows[0].up, 3)) == (19.0, 1.0), rows
+assert round(rows[0].peak, 3) == 20.0 and round(rows[0].average, 3) == 17.0, rows
+history = sampler.histories["a"]
+assert history.count == 4 and len(history.down) == 4
+# A counter reset (re-association) is skipped rather than read as negative
+assert sampler.sample([Station("a", rx_bytes=0, tx_bytes=0)], now=11)[0].down == rows[0].down
+assert sampler.sample([], now=11) == [] and not sampler.histories
+EOF
+then
+    pass "throughput sampler computes bounded per-client rates"
+else
+    fail "throughput sampler should compute bounded per-client rates"
+fi
+
+# Test: log sink batches, caps and rotates its history
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+from log_sink import LogSink
+
+history = os.path.join(tempfile.mkdtemp(), "gui.log")
+sink = LogSink(max_lines=3, history_file=history, history_bytes=64, history_backups=2)
+assert sink.write("one") is True and sink.write("two") is False
+assert sink.drain() == "one\ntwo\n" and sink.drain() == ""
+for i in range(10):
+    sink.write(f"line {i}")
+assert sink.drain() == "... 7 earlier lines not shown\nline 7\nline 8\nline 9\n"
+for i in range(20):
+    sink.write(f"more {i}")
+    sink.drain()
+sink.close()
+assert os.path.exists(history + ".1") and os.path.exists(history + ".2")
+assert not os.path.exists(history + ".3") and os.path.getsize(history) < 64
+
+# A full disk drops the history; the producer and the view carry on
+class FullDisk:
+    def write(self, *args):
+        raise OSError(28, "No space left on device")
+    flush = close = write
+sink = LogSink(history_file=history)
+sink.history.file.close()
+sink.history.file = FullDisk()
+assert sink.write("kept") is True and sink.history is None
+assert sink.drain() == "kept\n"
+sink.close()
+EOF
+then
+    pass "log sink batches, caps and rotates"
+else
+    fail "log sink should batch, cap and rotate"
+fi
+
+# Test: channel scorer picks the least congested channel from a recorded scan
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import channel_scan as cs
+
+with open(os.path.join(sys.argv[1], "testdata", "scan-dump.txt")) as f:
+    bsses = cs.parse_scan(f.read())
+assert [b.channel for b in bsses] == [1, 6, 6, 11, 36], bsses
+assert bsses[2].occupied() == [6, 10] and bsses[4].occupied() == [36, 40, 44, 48]
+scores = cs.score_channels(bsses, "g", "IE")
+assert scores[0][0] == 13 and scores[-1][0] == 6, scores
+assert cs.score_channels(bsses, "g", "US")[0][0] == 11
+assert cs.best_channel(bsses, "a") == 149
+assert cs.best_channel([], "g") == 1
+assert not cs.should_switch(scores, 13) and cs.should_switch(scores, 6)
+systemd = tempfile.mkdtemp()
+cs.install_timer("wlan0", "g", "IE", systemd_dir=systemd, enable=False)
+assert cs.timer_installed(systemd)
+EOF
+then
+    pass "channel scorer ranks channels from a recorded scan"
+else
+    fail "channel scorer should rank channels from a recorded scan"
+fi
+
+# Test: capability probe generates HT/VHT lines from recorded phy dumps
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys
+sys.path.insert(0, sys.argv[1])
+import phy_caps
+
+def caps(chipset, channel, band):
+    with open(os.path.join(sys.argv[1], "testdata", f"phy-{chipset}.txt")) as f:
+        return phy_caps.capability_lines(phy_caps.parse_phy(f.read()), channel, band)
+
+pi4 = caps("brcmfmac-pi4", 36, "a")
+assert pi4 == ["ht_capab=[HT40+][SHORT-GI-20][SHORT-GI-40]", "ieee80211ac=1",
+               "vht_capab=[SHORT-GI-80][SU-BEAMFORMEE]", "vht_oper_chwidth=1",
+               "vht_oper_centr_freq_seg0_idx=42"], pi4
+assert caps("brcmfmac-pi4", 6, "g") == ["ht_capab=[SHORT-GI-20]"]
+mt = caps("mt7612u", 153, "a")
+assert mt[0] == "ht_capab=[LDPC][HT40-][SHORT-GI-20][SHORT-GI-40][TX-STBC][RX-STBC1]", mt
+assert "vht_oper_centr_freq_seg0_idx=155" in mt
+assert caps("rtl8188eu", 6, "g") == ["ht_capab=[SHORT-GI-20][MAX-AMSDU-7935]"]
+assert caps("rtl8188eu", 36, "a") == []
+assert caps("mt7612u", "", "a") == [] and caps("mt7612u", "auto", "a") == []
+EOF
+then
+    pass "phy_caps generates capabilities from recorded phy dumps"
+else
+    fail "phy_caps should generate capabilities from recorded phy dumps"
+fi
+
+# Test: channel timer regenerates HT/VHT lines when it moves the AP
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import contextlib, io, os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import channel_scan as cs, hostapd_config, phy_caps
+
+with open(os.path.join(sys.argv[1], "testdata", "phy-mt7612u.txt")) as f:
+    bands = phy_caps.parse_phy(f.read())
+probe = lambda iface, channel, band, country=None: phy_caps.capability_lines(bands, channel, band)
+conf = os.path.join(tempfile.mkdtemp(), "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "password1", 36, "IE", "a", "wlan0",
+                                          probe("wlan0", 36, "a")), conf)
+applied = []
+
+def apply(config, path):
+    applied.append(hostapd_config.merge(hostapd_config.load(path), config))
+    return "reload", [], 0.5
+
+with contextlib.redirect_stdout(io.StringIO()):
+    assert cs.apply_best([(153, 0.0), (36, 9.0)], conf, probe, apply) == 0
+new = applied[0]
+assert new.channel == 153 and new.ssid == "Net" and new.bridge == "br0", new.text()
+assert new.get("ht_capab") == "[LDPC][HT40-][SHORT-GI-20][SHORT-GI-40][TX-STBC][RX-STBC1]"
+assert new.get("vht_oper_centr_freq_seg0_idx") == "155", new.text()
+# Without a phy probe the stale 80 MHz lines go rather than being kept
+applied.clear()
+with contextlib.redirect_stdout(io.StringIO()):
+    cs.apply_best([(153, 0.0), (36, 9.0)], conf, lambda *a: [], apply)
+assert applied[0].get("ht_capab") is None and applied[0].get("vht_oper_chwidth") is None
+assert applied[0].get("ieee80211ac") == "1"
+EOF
+then
+    pass "channel timer regenerates HT/VHT lines for the new channel"
+else
+    fail "channel timer should regenerate HT/VHT lines for the new channel"
+fi
+
+# Test: privileged helper runs typed operations over one connection
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+from privileged_helper import HelperClient, HelperError, HelperServer, MockBackend
+
+path = os.path.join(tempfile.mkdtemp(), "helper.sock")
+backend = MockBackend()
+asked = []
+def authorize(pid, uid):
+    asked.append(pid)
+    return len(asked) == 1  # Only the first connection is allowed
+
+with HelperServer(backend, path, authorize=authorize):
+    client = HelperClient(path)
+    assert client.call("ping") == "pong" and not asked  # Read-only: no auth
+    lines = []
+    result = client.call("apply_config", lines.append, ssid="Net", password="Password1")
+    assert result["action"] == "reload" and lines, (result, lines)
+    client.call("restart_ap")
+    client.call("revert", lines.append)
+    assert asked == [os.getpid()], asked  # Authorised once per connection
+    assert [c[0] for c in backend.calls] == ["apply_config", "restart_ap", "revert"]
+    backend.needs_setup = True
+    try:
+        client.call("apply_config", ssid="Net", password="Password1")
+        raise AssertionError("expected setup to be needed")
+    except HelperError as e:
+        assert e.code == 3
+    try:
+        client.call("format_disk")
+        raise AssertionError("unknown op accepted")
+    except HelperError:
+        pass
+    client.close()
+
+    other = HelperClient(path)
+    try:
+        other.call("reboot")
+        raise AssertionError("unauthorised call accepted")
+    except HelperError as e:
+        assert e.code == 126
+    assert ("reboot", {}) not in backend.calls
+    other.close()
+
+# Station stats are open to anyone, so only configured radios are read
+import hostapd_config
+from privileged_helper import SystemBackend
+conf = os.path.join(tempfile.mkdtemp(), "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "Password1", 6, "IE", "g"), conf)
+system = SystemBackend(conf)
+for iface in ("wlan7", "../../etc"):
+    try:
+        system.station_stats(None, iface)
+        raise AssertionError(f"{iface} accepted")
+    except HelperError as e:
+        assert "wlan0" not in str(e) and not system.readers, e
+EOF
+then
+    pass "privileged helper runs operations and authorises once"
+else
+    fail "privileged helper should run operations and authorise once per connection"
+fi
+
+# Test: status collector gathers a snapshot from fake sysfs, /proc and hostapd
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import json, os, sys, tempfile, time
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, status_collector
+from hostapd_ctrl import FakeHostapd
+from station_stats import Station
+
+tmp = tempfile.mkdtemp()
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "Password1", 11, "IE", "g", iface="wlan1"), conf)
+sysfs = os.path.join(tmp, "net")
+proc = os.path.join(tmp, "proc")
+os.makedirs(os.path.join(sysfs, "br0"))
+with open(os.path.join(sysfs, "br0", "operstate"), "w") as f:
+    f.write("up\n")
+for pid, comm in (("1", "systemd"), ("412", "hostapd"), ("530", "NetworkManager")):
+    os.makedirs(os.path.join(proc, pid))
+    with open(os.path.join(proc, pid, "comm"), "w") as f:
+        f.write(comm + "\n")
+
+class Reader:
+    def __init__(self, iface):
+        assert iface == "wlan1", iface  # Interface comes from the config
+    def stations(self):
+        return [Station("aa:bb:cc:dd:ee:01", signal=-50)]
+    def close(self):
+        pass
+
+with FakeHostapd(os.path.join(tmp, "ctrl"), "wlan1") as fake:
+    collector = status_collector.StatusCollector(conf, sysfs, proc, fake.ctrl_dir, Reader)
+    snap = collector.collect()
+assert snap["hostapd"] == {"running": True, "state": "ENABLED"}, snap["hostapd"]
+assert snap["bridge"]["operstate"] == "up"
+assert snap["network_manager"] == "NetworkManager"
+assert snap["config"]["ssid"] == "Net" and snap["config"]["channel"] == 11
+assert "Password1" not in json.dumps(snap)
+assert snap["clients"] == 1 and snap["interface"] == "wlan1"
+assert "Clients: 1 on wlan1" in status_collector.format_status(snap)
+
+cache = os.path.join(tmp, "run", "status.json")
+snap["interval"] = 5
+status_collector.write_cache(snap, cache)
+assert status_collector.read_cache(cache)["clients"] == 1
+assert status_collector.read_cache(cache, now=time.time() + 60) is None  # Stale
+
+# A failing collection or callback skips that tick, not the daemon
+import contextlib, io, threading
+stopped, ticks = threading.Event(), []
+
+class Flaky:
+    def collect(self):
+        ticks.append(len(ticks))
+        if len(ticks) == 1:
+            raise OSError("wlan1 vanished")
+        return {"clients": len(ticks)}
+    def close(self):
+        pass
+
+def on_snapshot(snapshot):
+    if snapshot["clients"] == 2:
+        raise ValueError("callback failed")
+    stopped.set()
+
+with contextlib.redirect_stderr(io.StringIO()) as err:
+    status_collector.run_daemon(Flaky(), 0.01, cache, stopped, on_snapshot)
+assert len(ticks) == 3 and "vanished" in err.getvalue() and "callback" in err.getvalue()
+
+# A failing shaper still lets the metrics callback see every snapshot
+published = []
+def shaper(snapshot):
+    raise RuntimeError("tc failed")
+with contextlib.redirect_stderr(io.StringIO()) as err:
+    status_collector.each([shaper, published.append])({"clients": 1})
+assert published == [{"clients": 1}] and "tc failed" in err.getvalue()
+EOF
+then
+    pass "status collector snapshots state without forking"
+else
+    fail "status collector should snapshot state from sysfs, /proc and hostapd"
+fi
+
+# Test: metrics endpoint serves cached counters from a fake sysfs tree
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile, urllib.request
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, metrics, status_collector
+from station_stats import Station
+
+tmp = tempfile.mkdtemp()
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "Password1", 6, "IE", "g"), conf)
+sysfs = os.path.join(tmp, "net")
+for name, base in (("br0", 1000), ("eth0", 2000), ("wlan0", 3000)):
+    os.makedirs(os.path.join(sysfs, name, "statistics"))
+    for i, counter in enumerate(status_collector.STAT_COUNTERS):
+        with open(os.path.join(sysfs, name, "statistics", counter), "w") as f:
+            f.write(f"{base + i}\n")
+os.makedirs(os.path.join(sysfs, "br0", "brif", "eth0"))
+with open(os.path.join(sysfs, "br0", "operstate"), "w") as f:
+    f.write("up\n")
+os.makedirs(os.path.join(tmp, "proc", "7"))
+with open(os.path.join(tmp, "proc", "7", "comm"), "w") as f:
+    f.write("hostapd\n")
+
+reads = []
+class Reader:
+    def __init__(self, iface):
+        pass
+    def stations(self):
+        reads.append(1)
+        return [Station("aa:bb:cc:dd:ee:01", signal=-48, tx_bitrate=144.4, tx_bytes=5000)]
+    def close(self):
+        pass
+
+collector = status_collector.StatusCollector(conf, sysfs, os.path.join(tmp, "proc"),
+                                             os.path.join(tmp, "ctrl"), Reader)
+server = metrics.MetricsServer("127.0.0.1", 0).start()
+try:
+    server.update(collector.collect())
+    url = f"http://127.0.0.1:{server.port}/metrics"
+    for _ in range(5):  # Scrapes reuse the rendered snapshot
+        text = urllib.request.urlopen(url, timeout=5).read().decode()
+    assert len(reads) == 1, reads
+finally:
+    server.stop()
+assert "wifi_extender_hostapd_up 1" in text
+assert "wifi_extender_bridge_up{bridge=\"br0\"} 1" in text
+assert 'wifi_extender_interface_receive_bytes_total{interface="eth0"} 2000' in text
+assert 'wifi_extender_interface_transmit_drop_total{interface="wlan0"} 3005' in text
+assert "wifi_extender_stations 1" in text
+assert 'wifi_extender_station_signal_dbm{mac="aa:bb:cc:dd:ee:01",interface="wlan0"} -48' in text
+assert 'wifi_extender_station_transmit_bytes_total{mac="aa:bb:cc:dd:ee:01",interface="wlan0"} 5000' in text
+assert "# TYPE wifi_extender_interface_receive_bytes_total counter" in text
+EOF
+then
+    pass "metrics endpoint serves cached AP, interface and station counters"
+else
+    fail "metrics endpoint should serve cached counters in Prometheus format"
+fi
+
+# Test: refresh worker coalesces requests, runs probes concurrently, backs off
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import sys, threading
+sys.path.insert(0, sys.argv[1])
+from refresh_worker import RefreshWorker
+
+# Each probe waits until all three have started, so they must run in parallel
+started = {name: threading.Event() for name in "abc"}
+def together(name, value):
+    def probe():
+        started[name].set()
+        assert all(e.wait(5) for e in started.values())
+        return value
+    return probe
+
+results = []
+delivered = threading.Semaphore(0)
+def deliver(result):
+    results.append(result)
+    delivered.release()
+
+worker = RefreshWorker({n: together(n, v) for n, v in zip("abc", (1, 2, 3))}, deliver,
+                       interval=None).start()
+worker.request()
+assert delivered.acquire(timeout=5)
+assert results == [{"a": 1, "b": 2, "c": 3}], results
+worker.stop()
+
+# Requests during a run still get that run's result, then one more run
+results.clear()
+entered, proceed, calls = threading.Semaphore(0), threading.Semaphore(0), []
+def gated():
+    calls.append(len(calls) + 1)
+    entered.release()
+    assert proceed.acquire(timeout=5)
+    return len(calls)
+
+worker = RefreshWorker({"g": gated}, deliver, interval=None, probe_timeout=10).start()
+worker.request()
+assert entered.acquire(timeout=5)
+for _ in range(20):  # A burst of requests while the run is in flight
+    worker.request()
+proceed.release()
+assert entered.acquire(timeout=5)  # The single coalesced follow-up run
+assert results == [{"g": 1}], results  # Delivered before the follow-up ran
+proceed.release()
+assert delivered.acquire(timeout=5) and delivered.acquire(timeout=5)
+with worker.cond:
+    assert worker.requested == worker.completed and worker.runs == 2, worker.runs
+assert results == [{"g": 1}, {"g": 2}], results
+worker.stop()
+
+# An overrunning probe reports None and is not started again behind itself
+release, slow_calls = threading.Event(), []
+def slow():
+    slow_calls.append(1)
+    release.wait(5)
+    return "late"
+
+results.clear()
+worker = RefreshWorker({"slow": slow}, deliver, interval=None, probe_timeout=0.05).start()
+for _ in range(3):
+    worker.request()
+    assert delivered.acquire(timeout=5)
+assert [r["slow"] for r in results] == [None] * 3 and len(slow_calls) == 1, slow_calls
+release.set()
+worker.stop()
+
+# Periodic refreshes double their interval while hidden and reset when shown
+ticked = threading.Semaphore(0)
+worker = RefreshWorker({"x": lambda: 1}, lambda r: ticked.release(),
+                       interval=0.05, max_hidden_interval=0.4)
+worker.set_visible(False)
+worker.start()
+assert ticked.acquire(timeout=5) and ticked.acquire(timeout=5)
+assert worker.interval > 0.05, worker.interval
+worker.set_visible(True)
+assert worker.interval == 0.05
+worker.stop()
+
+# Stopping while the loop is about to submit a run never kills the loop
+errors = []
+threading.excepthook = lambda args: errors.append(args.exc_value)
+worker = RefreshWorker({"x": lambda: 1, "y": lambda: 2}, lambda r: None, interval=None)
+submit = worker.pool.submit
+def stop_then_submit(fn):  # stop() lands between two submits of a run
+    worker.stop()
+    return submit(fn)
+worker.pool.submit = stop_then_submit
+worker.start().request()
+worker.thread.join(2)
+assert not worker.thread.is_alive() and not errors, errors
+RefreshWorker({"x": lambda: 1}, lambda r: None).stop()  # Never started
+EOF
+then
+    pass "refresh worker coalesces, parallelises and backs off"
+else
+    fail "refresh worker should coalesce requests and back off while hidden"
+fi
+
+# Test: GUI startup cache round-trips status and times milestones
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import io, os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import status_cache
+
+path = os.path.join(tempfile.mkdtemp(), "gui-status.json")
+assert status_cache.load(path) is None
+state = {"hostapd_active": True, "ssid": "Net", "clients": 2}
+saved = status_cache.save(state, path)
+assert status_cache.load(path) == saved and saved["ssid"] == "Net"
+mtime = os.stat(path).st_mtime_ns
+assert status_cache.save(dict(state), path, previous=saved) is saved  # Unchanged
+assert os.stat(path).st_mtime_ns == mtime
+assert status_cache.save(dict(state, clients=3), path, previous=saved)["clients"] == 3
+assert status_cache.age_text(1000, now=1030) == "just now"
+assert status_cache.age_text(1000, now=1000 + 7200) == "2 h ago"
+
+now = [10.0]
+out = io.StringIO()
+profile = status_cache.StartupProfile(9.5, enabled=True, out=out, clock=lambda: now[0])
+profile.mark("first paint")
+now[0] = 11.0
+profile.mark("live status")
+profile.mark("first paint")  # Only the first time counts
+assert profile.marks == {"first paint": 0.5, "live status": 1.5}
+assert out.getvalue() == "startup: first paint after 500 ms\nstartup: live status after 1500 ms\n"
+EOF
+then
+    pass "startup cache saves last status and profiles startup"
+else
+    fail "startup cache should save last status and profile startup"
+fi
+
+# Test: setup's hostapd step reports only what changed and honours --dry-run
+TMP_CONF=$(mktemp -d)/hostapd.conf
+HC="$SCRIPT_DIR/hostapd_config.py"
+PLAN=$(python3 "$HC" --conf "$TMP_CONF" write Net password1 6 IE g --dry-run 2>/dev/null)
+FIRST=$(python3 "$HC" --conf "$TMP_CONF" write Net password1 6 IE g 2>/dev/null)
+AGAIN=$(python3 "$HC" --conf "$TMP_CONF" write Net password1 6 IE g 2>/dev/null)
+NEWPW=$(python3 "$HC" --conf "$TMP_CONF" write Net password2 6 IE g --dry-run 2>/dev/null)
+if [[ "$PLAN" == *ssid* && "$PLAN" == "$FIRST" && -z "$AGAIN" && "$NEWPW" == "wpa_passphrase" ]] && \
+   grep -q "wpa_passphrase=password1" "$TMP_CONF"; then
+    pass "setup rewrites hostapd.conf only when settings change"
+else
+    fail "setup should rewrite hostapd.conf only when settings change"
+fi
+rm -rf "$(dirname "$TMP_CONF")"
+
+# Test: setup/uninstall stages emit timing events and build a history
+TMP_STAGES=$(mktemp -d)
+STAGE_OUT=$(STAGE_HISTORY="$TMP_STAGES/history.jsonl" bash -c '
+    source "$1/stages.sh"
+    stages_begin setup
+    stage packages; stage_result skipped
+    stage bridge; sleep 0.05
+    stages_end' _ "$SCRIPT_DIR" 2>/dev/null)
+STAGE_HISTORY="$TMP_STAGES/history.jsonl" bash -c '
+    source "$1/stages.sh"
+    stages_begin uninstall
+    stage services
+    exit 3' _ "$SCRIPT_DIR" >/dev/null 2>&1 || true
+if python3 - "$SCRIPT_DIR" "$TMP_STAGES/history.jsonl" "$STAGE_OUT" <<'EOF' 2>/dev/null
+import sys
+sys.path.insert(0, sys.argv[1])
+import stage_timing
+
+events = [stage_timing.parse_event(l) for l in sys.argv[3].splitlines()]
+assert [(e["stage"], e["result"]) for e in events] == [("packages", "skipped"), ("bridge", "ok")]
+assert events[1]["duration"] >= 0.05 and events[0]["start"] <= events[1]["start"]
+assert stage_timing.parse_event("Installing: hostapd") is None
+
+setup, uninstall = stage_timing.load_runs(sys.argv[2])
+assert setup.script == "setup" and [e["stage"] for e in setup.events] == ["packages", "bridge"]
+assert uninstall.failed and uninstall.events[0]["result"] == "failed"
+assert stage_timing.load_runs(sys.argv[2], script="uninstall")[0].run == uninstall.run
+
+typical = stage_timing.typical_durations([
+    stage_timing.Timeline(events=[{"stage": "apt", "duration": d, "result": "ok"}])
+    for d in (2.0, 3.0, 40.0)])
+assert typical == {"apt": 3.0}
+assert stage_timing.is_slower(9.0, 3.0) and not stage_timing.is_slower(3.5, 3.0)
+assert "usually 3.0 s" in stage_timing.format_event({"stage": "apt", "duration": 9.0}, 3.0)
+EOF
+then
+    pass "stages emit timing events and keep a history"
+else
+    fail "stages should emit timing events and keep a history"
+fi
+rm -rf "$TMP_STAGES"
+
+# Test: readiness probe backs off and reports time-to-ready or what timed out
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import readiness
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+    def __call__(self):
+        return self.now
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeState:
+    """Conditions that come true at fixed times on the fake clock"""
+    iface, bridge = "wlan1", "br0"
+    def __init__(self, clock, times):
+        self.clock, self.times = clock, times
+    def check(self):
+        elapsed = self.clock() - 100.0
+        return {name: at is not None and elapsed >= at for name, at in self.times.items()}
+
+clock = FakeClock()
+state = FakeState(clock, {"hostapd": 0, "ap_mode": 0.3, "bridge": 1.0, "enslaved": 0.3})
+result = readiness.wait_ready(state, timeout=30, clock=clock, sleep=clock.sleep)
+assert result.ready and 1.0 <= result.elapsed < 2.0, result.as_dict()
+assert clock.sleeps[:4] == [0.05, 0.1, 0.2, 0.4]  # Exponential backoff
+assert result.met["hostapd"] == 0 and result.met["ap_mode"] >= 0.3
+assert result.describe().startswith("✓ AP ready in 1.")
+
+clock = FakeClock()
+state = FakeState(clock, {"hostapd": 0, "ap_mode": 0, "bridge": None, "enslaved": 0})
+result = readiness.wait_ready(state, timeout=10, clock=clock, sleep=clock.sleep)
+assert not result.ready and result.pending == ["bridge"] and result.elapsed == 10
+assert max(clock.sleeps) == readiness.MAX_DELAY
+assert "br0 is not up with an address" in result.describe()
+
+# The real provider reads /proc and sysfs
+tmp = tempfile.mkdtemp()
+sysfs, proc = os.path.join(tmp, "net"), os.path.join(tmp, "proc")
+os.makedirs(os.path.join(sysfs, "br-test", "brif", "wlan1"))
+os.makedirs(os.path.join(proc, "42"))
+os.makedirs(os.path.join(proc, "net"))
+with open(os.path.join(proc, "42", "comm"), "w") as f:
+    f.write("hostapd\n")
+with open(os.path.join(sysfs, "br-test", "operstate"), "w") as f:
+    f.write("up\n")
+with open(os.path.join(proc, "net", "if_inet6"), "w") as f:
+    f.write("20010db8000000000000000000000001 05 40 00 80  br-test\n")
+state = readiness.SystemState("wlan1", "br-test", sysfs=sysfs, proc=proc)
+assert state.hostapd() and state.enslaved() and state.bridge_up()
+state.bridge = "br-none"
+assert not state.bridge_up() and not state.enslaved()
+EOF
+then
+    pass "readiness probe measures time-to-ready with backoff"
+else
+    fail "readiness probe should measure time-to-ready with backoff"
+fi
+
+# Test: tuning profiles apply, persist and revert cleanly
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, tuning
+
+tmp = tempfile.mkdtemp()
+sysfs = os.path.join(tmp, "net")
+def sysfs_file(*parts, value):
+    path = os.path.join(sysfs, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"{value}\n")
+    return path
+qlen = sysfs_file("wlan0", "tx_queue_len", value=1000)
+snoop = sysfs_file("br0", "bridge", "multicast_snooping", value=1)
+querier = sysfs_file("br0", "bridge", "multicast_querier", value=0)
+read = lambda path: open(path).read().strip()
+
+power = ["on"]
+def iw(*args):
+    if args[-1] == "power_save":
+        return f"Power save: {power[0]}\n"
+    power[0] = args[-1]
+    return ""
+
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "password1", 6, "IE", "g"), conf)
+dropin = os.path.join(tmp, "hostapd.service.d", "tuning.conf")
+tuner = tuning.Tuner("wlan0", sysfs=sysfs, iw=iw)
+def apply(profile, **kw):
+    return tuning.apply(profile, "wlan0", conf, dropin, tuner, restart=False,
+                        persist_reload=False, **kw)
+
+# A dry run reports without touching anything
+planned = apply("low-latency", dry_run=True)
+assert any("power_save: on -> off" in c for c in planned)
+assert power == ["on"] and read(qlen) == "1000" and not os.path.exists(dropin)
+
+changes = apply("low-latency")
+assert changes == planned, (changes, planned)
+assert power == ["off"] and read(qlen) == "100" and read(querier) == "1"
+assert tuning.current_profile(dropin) == "low-latency"
+assert hostapd_config.load(conf).get("multicast_to_unicast") == "1"
+assert apply("low-latency") == []  # Idempotent
+
+apply("max-throughput")
+config = hostapd_config.load(conf)
+assert config.get("multicast_to_unicast") is None and config.get("wmm_ac_be_txop_limit") == "94"
+assert read(qlen) == "2000" and tuning.current_profile(dropin) == "max-throughput"
+
+# Revert is the balanced profile: defaults back, drop-in and WMM keys gone
+apply("balanced")
+config = hostapd_config.load(conf)
+assert not tuning.HOSTAPD_KEYS & set(config.as_dict()) and config.ssid == "Net"
+assert power == ["on"] and read(qlen) == "1000" and read(querier) == "0"
+assert not os.path.exists(dropin) and tuning.current_profile(dropin) == "balanced"
+EOF
+then
+    pass "tuning profiles apply, persist and revert"
+else
+    fail "tuning profiles should apply, persist and revert"
+fi
+
+# Test: extra radios get their own config and a status row each
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, metrics, status_collector
+from station_stats import Station
+
+tmp = tempfile.mkdtemp()
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "Password1", 6, "IE", "g", "wlan0"), conf)
+wlan1 = hostapd_config.radio_conf("wlan1", conf)
+hostapd_config.save(hostapd_config.render("Net", "Password1", 36, "IE", "a", "wlan1"), wlan1)
+with open(os.path.join(tmp, "other.conf"), "w") as f:
+    f.write("interface=wlan9\n")  # Not named after its interface: not a radio
+radios = hostapd_config.load_radios(conf)
+assert [(p, c.interface, c.band, c.channel) for p, c in radios] == [
+    (conf, "wlan0", "g", 6), (wlan1, "wlan1", "a", 36)]
+assert wlan1 == os.path.join(tmp, "wlan1.conf")
+
+os.makedirs(os.path.join(tmp, "proc", "7"))
+with open(os.path.join(tmp, "proc", "7", "comm"), "w") as f:
+    f.write("hostapd\n")
+class Reader:
+    def __init__(self, iface):
+        self.iface = iface
+    def stations(self):
+        count = {"wlan0": 1, "wlan1": 2}[self.iface]
+        return [Station(f"aa:bb:cc:dd:{self.iface[-1]}0:0{i}", signal=-50) for i in range(count)]
+    def close(self):
+        pass
+
+collector = status_collector.StatusCollector(conf, os.path.join(tmp, "net"),
+                                             os.path.join(tmp, "proc"),
+                                             os.path.join(tmp, "ctrl"), Reader)
+snapshot = collector.collect()
+assert [(r["interface"], r["band"], r["channel"], r["clients"]) for r in snapshot["radios"]] == [
+    ("wlan0", "g", 6, 1), ("wlan1", "a", 36, 2)]
+assert snapshot["clients"] == 3 and snapshot["interface"] == "wlan0"
+assert {s["interface"] for s in snapshot["stations"]} == {"wlan0", "wlan1"}
+text = status_collector.format_status(snapshot)
+assert "wlan0" in text and "wlan1" in text and "5GHz" in text and "2 clients" in text
+text = metrics.render(snapshot)
+assert 'wifi_extender_radio_stations{interface="wlan1",band="a",channel="36"} 2' in text
+
+# Live apply re-renders extra radios for the new country, even one without a channel
+import live_apply, phy_caps
+with open(hostapd_config.radio_conf("wlan2", conf), "w") as f:
+    f.write("interface=wlan2\nhw_mode=a\n")
+probed, applied = [], {}
+phy_caps.probe = lambda iface, channel, band, country=None: probed.append(
+    (iface, channel, band, country)) or []
+def apply_config(config, path, ctrl, restart):
+    applied[config.interface] = config
+    return live_apply.ACTION_RELOAD, ["country_code"], 0.1
+live_apply.apply_config = apply_config
+live_apply._apply_radios("Net", "Password1", "US", lambda line: None, conf)
+assert probed == [("wlan1", 36, "a", "US"), ("wlan2", 36, "a", "US")], probed
+assert applied["wlan2"].channel == 36 and applied["wlan2"].country == "US"
+EOF
+then
+    pass "extra radios get their own config and status"
+else
+    fail "extra radios should get their own config and status"
+fi
+
+# Test: fleet provisioning validates a manifest, then writes every card in parallel
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import json, os, subprocess, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import provision
+
+tmp = tempfile.mkdtemp()
+boots = []
+for i in range(3):
+    boot = os.path.join(tmp, f"boot{i}")
+    os.makedirs(boot)
+    with open(os.path.join(boot, "cmdline.txt"), "w") as f:
+        f.write("console=tty1 root=PARTUUID=abc rootwait\n")
+    boots.append(boot)
+debs = os.path.join(tmp, "debs")
+os.makedirs(debs)
+for name in ("hostapd_2.10_arm64.deb", "bridge-utils_1.7_arm64.deb"):
+    with open(os.path.join(debs, name), "wb") as f:
+        f.write(b"!<arch>\n")
+
+csv_manifest = os.path.join(tmp, "devices.csv")
+with open(csv_manifest, "w") as f:
+    f.write("boot,ssid,password,channel,band,interface\n")
+    f.write(f"{boots[0]},Kitchen,Password123,36,a,wlan1\n")
+    f.write(f"{boots[1]},Garage,Password456,,,\n")
+devices = provision.load_manifest(csv_manifest)
+assert devices[1]["channel"] == "6" and devices[1]["band"] == "g" and devices[1]["interface"] == "wlan0"
+lines = []
+assert provision.provision(devices, [os.path.join(debs, n) for n in os.listdir(debs)],
+                           jobs=2, report=lines.append) == 0
+assert len(lines) == 2 and all(l.startswith("✓") for l in lines)
+
+with open(os.path.join(boots[0], "firstrun.sh")) as f:
+    firstrun = f.read()
+assert "interface=wlan1" in firstrun and "hw_mode=a" in firstrun and "channel=36" in firstrun
+assert "ssid=Kitchen" in firstrun and "interface-name:wlan1" in firstrun
+assert "@" not in firstrun.replace("$@", "")  # Every placeholder filled
+subprocess.run(["bash", "-n", os.path.join(boots[0], "firstrun.sh")], check=True)
+assert sorted(os.listdir(os.path.join(boots[0], provision.DEBS_DIR))) == sorted(os.listdir(debs))
+with open(os.path.join(boots[1], "firstrun.sh")) as f:
+    assert "interface=wlan0" in f.read()
+
+# Re-running leaves cmdline.txt with a single systemd.run
+provision.provision(devices, report=lambda line: None)
+with open(os.path.join(boots[0], "cmdline.txt")) as f:
+    cmdline = f.read()
+assert cmdline.count("systemd.run=") == 1 and cmdline.startswith("console=tty1")
+
+# JSON with defaults; one bad device means nothing is written
+json_manifest = os.path.join(tmp, "devices.json")
+with open(json_manifest, "w") as f:
+    json.dump({"defaults": {"country": "DE", "password": "SharedPass1"},
+               "devices": [{"boot": boots[2], "ssid": "Office"},
+                           {"boot": os.path.join(tmp, "missing"), "ssid": "Lost"},
+                           {"boot": boots[2], "ssid": "Twice", "password": "short"}]}, f)
+devices = provision.load_manifest(json_manifest)
+assert devices[0]["country"] == "DE" and devices[0]["password"] == "SharedPass1"
+try:
+    provision.provision(devices, report=lambda line: None)
+    raise AssertionError("bad manifest accepted")
+except provision.ManifestError as e:
+    assert "device 2" in str(e) and "cmdline.txt" in str(e)
+    assert "listed twice" in str(e) and "8-63" in str(e)
+assert not os.path.exists(os.path.join(boots[2], "firstrun.sh"))
+assert provision.provision(devices[:1], report=lambda line: None) == 0
+with open(os.path.join(boots[2], "firstrun.sh")) as f:
+    assert "country_code=DE" in f.read()
+EOF
+then
+    pass "fleet provisioning writes every card from one template"
+else
+    fail "fleet provisioning should write every card from one template"
+fi
+
+# Test: update checker caches the remote head and backs off against a local bare repo
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, subprocess, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import update_check
+
+tmp = tempfile.mkdtemp()
+def git(cwd, *args):
+    return subprocess.run(["git", "-C", cwd, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                          check=True, capture_output=True, text=True).stdout.strip()
+remote = os.path.join(tmp, "remote.git")
+subprocess.run(["git", "init", "-q", "--bare", "-b", "main", remote], check=True)
+upstream = os.path.join(tmp, "upstream")
+subprocess.run(["git", "clone", "-q", remote, upstream], check=True, capture_output=True)
+git(upstream, "checkout", "-q", "-b", "main")
+git(upstream, "commit", "-q", "--allow-empty", "-m", "one")
+git(upstream, "push", "-q", "origin", "main")
+checkout = os.path.join(tmp, "checkout")
+subprocess.run(["git", "clone", "-q", remote, checkout], check=True, capture_output=True)
+assert update_check.upstream(checkout) == ("origin", "main")
+
+now = [1000.0]
+cache = os.path.join(tmp, "cache", "update.json")
+checker = update_check.UpdateChecker(checkout, cache, ttl=60, retry_delay=10,
+                                     max_retry_delay=40, clock=lambda: now[0])
+assert checker.cached().remote is None
+status = checker.check()
+assert not status.available and status.remote == status.local == git(checkout, "rev-parse", "HEAD")
+
+# A new upstream commit stays hidden until the cached head expires or a forced check
+git(upstream, "commit", "-q", "--allow-empty", "-m", "two")
+git(upstream, "push", "-q", "origin", "main")
+assert not checker.check().available
+now[0] += 61
+status = checker.check()
+assert status.available and status.remote == git(upstream, "rev-parse", "HEAD")
+# The cache alone answers straight away, from a fresh checker too
+fresh = update_check.UpdateChecker(checkout, cache, ttl=60, clock=lambda: now[0])
+assert fresh.cached().available and fresh.next_check() == now[0] + 60
+
+# ls-remote never fetched the commit; a pull brings the checkout level
+assert subprocess.run(["git", "-C", checkout, "cat-file", "-e", status.remote]).returncode != 0
+checker.pull()
+assert not checker.cached().available
+
+# An unreachable remote keeps the last head and backs off exponentially
+os.rename(remote, remote + ".gone")
+dues = []
+for _ in range(4):
+    status = checker.check(force=True)
+    assert status.error and status.remote is not None
+    dues.append(checker.next_check() - now[0])
+assert dues == [10, 20, 40, 40]
+os.rename(remote + ".gone", remote)
+assert not checker.check(force=True).error and checker.next_check() == now[0] + 60
+
+# The worker posts the cached status, then checks when asked
+seen = []
+worker = update_check.UpdateWorker(checker, seen.append, clock=lambda: now[0]).start()
+worker.request()
+for _ in range(100):
+    if len(seen) >= 2:
+        break
+    worker.thread.join(0.05)
+worker.stop()
+worker.thread.join(2)
+assert len(seen) == 2 and not worker.thread.is_alive()
+EOF
+then
+    pass "update checker caches the remote head and backs off"
+else
+    fail "update checker should cache the remote head and back off"
+fi
+
+# Test: client roster names stations from ARP, leases and snooped DHCP, with a TTL cache
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, shutil, sys, tempfile, time
+sys.path.insert(0, sys.argv[1])
+import client_roster, status_collector
+from station_stats import Station
+
+data = os.path.join(sys.argv[1], "testdata")
+tmp = tempfile.mkdtemp()
+proc = os.path.join(tmp, "proc")
+os.makedirs(os.path.join(proc, "net"))
+shutil.copy(os.path.join(data, "proc-net-arp.txt"), os.path.join(proc, "net", "arp"))
+arp = client_roster.read_arp(proc)
+assert arp["aa:bb:cc:dd:ee:01"] == "192.168.1.23"  # MACs normalised to lower case
+assert "aa:bb:cc:dd:ee:03" not in arp  # Incomplete entry
+
+with open(os.path.join(data, "dhcp-request.hex")) as f:
+    frame = bytes.fromhex("".join(l for l in f if not l.startswith("#")))
+assert client_roster.parse_dhcp(frame) == ("aa:bb:cc:dd:ee:01", "kitchen-tab", "192.168.1.23")
+assert client_roster.parse_dhcp(frame[:60]) is None
+assert client_roster.parse_dhcp(frame[:14] + b"\x86\xdd" + frame[16:]) is None
+
+hostnames = os.path.join(tmp, "hostnames.json")
+now = [0.0]
+store = client_roster.HostnameStore(hostnames, limit=3, clock=lambda: now[0])
+assert store.update(*client_roster.parse_dhcp(frame))
+assert not store.update("aa:bb:cc:dd:ee:01", None, None)  # Renewal without a name keeps it
+for i in range(5, 9):
+    now[0] += 1
+    store.update(f"aa:bb:cc:dd:ee:0{i}", f"host{i}")
+assert len(store.entries) == 3 and "aa:bb:cc:dd:ee:01" not in store.entries  # Oldest dropped
+store.update("aa:bb:cc:dd:ee:01", "kitchen-tab")
+store.save()
+assert oct(os.stat(hostnames).st_mode & 0o777) == "0o644"
+
+clock = [100.0]
+roster = client_roster.Roster(proc, hostnames, os.path.join(data, "dnsmasq.leases"),
+                              ttl=30, clock=lambda: clock[0])
+assert roster.lookup("AA:BB:CC:DD:EE:01") == {"ip": "192.168.1.23", "hostname": "kitchen-tab"}
+assert roster.lookup("aa:bb:cc:dd:ee:02") == {"ip": "192.168.1.40", "hostname": "printer"}  # ARP wins
+assert roster.name("aa:bb:cc:dd:ee:04") == "192.168.1.50"  # Lease without a hostname
+assert roster.name("aa:bb:cc:dd:ee:99") == "aa:bb:cc:dd:ee:99"
+
+# Tables are re-read only once the TTL expires (or on invalidate)
+with open(os.path.join(proc, "net", "arp"), "a") as f:
+    f.write("192.168.1.99     0x1         0x2         aa:bb:cc:dd:ee:99     *        br0\n")
+clock[0] += 29
+assert roster.name("aa:bb:cc:dd:ee:99") == "aa:bb:cc:dd:ee:99"
+clock[0] += 2
+assert roster.name("aa:bb:cc:dd:ee:99") == "192.168.1.99"
+
+# A hundred and fifty clients cost one table read and a dict join
+with open(os.path.join(proc, "net", "arp"), "a") as f:
+    for i in range(150):
+        f.write(f"10.0.{i // 250}.{i % 250 + 1}    0x1   0x2   02:00:00:00:{i // 256:02x}:{i % 256:02x}   *   br0\n")
+roster.invalidate()
+stations = [{"mac": f"02:00:00:00:{i // 256:02x}:{i % 256:02x}", "signal": -60} for i in range(150)]
+started = time.monotonic()
+for _ in range(100):
+    roster.annotate(stations)
+assert time.monotonic() - started < 1.0
+assert all(s["ip"] for s in stations) and stations[149]["ip"] == "10.0.0.150"
+assert len(client_roster.format_roster(stations)) == 150
+
+# The status snapshot carries each station's IP and hostname
+class Reader:
+    def __init__(self, iface):
+        pass
+    def stations(self):
+        return [Station("aa:bb:cc:dd:ee:01", signal=-48)]
+    def close(self):
+        pass
+os.makedirs(os.path.join(proc, "7"))
+with open(os.path.join(proc, "7", "comm"), "w") as f:
+    f.write("hostapd\n")
+collector = status_collector.StatusCollector(os.path.join(tmp, "hostapd.conf"),
+                                             os.path.join(tmp, "net"), proc,
+                                             os.path.join(tmp, "ctrl"), Reader, roster)
+station = collector.collect()["stations"][0]
+assert station["hostname"] == "kitchen-tab" and station["ip"] == "192.168.1.23"
+line = client_roster.format_roster([station])[0]
+assert line.startswith("kitchen-tab") and "192.168.1.23" in line and "-48 dBm" in line
+EOF
+then
+    pass "client roster joins stations with ARP, leases and DHCP hostnames"
+else
+    fail "client roster should join stations with ARP, leases and DHCP hostnames"
+fi
+
+# Test: uplink monitor keeps rolling latency percentiles, loss and eth0 counters
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, socket, sys, tempfile, threading
+sys.path.insert(0, sys.argv[1])
+import metrics, status_collector, uplink
+
+tmp = tempfile.mkdtemp()
+proc = os.path.join(tmp, "proc")
+os.makedirs(os.path.join(proc, "net"))
+with open(os.path.join(proc, "net", "route"), "w") as f:
+    f.write("Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n")
+    f.write("wlan9\t00000000\t0101A8C0\t0003\t0\t0\t50\t00000000\t0\t0\t0\n")
+    f.write("br0\t00000000\t0100007F\t0003\t0\t0\t425\t00000000\t0\t0\t0\n")
+    f.write("br0\t0001A8C0\t00000000\t0001\t0\t0\t425\t00FFFFFF\t0\t0\t0\n")
+assert uplink.default_gateway("br0", proc) == "127.0.0.1"  # The bridge's route wins
+assert uplink.default_gateway("eth9", proc) == "192.168.1.1"  # Else the lowest metric
+
+sysfs = os.path.join(tmp, "net")
+stats = os.path.join(sysfs, "eth0", "statistics")
+os.makedirs(stats)
+def write(path, value):
+    with open(path, "w") as f:
+        f.write(f"{value}\n")
+for name, value in (("carrier", 1), ("speed", 1000), ("operstate", "up"), ("carrier_changes", 2)):
+    write(os.path.join(sysfs, "eth0", name), value)
+for counter in uplink.LINK_COUNTERS:
+    write(os.path.join(stats, counter), 0)
+
+# A local TCP listener stands in for the gateway
+server = socket.socket()
+server.bind(("127.0.0.1", 0))
+server.listen(64)
+threading.Thread(target=lambda: [server.accept()[0].close() for _ in iter(int, 1)], daemon=True).start()
+monitor = uplink.UplinkMonitor(method=f"tcp:{server.getsockname()[1]}", interval=0.5, window=4,
+                               sysfs=sysfs, proc=proc)
+for _ in range(3):
+    assert monitor.probe_once() is not None
+write(os.path.join(stats, "rx_crc_errors"), 7)
+write(os.path.join(sysfs, "eth0", "carrier_changes"), 4)
+monitor.probe_once()
+summary = monitor.summary()
+assert summary["target"] == "127.0.0.1" and summary["sent"] == 4 and summary["loss"] == 0
+assert 0 < summary["p50"] <= summary["p95"] <= summary["p99"] < 0.5
+assert summary["window_errors"]["rx_crc_errors"] == 7 and summary["window_errors"]["carrier_changes"] == 2
+assert summary["link"]["speed_mbps"] == 1000 and summary["link"]["carrier"] is True
+
+# Losses and the fixed-size window, with a scripted prober
+class Script:
+    def __init__(self, results):
+        self.results = list(results)
+    def probe(self, target, timeout):
+        return self.results.pop(0)
+    def close(self):
+        pass
+results = [i / 1000 for i in range(1, 101)] + [None] * 5
+monitor = uplink.UplinkMonitor("127.0.0.1", interval=1, window=100, sysfs=sysfs, proc=proc,
+                               prober=Script(results))
+for _ in results:
+    monitor.probe_once()
+summary = monitor.summary()
+assert summary["sent"] == 100 and summary["lost"] == 5 and summary["loss"] == 0.05
+# The window holds the last 100 results: 6-100 ms and five losses
+assert (summary["p50"], summary["p95"], summary["p99"]) == (0.053, 0.096, 0.1)
+text = uplink.format_uplink(summary)
+assert "eth0 up 1000Mb/s" in text and "p50 53.0 ms" in text and "loss 5.0% of 100" in text
+
+# ICMP to loopback when this host allows ping sockets (or runs as root)
+try:
+    prober = uplink.IcmpProber()
+except OSError:
+    prober = None
+if prober:
+    assert prober.probe("127.0.0.1", 1.0) is not None
+    prober.close()
+
+# The figures reach the status CLI and metrics
+collector = status_collector.StatusCollector(os.path.join(tmp, "hostapd.conf"), sysfs, proc,
+                                             os.path.join(tmp, "ctrl"), uplink_monitor=monitor)
+snap = collector.collect()
+assert snap["uplink"]["p99"] == 0.1
+assert "Uplink:  eth0 up 1000Mb/s" in status_collector.format_status(snap)
+text = metrics.render(snap)
+assert 'wifi_extender_uplink_latency_seconds{target="127.0.0.1",quantile="0.95"} 0.096000' in text
+assert 'wifi_extender_uplink_loss_ratio{target="127.0.0.1"} 0.05' in text
+assert 'wifi_extender_uplink_receive_crc_errors_total{interface="eth0"} 7' in text
+EOF
+then
+    pass "uplink monitor reports rolling latency percentiles and loss"
+else
+    fail "uplink monitor should report rolling latency percentiles and loss"
+fi
+
+# Test: routed mode renders its ruleset, DHCP and service, and removes them cleanly
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import hostapd_config, live_apply, readiness, routed, status_collector
+
+config = routed.RoutedConfig("wlan1", "eth0", "10.42.0.1/24")
+nft = routed.render_nft(config)
+assert 'devices = { "wlan1", "eth0" }' in nft
+assert "ct state established flow add @fastpath" in nft
+assert 'ip saddr 10.42.0.0/24 oifname "eth0" masquerade' in nft
+assert 'iifname "eth0" oifname "wlan1" drop' in nft
+# Re-loading the file replaces the table rather than adding rules twice
+assert nft.index("delete table inet wifi_extender") < nft.index("table inet wifi_extender {")
+dnsmasq = routed.render_dnsmasq(config)
+assert "interface=wlan1" in dnsmasq
+assert "dhcp-range=10.42.0.10,10.42.0.254,255.255.255.0,12h" in dnsmasq
+assert "dhcp-option=option:router,10.42.0.1" in dnsmasq
+assert routed.RoutedConfig(address="10.9.0.249/29").dhcp_range() == (
+    routed.ipaddress.ip_address("10.9.0.250"), routed.ipaddress.ip_address("10.9.0.254"))
+for bad in ("10.42.0.0/24", "8.8.8.1/24", "10.42.0.1/30", "fe80::1/64"):
+    try:
+        routed.RoutedConfig(address=bad)
+        raise AssertionError(bad)
+    except ValueError:
+        pass
+
+# The uplink's own subnet is refused
+proc = tempfile.mkdtemp()
+os.makedirs(os.path.join(proc, "net"))
+with open(os.path.join(proc, "net", "route"), "w") as f:
+    f.write("Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\n")
+    f.write("eth0\t00000000\t01002A0A\t0003\t0\t0\t100\t00000000\n")
+try:
+    routed.check_uplink(config, proc)
+    raise AssertionError("gateway 10.42.0.1 is inside the AP subnet")
+except ValueError:
+    pass
+routed.check_uplink(routed.RoutedConfig(address="192.168.50.1/24"), proc)
+
+# Files are written once, read back, and removed on revert
+tmp = tempfile.mkdtemp()
+paths = dict(service=os.path.join(tmp, "systemd", "wifi-extender-routed.service"),
+             nft=os.path.join(tmp, "etc", "routed.nft"),
+             dnsmasq=os.path.join(tmp, "dnsmasq.d", "wifi-extender.conf"))
+assert routed.mode(paths["service"]) == "bridge" and routed.current(paths["service"]) is None
+assert routed.write(config, dry_run=True, **paths) and not os.listdir(tmp)
+assert len(routed.write(config, **paths)) == 3
+assert routed.write(config, **paths) == []
+assert routed.mode(paths["service"]) == "routed" and routed.current(paths["service"]) == config
+assert routed.write(routed.RoutedConfig("wlan1", "eth0", "10.43.0.1/24"), **paths) == [
+    paths["nft"], paths["dnsmasq"], paths["service"]]
+assert sorted(routed.remove(stop=False, **paths)) == sorted(paths.values())
+assert not any(os.path.exists(p) for p in paths.values())
+
+# hostapd runs unbridged, and live apply keeps it that way
+text = hostapd_config.render("Net", "password1", 6, "IE", "g", "wlan1", bridge=None).text()
+assert "bridge=" not in text and "interface=wlan1" in text
+conf = os.path.join(tmp, "hostapd.conf")
+hostapd_config.save(hostapd_config.render("Net", "password1", 6, "IE", "g", "wlan1", bridge=None), conf)
+assert readiness.configured_bridge(conf) is None
+assert live_apply.plan_changes(hostapd_config.load(conf).as_dict(), hostapd_config.render(
+    "Net", "password1", 6, "IE", "g", "wlan1").as_dict())[0] == "setup"
+
+# Readiness wants the AP interface up with the address, nothing enslaved
+sysfs = os.path.join(tmp, "net")
+os.makedirs(os.path.join(sysfs, "wlan1"))
+with open(os.path.join(sysfs, "wlan1", "operstate"), "w") as f:
+    f.write("up\n")
+with open(os.path.join(proc, "net", "if_inet6"), "w") as f:
+    f.write("20010db8000000000000000000000001 05 40 00 80  wlan1\n")
+state = readiness.SystemState("wlan1", None, sysfs=sysfs, proc=proc)
+assert state.bridge_up() and state.enslaved()
+
+snapshot = status_collector.StatusCollector(conf, sysfs, proc, os.path.join(tmp, "ctrl")).collect()
+assert snapshot["mode"] == "routed"
+assert "mode:    routed" in status_collector.format_status(snapshot)
+EOF
+then
+    pass "routed mode renders NAT, flowtable and DHCP config and reverts cleanly"
+else
+    fail "routed mode should render NAT, flowtable and DHCP config and revert cleanly"
+fi
+
+# Test: traffic shaping renders per-client tc rules, re-applies on reconnect and reads stats
+if python3 - "$SCRIPT_DIR" <<'EOF' 2>/dev/null
+import os, struct, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import metrics, privileged_helper, qos, status_collector
+from station_stats import _attr
+
+A, B = "aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02"
+assert qos.parse_rates("20:5") == (20.0, 5.0) and qos.parse_rates("0:") == (None, None)
+for bad in ("20", "a:b", "-1:2"):
+    try:
+        qos.parse_rates(bad)
+        raise AssertionError(bad)
+    except ValueError:
+        pass
+for kwargs in ({"clients": {"nope": (1, 1)}}, {"fairness": "wrr"}, {"default": (5000, None)}):
+    try:
+        qos.QosConfig(**kwargs)
+        raise AssertionError(kwargs)
+    except ValueError:
+        pass
+
+# Every client gets an HTB class, fq_codel leaf and MAC filter in both directions
+config = qos.QosConfig((20, 5), {A.upper(): (2, None)}, (50, 10))
+lines = qos.render(config, "wlan1", [B, A])
+assert lines[0] == "qdisc replace dev wlan1 root handle 1: htb default fff"
+assert "class add dev wlan1 parent 1: classid 1:1 htb rate 50000kbit ceil 50000kbit quantum 1514" in lines
+assert "class add dev wlan1 parent 1:1 classid 1:10 htb rate 2000kbit ceil 2000kbit quantum 1514" in lines
+assert "class add dev wlan1 parent 1:1 classid 1:11 htb rate 16666kbit ceil 20000kbit quantum 1514" in lines
+assert "qdisc add dev wlan1 parent 1:fff handle fff: fq_codel" in lines
+assert f"filter add dev wlan1 parent 1: protocol all prio 1 flower dst_mac {A} classid 1:10" in lines
+assert ("filter add dev wlan1 parent ffff: protocol all prio 1 matchall "
+        "action mirred egress redirect dev ifb-wlan1") in lines
+# Uploads: the client without an upload cap may use the whole uplink total
+assert "class add dev ifb-wlan1 parent 1:1 classid 1:10 htb rate 3333kbit ceil 10000kbit quantum 1514" in lines
+assert f"filter add dev ifb-wlan1 parent 1: protocol all prio 1 flower src_mac {B} classid 1:11" in lines
+assert not any(" br0 " in line for line in lines)
+# Flow fairness: only capped clients get a class
+flows = qos.QosConfig(clients={A: (2, 1)}, fairness="flows")
+assert qos.shaped_clients(flows, [A, B]) == [(0x10, A)]
+assert qos.QosConfig.from_dict(config.as_dict()) == config
+
+# The daemon re-applies only when the stations change or the rules went missing
+tmp = tempfile.mkdtemp()
+conf, state = os.path.join(tmp, "qos.json"), os.path.join(tmp, "qos-state.json")
+ran = []
+class Done:
+    returncode, stdout, stderr = 0, "", ""
+def runner(cmd, stdin=None):
+    ran.append((cmd, stdin))
+    return Done()
+shaper = qos.Shaper(conf, state, runner)
+def tick(macs, shaped=None):
+    del ran[:]
+    shaper.update({"radios": [{"interface": "wlan0", "state": "ENABLED"}], "qos": shaped,
+                   "stations": [{"mac": m, "interface": "wlan0"} for m in macs]})
+    return [" ".join(cmd) for cmd, _ in ran]
+assert tick([A]) == []  # Off and never applied: the interface is left alone
+qos.save(qos.QosConfig((20, 5)), conf)
+commands = tick([A])
+assert "ip link add name ifb-wlan0 type ifb" in commands and "tc -batch -" in commands, commands
+batch = ran[-1][1]
+assert f"dst_mac {A} classid 1:10" in batch and B not in batch
+assert qos.load_state(state)["wlan0"]["classes"] == {"1:10": A}
+assert tick([A], {"wlan0": {"down": [], "up": []}}) == []
+assert "tc -batch -" in tick([A, B], {"wlan0": {"down": [], "up": []}})  # B connected
+assert "tc -batch -" in tick([A, B], {})  # Rules gone: put back
+assert qos.Shaper(conf, state, runner).applied == shaper.applied  # Survives a restart
+os.remove(conf)
+commands = tick([A, B], {})  # Shaping turned off: rules and ifb removed
+assert "tc qdisc del dev wlan0 root" in commands and "ip link del ifb-wlan0" in commands, commands
+assert "wlan0" not in qos.load_state(state)
+
+# Counters come from rtnetlink dumps: class bytes, leaf queue and drops
+def tc_message(handle, parent, kind, basic, queue):
+    stats = _attr(qos.TCA_STATS_BASIC, struct.pack("QI", *basic) + b"\0" * 4) + \
+        _attr(qos.TCA_STATS_QUEUE, struct.pack("IIIII", *queue))
+    return struct.pack("BxxxiIII", 0, 3, handle, parent, 0) + \
+        _attr(qos.TCA_KIND, kind.encode() + b"\0") + _attr(qos.TCA_STATS2, stats)
+record = qos.parse_tc_message(tc_message(0x10010, 0x10001, "htb", (9000, 6), (0, 0, 1, 0, 4)))
+assert record == {"ifindex": 3, "handle": "1:10", "parent": "1:1", "kind": "htb", "bytes": 9000,
+                  "packets": 6, "qlen": 0, "backlog": 0, "drops": 1, "overlimits": 4}, record
+qdiscs = [qos.parse_tc_message(m) for m in (
+    tc_message(0x10000, 0xffffffff, "htb", (0, 0), (0, 0, 0, 0, 0)),
+    tc_message(0x100000, 0x10010, "fq_codel", (9000, 6), (2, 3000, 5, 0, 0)))]
+classes = [qos.parse_tc_message(m) for m in (
+    tc_message(0x10001, 0xffffffff, "htb", (9000, 6), (0, 0, 0, 0, 0)),
+    tc_message(0x10010, 0x10001, "htb", (9000, 6), (0, 0, 1, 0, 4)))]
+rows = qos.class_stats(qdiscs, classes, {"1:10": A})
+assert rows == [{"class": "1:10", "mac": A, "bytes": 9000, "packets": 6, "drops": 6,
+                 "overlimits": 4, "backlog": 3000, "qlen": 2}], rows
+assert qos.class_stats(qdiscs[1:], classes, {}) is None  # Not our tree
+stats = {"wlan0": {"down": rows, "up": rows}}
+assert qos.format_summary(stats) == "1 client shaped · 12 dropped · 6.0 kB queued"
+lines = []
+metrics._render_qos(stats, lambda suffix, kind, help_text, samples: lines.extend(
+    f"{suffix}{sorted(labels.items())} {value}" for labels, value in samples))
+assert f"qos_drops_total[('class', '1:10'), ('direction', 'down'), ('interface', 'wlan0'), ('mac', '{A}')] 6" in lines, lines
+
+# The collector reports them, status.sh shows a summary, the helper passes caps on
+collector = status_collector.StatusCollector(os.path.join(tmp, "hostapd.conf"), tmp, tmp,
+                                             tmp, qos_state=os.path.join(tmp, "none.json"))
+snapshot = collector.collect()
+assert snapshot["qos"] == {} and "QoS:" not in status_collector.format_status(snapshot)
+snapshot["qos"] = stats
+assert "QoS:     1 client shaped" in status_collector.format_status(snapshot)
+assert privileged_helper.qos_args("20:5", {A: "off"}) == ["set", "--default", "20:5", "--client", f"{A}=off"]
+assert privileged_helper.qos_args("off") == ["off"]
+EOF
+then
+    pass "traffic shaping renders per-client tc rules, re-applies on reconnect and reports drops"
+else
+    fail "traffic shaping should render per-client tc rules, re-apply on reconnect and report drops"
+fi
+
 # Test: Required files exist
 for file in README.md LICENSE .gitignore; do
     if [[ -f "$SCRIPT_DIR/$file" ]]; then
@@ -0,0 +1,146 @@
+"""
+Pi WiFi Extender - Per-client throughput
+Samples each station's byte counters on a fixed interval and turns the
+deltas into Mbit/s. Recent rates live in fixed-size, array-backed ring
+buffers, so memory stays bounded no matter how long the GUI runs.
+"""
+
+import threading
+import time
+from array import array
+
+import station_stats
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_HISTORY = 150  # samples per client (5 minutes at 2s)
+
+
+class RateHistory:
+    """Ring buffer of recent (down, up) rates for one client, in Mbit/s"""
+
+    __slots__ = ("down", "up", "size", "index", "count")
+
+    def __init__(self, size=DEFAULT_HISTORY):
+        self.down = array("d", bytes(8 * size))
+        self.up = array("d", bytes(8 * size))
+        self.size = size
+        self.index = 0
+        self.count = 0
+
+    def add(self, down, up):
+        self.down[self.index] = down
+        self.up[self.index] = up
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def latest(self):
+        if not self.count:
+            return 0.0, 0.0
+        i = (self.index - 1) % self.size
+        return self.down[i], self.up[i]
+
+    def peak(self):
+        """Highest combined rate in the window"""
+        return max((self.down[i] + self.up[i] for i in range(self.count)), default=0.0)
+
+    def average(self):
+        """Mean combined rate over the window"""
+        if not self.count:
+            return 0.0
+        return (sum(self.down[:self.count]) + sum(self.up[:self.count])) / self.count
+
+
+class ClientRate:
+    """One row of the client table"""
+
+    __slots__ = ("mac", "down", "up", "peak", "average")
+
+    def __init__(self, mac, down, up, peak, average):
+        self.mac = mac
+        self.down = down
+        self.up = up
+        self.peak = peak
+        self.average = average
+
+    def __repr__(self):
+        return f"ClientRate({self.mac}, down={self.down:.2f}, up={self.up:.2f})"
+
+
+class ThroughputSampler:
+    """Turns successive station snapshots into per-client rates
+
+    "Down" is traffic the AP sent to the client (station tx bytes) and "up"
+    is what it received from it (station rx bytes).
+    """
+
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.history_size = history
+        self.last = {}       # mac -> (time, rx_bytes, tx_bytes)
+        self.histories = {}  # mac -> RateHistory
+
+    def sample(self, stations, now=None):
+        """Record one snapshot and return ClientRate rows, busiest first"""
+        now = time.monotonic() if now is None else now
+        seen = set()
+        for station in stations:
+            if station.rx_bytes is None or station.tx_bytes is None:
+                continue
+            mac = station.mac
+            seen.add(mac)
+            previous = self.last.get(mac)
+            self.last[mac] = (now, station.rx_bytes, station.tx_bytes)
+            if previous is None or now <= previous[0]:
+                continue
+            elapsed = now - previous[0]
+            up = station.rx_bytes - previous[1]
+            down = station.tx_bytes - previous[2]
+            if up < 0 or down < 0:
+                continue  # Counters reset (client re-associated)
+            history = self.histories.get(mac)
+            if history is None:
+                history = self.histories[mac] = RateHistory(self.history_size)
+            history.add(down * 8 / elapsed / 1e6, up * 8 / elapsed / 1e6)
+
+        # Forget clients that have left
+        for mac in set(self.last) - seen:
+            del self.last[mac]
+            self.histories.pop(mac, None)
+
+        rows = []
+        for mac, history in self.histories.items():
+            down, up = history.latest()
+            rows.append(ClientRate(mac, down, up, history.peak(), history.average()))
+        rows.sort(key=lambda r: r.down + r.up, reverse=True)
+        return rows
+
+
+class SamplerThread(threading.Thread):
+    """Samples station counters off the GTK thread
+
+    on_update(rows) is called once per tick with the whole table; the GUI
+    wraps it in GLib.idle_add so the UI gets one batched update.
+    """
+
+    def __init__(self, iface, on_update, interval=DEFAULT_INTERVAL,
+                 history=DEFAULT_HISTORY, reader=None):
+        super().__init__(daemon=True)
+        self.reader = reader or station_stats.StationReader(iface)
+        self.sampler = ThroughputSampler(history)
+        self.on_update = on_update
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                rows = self.sampler.sample(self.reader.stations())
+            except Exception:
+                rows = []
+            self.on_update(rows)
+            next_tick += self.interval
+            self.stopped.wait(max(0, next_tick - time.monotonic()))
+        self.reader.close()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Tuning profiles
+Trades latency against throughput for the Wi-Fi interface and bridge:
+Wi-Fi power save, the interface's txqueuelen, bridge multicast snooping
+and querier, and hostapd's WMM/TX queue parameters. Runtime settings are
+re-applied on every hostapd start from a systemd drop-in; "balanced"
+(the kernel and hostapd defaults) removes the drop-in again.
+
+Usage: ./tuning.py [show]
+       sudo ./tuning.py apply PROFILE [--iface wlan0] [--dry-run] [--no-restart]
+       sudo ./tuning.py revert [--no-restart]
+  PROFILE         balanced, low-latency or max-throughput
+  --no-restart    save hostapd.conf changes without restarting hostapd
+"""
+
+import os
+import subprocess
+import sys
+
+import hostapd_config
+import live_apply
+from hostapd_ctrl import HostapdCtrlError
+from status_collector import BRIDGE, SYSFS_NET, read_sysfs
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DROPIN = "/etc/systemd/system/hostapd.service.d/wifi-extender-tuning.conf"
+DEFAULT_PROFILE = "balanced"
+
+PROFILES = {
+    # Kernel and hostapd defaults: power save on, no WMM overrides
+    "balanced": {
+        "power_save": "on",
+        "txqueuelen": 1000,
+        "multicast_snooping": 1,
+        "multicast_querier": 0,
+        "hostapd": {},
+    },
+    # No power-save wake-up delays, a short queue against bufferbloat and
+    # multicast sent as unicast at data rates instead of the basic rate
+    "low-latency": {
+        "power_save": "off",
+        "txqueuelen": 100,
+        "multicast_snooping": 1,
+        "multicast_querier": 1,
+        "hostapd": {"multicast_to_unicast": "1"},
+    },
+    # Longer queues and 3 ms best-effort/background TXOPs for aggregation
+    "max-throughput": {
+        "power_save": "off",
+        "txqueuelen": 2000,
+        "multicast_snooping": 1,
+        "multicast_querier": 1,
+        "hostapd": {
+            "wmm_ac_be_txop_limit": "94",
+            "wmm_ac_bk_txop_limit": "94",
+            "tx_queue_data2_burst": "3.0",
+            "tx_queue_data3_burst": "3.0",
+        },
+    },
+}
+# hostapd.conf keys owned by the profiles; removed when a profile lacks them
+HOSTAPD_KEYS = frozenset(k for p in PROFILES.values() for k in p["hostapd"])
+
+
+def run_iw(*args):
+    return subprocess.run(["iw", *args], capture_output=True, text=True,
+                          check=True, timeout=5).stdout
+
+
+class Tuner:
+    """Reads and applies a profile's runtime settings"""
+
+    def __init__(self, iface="wlan0", bridge=BRIDGE, sysfs=SYSFS_NET, iw=run_iw):
+        self.iface = iface
+        self.bridge = bridge
+        self.sysfs = sysfs
+        self.iw = iw
+
+    def _paths(self):
+        """Runtime setting -> (label, sysfs file)"""
+        return {
+            "txqueuelen": (f"{self.iface} txqueuelen",
+                           os.path.join(self.sysfs, self.iface, "tx_queue_len")),
+            "multicast_snooping": (f"{self.bridge} multicast_snooping",
+                                   os.path.join(self.sysfs, self.bridge, "bridge",
+                                                "multicast_snooping")),
+            "multicast_querier": (f"{self.bridge} multicast_querier",
+                                  os.path.join(self.sysfs, self.bridge, "bridge",
+                                               "multicast_querier")),
+        }
+
+    def power_save(self):
+        """'on', 'off' or None if it cannot be read"""
+        try:
+            output = self.iw("dev", self.iface, "get", "power_save")
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return output.rsplit(":", 1)[-1].strip() or None
+
+    def state(self):
+        state = {"power_save": self.power_save()}
+        for setting, (_, path) in self._paths().items():
+            value = read_sysfs(path)
+            state[setting] = int(value) if value is not None else None
+        return state
+
+    def apply(self, profile, dry_run=False):
+        """Bring runtime settings in line with profile; list what changed
+
+        Settings that cannot be read (no bridge yet, say) are skipped.
+        """
+        wanted = PROFILES[profile]
+        changes = []
+        current = self.power_save()
+        if current is not None and current != wanted["power_save"]:
+            if not dry_run:
+                self.iw("dev", self.iface, "set", "power_save", wanted["power_save"])
+            changes.append(f"{self.iface} power_save: {current} -> {wanted['power_save']}")
+        for setting, (label, path) in self._paths().items():
+            value = read_sysfs(path)
+            if value is None or int(value) == wanted[setting]:
+                continue
+            if not dry_run:
+                with open(path, "w") as f:
+                    f.write(f"{wanted[setting]}\n")
+            changes.append(f"{label}: {value} -> {wanted[setting]}")
+        return changes
+
+
+def current_profile(dropin=DROPIN):
+    """Profile persisted in the hostapd drop-in; balanced without one"""
+    try:
+        with open(dropin) as f:
+            for line in f:
+                words = line.split()
+                if "apply" in words:
+                    name = words[words.index("apply") + 1]
+                    if name in PROFILES:
+                        return name
+    except (OSError, IndexError):
+        pass
+    return DEFAULT_PROFILE
+
+
+def dropin_text(profile, iface):
+    return f"""# Pi WiFi Extender tuning profile, managed by tuning.py
+[Service]
+ExecStartPost=-{sys.executable} {os.path.join(SCRIPT_DIR, "tuning.py")} apply {profile} --iface {iface} --runtime
+"""
+
+
+def persist(profile, iface, dropin=DROPIN, dry_run=False, reload=True):
+    """Write (or for balanced remove) the drop-in; True if it changed"""
+    text = None if profile == DEFAULT_PROFILE else dropin_text(profile, iface)
+    try:
+        with open(dropin) as f:
+            existing = f.read()
+    except FileNotFoundError:
+        existing = None
+    if existing == text:
+        return False
+    if not dry_run:
+        if text is None:
+            os.remove(dropin)
+        else:
+            os.makedirs(os.path.dirname(dropin), exist_ok=True)
+            with open(dropin, "w") as f:
+                f.write(text)
+        if reload:
+            subprocess.run(["systemctl", "daemon-reload"], check=True, timeout=30)
+    return True
+
+
+def hostapd_settings(profile, config):
+    """config with profile's hostapd keys set and other profiles' removed"""
+    tuned = config.copy()
+    wanted = PROFILES[profile]["hostapd"]
+    for key in HOSTAPD_KEYS:
+        tuned.set(key, wanted.get(key))
+    return tuned
+
+
+def apply(profile, iface=None, conf=hostapd_config.HOSTAPD_CONF, dropin=DROPIN,
+          tuner=None, dry_run=False, restart=True, persist_reload=True):
+    """Apply profile everywhere and return the list of changes
+
+    hostapd.conf changes are applied with a hostapd restart unless restart
+    is False, when they are only saved (setup.sh restarts hostapd itself).
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r} "
+                         f"(choose from {', '.join(PROFILES)})")
+    current = hostapd_config.load(conf)
+    iface = iface or current.interface
+    tuner = tuner or Tuner(iface)
+    changes = tuner.apply(profile, dry_run)
+
+    if persist(profile, iface, dropin, dry_run, persist_reload):
+        changes.append(f"{dropin}: {'removed' if profile == DEFAULT_PROFILE else profile}")
+
+    if current:
+        tuned = hostapd_settings(profile, current)
+        changed = hostapd_config.diff(current, tuned)
+        if changed and not dry_run:
+            if restart:
+                live_apply.apply_config(tuned, conf, owned=HOSTAPD_KEYS)
+            else:
+                hostapd_config.save(tuned, conf)
+        if changed:
+            changes.append(f"hostapd.conf: {' '.join(changed)}")
+    return changes
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    iface = option("--iface")
+    dry_run = "--dry-run" in args
+    restart = "--no-restart" not in args
+    args = [a for a in args if a not in ("--dry-run", "--no-restart")]
+    command = args[0] if args else "show"
+
+    if command == "show":
+        tuner = Tuner(iface or hostapd_config.load().interface)
+        print(f"Profile: {current_profile()}")
+        for setting, value in tuner.state().items():
+            print(f"  {setting}: {'-' if value is None else value}")
+        return 0
+
+    if command not in ("apply", "revert") or (command == "apply" and len(args) < 2):
+        print(__doc__.strip().split("\n\n", 1)[1], file=sys.stderr)
+        return 1
+    profile = DEFAULT_PROFILE if command == "revert" else args[1]
+    try:
+        if "--runtime" in args:
+            # From the drop-in on hostapd start: runtime settings only
+            changes = Tuner(iface or hostapd_config.load().interface).apply(profile)
+        else:
+            changes = apply(profile, iface, dry_run=dry_run, restart=restart)
+    except (OSError, ValueError, subprocess.SubprocessError, HostapdCtrlError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for change in changes:
+        print(f"  {'would change' if dry_run else 'changed'} {change}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
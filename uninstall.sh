@@ -2,24 +2,56 @@
 # Pi WiFi Extender - Uninstall
 set -e
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 if [[ $EUID -ne 0 ]]; then
     echo "Run as root: sudo $0"
     exit 1
 fi
 
 echo "Removing WiFi Extender..."
+source "$SCRIPT_DIR/stages.sh"
+stages_begin uninstall
 
 # Detect WiFi interface (don't assume wlan0)
 WIFI_IFACE=$(iw dev 2>/dev/null | awk '$1=="Interface"{print $2; exit}')
 WIFI_IFACE=${WIFI_IFACE:-wlan0}
 
+stage services
+python3 "$SCRIPT_DIR/tuning.py" revert --no-restart 2>/dev/null || true
+python3 "$SCRIPT_DIR/qos.py" off 2>/dev/null || true
 systemctl stop hostapd 2>/dev/null || true
 systemctl disable hostapd 2>/dev/null || true
+# Extra radios: their hostapd@ instances and configs
+python3 "$SCRIPT_DIR/hostapd_config.py" radios --extra 2>/dev/null | \
+    while read -r R_IFACE _ _ R_CONF; do
+        systemctl disable --now "hostapd@$R_IFACE" 2>/dev/null || true
+        rm -f "$R_CONF"
+    done
+systemctl disable --now wifi-extender-channel.timer 2>/dev/null || true
+rm -f /etc/systemd/system/wifi-extender-channel.{service,timer}
+systemctl disable --now wifi-extender-status.service 2>/dev/null || true
+rm -f /etc/systemd/system/wifi-extender-status.service
+# Routed mode: stopping its service drops the NAT table and AP address
+python3 "$SCRIPT_DIR/routed.py" remove 2>/dev/null || true
+if [[ -f /var/lib/wifi-extender-backup/dnsmasq-installed ]]; then
+    systemctl disable --now dnsmasq 2>/dev/null || true
+else
+    systemctl try-restart dnsmasq 2>/dev/null || true
+fi
+# Not --now: this script may itself be running under the helper
+systemctl disable wifi-extender-helper.socket 2>/dev/null || true
+rm -f /etc/systemd/system/wifi-extender-helper.{service,socket}
+
+stage files
+rm -f /usr/share/polkit-1/actions/com.pi.wifi-extender.policy
 rm -f /etc/hostapd/hostapd.conf
 rm -f /etc/default/hostapd
 rm -f /etc/network/interfaces.d/br0
+rm -f /etc/systemd/system/hostapd.service.d/wifi-extender-tuning.conf
 
 # Detect and clean up based on network manager
+stage network
 if systemctl is-active --quiet NetworkManager; then
     # NetworkManager cleanup (Bookworm+)
     rm -f /etc/NetworkManager/conf.d/10-hostapd.conf
@@ -33,6 +65,7 @@ else
     if [[ -f /etc/dhcpcd.conf.backup ]]; then
         mv /etc/dhcpcd.conf.backup /etc/dhcpcd.conf
     else
+        sed -i '/^# Pi WiFi Extender (routed)$/,+1d' /etc/dhcpcd.conf
         sed -i '/# Pi WiFi Extender/,/interface br0/d' /etc/dhcpcd.conf
         sed -i "/denyinterfaces ${WIFI_IFACE} eth0/d" /etc/dhcpcd.conf
         sed -i '/denyinterfaces wlan0 eth0/d' /etc/dhcpcd.conf
@@ -40,6 +73,7 @@ else
 fi
 
 # Clean up bridge interface
+stage bridge
 if ip link show br0 &>/dev/null; then
     ip link set br0 down 2>/dev/null || true
     ip link delete br0 type bridge 2>/dev/null || brctl delbr br0 2>/dev/null || true
@@ -47,5 +81,6 @@ fi
 
 # Re-enable WiFi interface for normal use
 ip link set "${WIFI_IFACE}" up 2>/dev/null || true
+stages_end
 
 echo "✓ Uninstalled (interface: ${WIFI_IFACE}). Reboot to restore normal WiFi: sudo reboot"
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Update checker
+Asks the remote only for the head of the tracked branch (git ls-remote,
+no fetch) and caches it for a few hours, so "update available" shows
+straight from the cache. A background worker re-checks when the cache
+expires, backing off exponentially while the remote is unreachable.
+
+Usage: ./update_check.py [--force] [--json]
+Exit status 10 means an update is available.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                          "wifi-extender", "update-check.json")
+TTL = 6 * 3600.0           # Seconds a remote head stays fresh
+RETRY_DELAY = 60.0         # First retry after a failed check...
+MAX_RETRY_DELAY = 3600.0   # ...doubling up to this
+GIT_TIMEOUT = 20
+DEFAULT_UPSTREAM = ("origin", "main")
+EXIT_UPDATE_AVAILABLE = 10
+
+
+class UpdateCheckError(Exception):
+    pass
+
+
+def git(repo, *args, timeout=GIT_TIMEOUT):
+    """stdout of a git command in repo; UpdateCheckError if it fails"""
+    try:
+        result = subprocess.run(["git", "-C", repo, *args], capture_output=True, text=True,
+                                timeout=timeout,
+                                env=dict(os.environ, GIT_TERMINAL_PROMPT="0"))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise UpdateCheckError(f"git {args[0]}: {e}") from e
+    if result.returncode != 0:
+        message = result.stderr.strip().splitlines()
+        raise UpdateCheckError(f"git {args[0]}: {message[0] if message else 'failed'}")
+    return result.stdout.strip()
+
+
+def upstream(repo=SCRIPT_DIR):
+    """(remote, branch) the checkout tracks; origin/main if none is set"""
+    try:
+        ref = git(repo, "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}")
+    except UpdateCheckError:
+        return DEFAULT_UPSTREAM
+    remote, _, branch = ref.partition("/")
+    return (remote, branch) if branch else DEFAULT_UPSTREAM
+
+
+def remote_head(repo, remote, branch):
+    """Commit the remote branch points at, from its refs alone"""
+    output = git(repo, "ls-remote", "--heads", remote, f"refs/heads/{branch}")
+    for line in output.splitlines():
+        sha, _, ref = line.partition("\t")
+        if ref == f"refs/heads/{branch}":
+            return sha
+    raise UpdateCheckError(f"{remote} has no branch {branch}")
+
+
+class UpdateStatus:
+    """Whether the checkout is behind its remote, as of checked"""
+
+    def __init__(self, available, local, remote, checked, error=None):
+        self.available = available
+        self.local = local
+        self.remote = remote
+        self.checked = checked
+        self.error = error
+
+    def describe(self):
+        if self.error and self.remote is None:
+            return f"Update check failed: {self.error}"
+        if self.available:
+            return f"Update available: {self.local[:7]} -> {self.remote[:7]}"
+        return "✓ Already up to date!"
+
+    def as_dict(self):
+        return {"available": self.available, "local": self.local, "remote": self.remote,
+                "checked": self.checked, "error": self.error}
+
+
+class UpdateChecker:
+    """Remote head of the tracked branch, cached on disk for ttl seconds"""
+
+    def __init__(self, repo=SCRIPT_DIR, cache=CACHE_FILE, ttl=TTL, retry_delay=RETRY_DELAY,
+                 max_retry_delay=MAX_RETRY_DELAY, clock=time.time):
+        self.repo = repo
+        self.cache = cache
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.tracked = None  # (remote, branch), looked up on first use
+        self.state = None    # Last state saved, in case the cache is unwritable
+
+    def _load(self):
+        if self.state is not None:
+            return dict(self.state)
+        try:
+            with open(self.cache) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # A cache written for another checkout or branch does not apply
+        if not isinstance(state, dict) or state.get("key") != self._key():
+            return {}
+        return state
+
+    def _save(self, state):
+        state = dict(state, key=self._key())
+        self.state = state
+        directory = os.path.dirname(self.cache) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".update-check.")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.rename(tmp, self.cache)
+        except OSError:
+            os.unlink(tmp)
+
+    def _key(self):
+        if self.tracked is None:
+            self.tracked = upstream(self.repo)
+        return [os.path.realpath(self.repo), *self.tracked]
+
+    def next_check(self):
+        """Clock time the next background check is due"""
+        state = self._load()
+        if state.get("failures"):
+            delay = min(self.retry_delay * 2 ** (state["failures"] - 1), self.max_retry_delay)
+            return state.get("attempted", 0) + delay
+        return state.get("checked", 0) + self.ttl
+
+    def cached(self):
+        """Status from the cache alone (remote None if never checked)"""
+        state = self._load()
+        return self._status(state.get("remote"), state.get("checked"), state.get("error"))
+
+    def check(self, force=False):
+        """Cached status while fresh; otherwise ask the remote
+
+        A failed query keeps the last known remote head and pushes the
+        next background attempt back exponentially.
+        """
+        with self.lock:
+            state = self._load()
+            now = self.clock()
+            if not force and state.get("remote") and now - state.get("checked", 0) < self.ttl:
+                return self._status(state["remote"], state["checked"])
+            remote, branch = self._key()[1:]
+            try:
+                head = remote_head(self.repo, remote, branch)
+            except UpdateCheckError as e:
+                state.update(failures=state.get("failures", 0) + 1, attempted=now, error=str(e))
+                self._save(state)
+                return self._status(state.get("remote"), state.get("checked"), str(e))
+            self._save({"remote": head, "checked": now})
+            return self._status(head, now)
+
+    def _status(self, head, checked, error=None):
+        try:
+            local = git(self.repo, "rev-parse", "HEAD")
+        except UpdateCheckError as e:
+            return UpdateStatus(False, None, head, checked, error or str(e))
+        return UpdateStatus(head is not None and not self._contains(local, head),
+                            local, head, checked, error)
+
+    def _contains(self, local, head):
+        """Whether local already includes head (equal, or head is an ancestor)"""
+        if local == head:
+            return True
+        try:
+            git(self.repo, "merge-base", "--is-ancestor", head, local)
+            return True
+        except UpdateCheckError:
+            return False  # Not an ancestor, or a commit we have not fetched
+
+    def pull(self):
+        """Fast-forward the checkout to the remote branch"""
+        remote, branch = self._key()[1:]
+        return git(self.repo, "pull", "--ff-only", remote, branch, timeout=300)
+
+
+class UpdateWorker:
+    """Runs check() in the background whenever the cache falls due
+
+    The cached status is delivered first, then each check's. on_status
+    (status) is handed to post(), which the GUI sets to GLib.idle_add so
+    results arrive on the main loop.
+    """
+
+    def __init__(self, checker, on_status, post=None, clock=time.time):
+        self.checker = checker
+        self.on_status = on_status
+        self.post = post or (lambda fn, *args: fn(*args))
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.forced = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def request(self):
+        """Check the remote now, ignoring the cache"""
+        with self.cond:
+            self.forced = True
+            self.cond.notify()
+
+    def _loop(self):
+        self.post(self.on_status, self.checker.cached())
+        while True:
+            with self.cond:
+                while not self.stopped and not self.forced:
+                    remaining = self.checker.next_check() - self.clock()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.stopped:
+                    return
+                forced, self.forced = self.forced, False
+            status = self.checker.check(force=forced)
+            self.post(self.on_status, status)
+
+
+def main(argv):
+    checker = UpdateChecker()
+    status = checker.check(force="--force" in argv)
+    if "--json" in argv:
+        print(json.dumps(status.as_dict(), indent=2))
+    else:
+        print(status.describe())
+    if status.remote is None:
+        return 1
+    return EXIT_UPDATE_AVAILABLE if status.available else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Pi WiFi Extender - Uplink monitor
+Tells a bad uplink apart from a crowded radio: probes the default gateway
+on br0 (ICMP echo over an unprivileged ping socket, or a TCP connect) at
+a steady rate, keeps the last few hundred results in a fixed-size window
+and reports p50/p95/p99 latency and loss over it, alongside eth0's
+carrier and error counters from sysfs. The status daemon runs one and
+puts its figures in every snapshot.
+
+Usage: ./uplink.py [--target IP] [--method icmp|tcp:PORT] [--count N]
+                   [--interval SECONDS] [--json]
+"""
+
+import collections
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+SYSFS_NET = "/sys/class/net"
+PROC = "/proc"
+BRIDGE = "br0"
+UPLINK = "eth0"
+DEFAULT_INTERVAL = 1.0
+DEFAULT_WINDOW = 300   # Probes kept: five minutes at the default rate
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_COUNT = 10
+RTF_GATEWAY = 0x2
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+PERCENTILES = (50, 95, 99)
+LINK_COUNTERS = ("rx_errors", "tx_errors", "rx_dropped", "tx_dropped",
+                 "rx_crc_errors", "rx_frame_errors", "tx_carrier_errors")
+
+
+def read_sysfs(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def default_gateway(iface=BRIDGE, proc=PROC):
+    """IPv4 default gateway, preferring routes via iface; None if none"""
+    gateways = []
+    try:
+        with open(os.path.join(proc, "net", "route")) as f:
+            next(f, None)  # Header
+            for line in f:
+                # Iface, Destination, Gateway, Flags, RefCnt, Use, Metric, Mask...
+                fields = line.split()
+                if len(fields) < 8 or fields[1] != "00000000":
+                    continue
+                if not int(fields[3], 16) & RTF_GATEWAY:
+                    continue
+                gateway = socket.inet_ntoa(struct.pack("<I", int(fields[2], 16)))
+                gateways.append((fields[0] != iface, int(fields[6]), gateway))
+    except (OSError, ValueError):
+        return None
+    return min(gateways)[2] if gateways else None
+
+
+def link_stats(iface=UPLINK, sysfs=SYSFS_NET):
+    """Carrier, speed and error counters of the uplink; None if it is absent"""
+    base = os.path.join(sysfs, iface)
+    if not os.path.isdir(base):
+        return None
+    carrier = read_sysfs(os.path.join(base, "carrier"))
+    speed = read_sysfs(os.path.join(base, "speed"))
+    changes = read_sysfs(os.path.join(base, "carrier_changes"))
+    stats = {
+        "interface": iface,
+        "operstate": read_sysfs(os.path.join(base, "operstate")),
+        "carrier": carrier == "1" if carrier is not None else None,
+        # speed reads -1 (or fails) without a link
+        "speed_mbps": int(speed) if speed and speed.lstrip("-").isdigit() and int(speed) > 0 else None,
+        "carrier_changes": int(changes) if changes and changes.isdigit() else None,
+    }
+    for counter in LINK_COUNTERS:
+        value = read_sysfs(os.path.join(base, "statistics", counter))
+        stats[counter] = int(value) if value is not None and value.isdigit() else None
+    return stats
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-p * len(ordered) // 100))  # ceil(p/100 * n)
+    return ordered[rank - 1]
+
+
+class RollingWindow:
+    """The last size probe results: latency in seconds, or None if lost"""
+
+    def __init__(self, size=DEFAULT_WINDOW):
+        self.samples = collections.deque(maxlen=size)
+
+    def add(self, latency):
+        self.samples.append(latency)
+
+    def summary(self):
+        latencies = sorted(s for s in self.samples if s is not None)
+        sent = len(self.samples)
+        lost = sent - len(latencies)
+        result = {"sent": sent, "lost": lost,
+                  "loss": round(lost / sent, 4) if sent else None,
+                  "last": self.samples[-1] if sent else None}
+        for p in PERCENTILES:
+            result[f"p{p}"] = percentile(latencies, p)
+        return result
+
+
+class IcmpProber:
+    """Echo requests over an unprivileged ICMP socket (net.ipv4.ping_group_range),
+    or a raw one when running as root without that"""
+
+    def __init__(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+
+    def probe(self, target, timeout):
+        """Round-trip time in seconds, or None if no reply came in time"""
+        self.seq = (self.seq + 1) & 0xFFFF
+        payload = b"wifi-extender"
+        # Ping sockets fill in the identifier and checksum themselves
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self.ident, self.seq)
+        if self.raw:
+            header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + payload),
+                                 self.ident, self.seq)
+        started = time.monotonic()
+        self.sock.sendto(header + payload, (target, 0))
+        deadline = started + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]:
+                return None
+            reply, (source, _) = self.sock.recvfrom(1024)
+            if self.raw:
+                reply = reply[(reply[0] & 0x0F) * 4:]  # Raw sockets include the IP header
+            if len(reply) < 8 or source != target:
+                continue
+            kind, _, _, ident, seq = struct.unpack("!BBHHH", reply[:8])
+            if kind == ICMP_ECHO_REPLY and seq == self.seq and (ident == self.ident or not self.raw):
+                return time.monotonic() - started
+
+    def close(self):
+        self.sock.close()
+
+
+def checksum(data):
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class TcpProber:
+    """Connect time to a TCP port; a refusal counts as a reply"""
+
+    def __init__(self, port):
+        self.port = port
+
+    def probe(self, target, timeout):
+        started = time.monotonic()
+        try:
+            with socket.create_connection((target, self.port), timeout):
+                pass
+        except ConnectionRefusedError:
+            pass
+        except OSError:
+            return None
+        return time.monotonic() - started
+
+    def close(self):
+        pass
+
+
+def make_prober(method="icmp"):
+    """A prober for "icmp" or "tcp:PORT"; ValueError for anything else"""
+    if method == "icmp":
+        return IcmpProber()
+    if method.startswith("tcp:") and method[4:].isdigit():
+        return TcpProber(int(method[4:]))
+    raise ValueError(f"Unknown probe method {method!r} (icmp or tcp:PORT)")
+
+
+class UplinkMonitor:
+    """Probes the gateway every interval seconds on its own thread
+
+    target, if given, is probed instead of the gateway of bridge's default
+    route (looked up again before each probe, so a new DHCP lease is
+    followed). summary() is safe to call from any thread.
+    """
+
+    def __init__(self, target=None, method="icmp", interval=DEFAULT_INTERVAL,
+                 window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT, bridge=BRIDGE,
+                 uplink=UPLINK, sysfs=SYSFS_NET, proc=PROC, prober=None):
+        self.fixed_target = target
+        self.method = method
+        self.interval = interval
+        self.timeout = min(timeout, interval)
+        self.bridge = bridge
+        self.uplink = uplink
+        self.sysfs = sysfs
+        self.proc = proc
+        self.prober = prober or make_prober(method)
+        self.window = RollingWindow(window)
+        self.link_window = collections.deque(maxlen=window)  # Counter snapshots
+        self.target = target
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def probe_once(self):
+        """One probe and one counter sample; returns the latency or None"""
+        target = self.fixed_target or default_gateway(self.bridge, self.proc)
+        latency = None
+        if target:
+            try:
+                latency = self.prober.probe(target, self.timeout)
+            except OSError:
+                latency = None
+        link = link_stats(self.uplink, self.sysfs)
+        with self.lock:
+            if target != self.target:
+                self.window = RollingWindow(self.window.samples.maxlen)  # New gateway
+                self.target = target
+            if target:
+                self.window.add(latency)
+            if link is not None:
+                self.link_window.append(link)
+        return latency
+
+    def summary(self):
+        """Window figures, the uplink's state and its counter deltas over the window"""
+        with self.lock:
+            result = self.window.summary()
+            result.update(target=self.target, method=self.method, interval=self.interval)
+            first = self.link_window[0] if self.link_window else None
+            last = self.link_window[-1] if self.link_window else None
+        result["link"] = last or link_stats(self.uplink, self.sysfs)
+        result["window_errors"] = {
+            counter: last[counter] - first[counter]
+            for counter in LINK_COUNTERS + ("carrier_changes",)
+            if first and first.get(counter) is not None and last.get(counter) is not None
+        }
+        return result
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        next_probe = time.monotonic()
+        while not self.stopped.is_set():
+            self.probe_once()
+            next_probe += self.interval
+            self.stopped.wait(max(0, next_probe - time.monotonic()))
+        self.prober.close()
+
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+def format_uplink(summary):
+    """One or two status lines, e.g. for status.sh and the GUI"""
+    link = summary.get("link") or {}
+    if link.get("carrier") is False:
+        state = f"{link['interface']} no carrier"
+    elif link:
+        speed = f" {link['speed_mbps']}Mb/s" if link.get("speed_mbps") else ""
+        state = f"{link['interface']} up{speed}"
+    else:
+        state = "no uplink"
+    errors = sum(v for k, v in summary.get("window_errors", {}).items() if k != "carrier_changes")
+    flaps = summary.get("window_errors", {}).get("carrier_changes")
+    if errors:
+        state += f", {errors} errors"
+    if flaps:
+        state += f", {flaps} carrier changes"
+    if "target" not in summary:  # Link state only, no monitor running
+        return state
+    if not summary.get("target"):
+        return f"{state}, no gateway"
+    if not summary.get("sent"):
+        return f"{state}, gw {summary['target']}"
+    loss = summary["loss"] * 100
+    return (f"{state}, gw {summary['target']}\n"
+            f"latency p50 {format_ms(summary['p50'])}  p95 {format_ms(summary['p95'])}  "
+            f"p99 {format_ms(summary['p99'])}  loss {loss:.1f}% of {summary['sent']}")
+
+
+def main(argv):
+    args = list(argv)
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    target = option("--target")
+    method = option("--method", "icmp")
+    count = int(option("--count", DEFAULT_COUNT))
+    interval = float(option("--interval", DEFAULT_INTERVAL))
+    try:
+        monitor = UplinkMonitor(target, method, interval, window=count)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for i in range(count):
+        if i:
+            time.sleep(interval)
+        monitor.probe_once()
+    monitor.prober.close()
+    summary = monitor.summary()
+    if "--json" in args:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_uplink(summary))
+    return 0 if summary["sent"] and summary["lost"] < summary["sent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,8 +2,13 @@
 """
 Pi WiFi Extender - Desktop GUI
 A simple GTK-based GUI for managing the WiFi Extender
+
+Usage: ./wifi-extender-gui.py [--profile-startup]
 """
 
+import time
+STARTED = time.monotonic()  # Before the slow GTK import, for --profile-startup
+
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
@@ -12,9 +17,35 @@ import os
 import threading
 import json
 import signal
+import sys
+
+import client_roster
+import hostapd_config
+import live_apply
+import log_sink
+import privileged_helper
+import qos
+import refresh_worker
+import routed
+import stage_timing
+import station_stats
+import status_cache
+import status_collector
+import status_events
+import throughput
+import tuning
+import update_check
+import uplink
 
 CONFIG_FILE = "/var/lib/wifi-extender-backup/gui-config.json"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_HISTORY_FILE = "/var/lib/wifi-extender-backup/gui.log"
+LOG_FLUSH_MS = 33  # Roughly one log insert per frame
+SETUP_REBOOT_FLAG = "/run/wifi-extender/reboot-required"  # Set by setup.sh
+UPLINK_REFRESH_S = 5  # How often the uplink line re-reads the status daemon's figures
+AUTO_CHANNEL = "Auto (least congested)"
+CHANNELS = {"g": list(range(1, 14)), "a": [36, 40, 44, 48, 149, 153, 157, 161]}
+DEFAULT_CHANNELS = {"g": 6, "a": 36}
 
 # CSS for styling
 CSS = b"""
@@ -24,9 +55,109 @@ CSS = b"""
 }
 """
 
+# Longest partial line held before it is flushed to the log anyway
+MAX_LINE = 64 * 1024
+
+
+class StreamedCommand:
+    """Run a command in its own process group, streaming its output
+
+    stdout and stderr are non-blocking pipes watched from the GLib main
+    loop. on_line(text) is called for each line as it arrives and
+    on_done(returncode) once both pipes are closed and the process exited.
+    """
+    
+    def __init__(self, cmd, on_line, on_done):
+        self.on_line = on_line
+        self.on_done = on_done
+        self.returncode = None
+        self.proc = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        self.pipes = {}
+        self.partial = {}
+        for pipe in (self.proc.stdout, self.proc.stderr):
+            fd = pipe.fileno()
+            os.set_blocking(fd, False)
+            self.pipes[fd] = pipe
+            self.partial[fd] = b""
+            GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT,
+                              GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self._on_output)
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.proc.pid, self._on_exit)
+    
+    def cancel(self):
+        """Terminate the whole process group"""
+        os.killpg(self.proc.pid, signal.SIGTERM)
+    
+    def _on_output(self, fd, condition):
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b""
+        if data:
+            lines = (self.partial[fd] + data).split(b"\n")
+            self.partial[fd] = lines.pop()
+            if len(self.partial[fd]) > MAX_LINE:
+                lines.append(self.partial[fd])
+                self.partial[fd] = b""
+            for line in lines:
+                self.on_line(line.decode(errors="replace"))
+            return True
+        
+        # EOF
+        if self.partial[fd]:
+            self.on_line(self.partial[fd].decode(errors="replace"))
+        self.pipes.pop(fd).close()
+        self._check_done()
+        return False
+    
+    def _on_exit(self, pid, status):
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self.proc.returncode = self.returncode
+        self._check_done()
+    
+    def _check_done(self):
+        if self.returncode is not None and not self.pipes:
+            self.on_done(self.returncode)
+
+
+class HelperCommand:
+    """Run one privileged helper operation off the main loop
+
+    Same callbacks as StreamedCommand: on_line(text) per output line and
+    on_done(returncode) once the operation finished.
+    """
+    
+    def __init__(self, helper, op, args, on_line, on_done):
+        self.helper = helper
+        
+        def run():
+            returncode = 1
+            try:
+                helper.call(op, on_line, **args)
+                returncode = 0
+            except privileged_helper.HelperError as e:
+                on_line(f"Error: {e}")
+                returncode = e.code
+            except Exception as e:  # pkexec missing, a malformed reply...
+                on_line(f"Error: {str(e) or type(e).__name__}")
+            finally:
+                GLib.idle_add(on_done, returncode)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def cancel(self):
+        self.helper.cancel()
+
+
 class WiFiExtenderGUI(Gtk.Window):
-    def __init__(self):
+    def __init__(self, profile=None):
         Gtk.Window.__init__(self, title="Pi WiFi Extender")
+        self.profile = profile or status_cache.StartupProfile(STARTED)
         self.set_border_width(15)
         self.set_default_size(500, 450)
         self.set_position(Gtk.WindowPosition.CENTER)
@@ -34,6 +165,12 @@ class WiFiExtenderGUI(Gtk.Window):
         
         # Load saved config
         self.config = self.load_config()
+        self.log_sink = log_sink.LogSink(
+            self.config.get("log_max_lines", log_sink.DEFAULT_MAX_LINES),
+            LOG_HISTORY_FILE if self.config.get("log_history", True) else None
+        )
+        # One connection to the privileged helper, authorised once
+        self.helper = privileged_helper.HelperClient()
         
         # Main container
         main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=15)
@@ -52,10 +189,51 @@ class WiFiExtenderGUI(Gtk.Window):
         self.status_box.set_border_width(10)
         status_frame.add(self.status_box)
         
+        # Paint the last known status straight away; live status follows
         self.status_label = Gtk.Label(label="Checking status...")
         self.status_label.set_xalign(0)
+        self.cached_status = status_cache.load()
+        if self.cached_status:
+            self.status_label.set_markup(
+                self.format_status(self.cached_status.get("hostapd_active"),
+                                   self.cached_status.get("ssid", ""),
+                                   self.cached_status.get("clients", 0))
+                + f"\n<small>Last known, {status_cache.age_text(self.cached_status.get('time', 0))}"
+                " - checking...</small>")
         self.status_box.pack_start(self.status_label, False, False, 0)
         
+        # One line per radio when extra radios serve the same SSID
+        self.radio_label = Gtk.Label()
+        self.radio_label.set_xalign(0)
+        self.radio_label.set_no_show_all(True)
+        self.status_box.pack_start(self.radio_label, False, False, 0)
+        
+        # Gateway latency/loss and eth0 health, from the status daemon
+        self.uplink_label = Gtk.Label()
+        self.uplink_label.set_xalign(0)
+        self.uplink_label.set_no_show_all(True)
+        self.status_box.pack_start(self.uplink_label, False, False, 0)
+        
+        # Shaped clients, drops and queued bytes, from the status daemon
+        self.qos_label = Gtk.Label()
+        self.qos_label.set_xalign(0)
+        self.qos_label.set_no_show_all(True)
+        self.status_box.pack_start(self.qos_label, False, False, 0)
+        
+        # Per-client throughput (Mbit/s), clients named from ARP and DHCP;
+        # the hidden last column is the MAC, for capping a client
+        self.roster = client_roster.Roster()
+        self.client_store = Gtk.ListStore(str, str, str, str, str, str)
+        client_view = Gtk.TreeView(model=self.client_store)
+        for i, title in enumerate(["Client", "Down", "Up", "Peak", "Avg"]):
+            renderer = Gtk.CellRendererText()
+            if i:
+                renderer.set_property("xalign", 1.0)
+            client_view.append_column(Gtk.TreeViewColumn(title, renderer, text=i))
+        client_view.set_tooltip_text("Double-click a client to cap its speed")
+        client_view.connect("row-activated", self.on_client_activated)
+        self.status_box.pack_start(client_view, False, False, 0)
+        
         # Settings frame
         settings_frame = Gtk.Frame(label="Settings")
         main_box.pack_start(settings_frame, True, True, 0)
@@ -97,9 +275,8 @@ class WiFiExtenderGUI(Gtk.Window):
         settings_grid.attach(channel_label, 0, 3, 1, 1)
         
         self.channel_combo = Gtk.ComboBoxText()
-        for ch in range(1, 14):
-            self.channel_combo.append_text(str(ch))
-        self.channel_combo.set_active(self.config.get("channel", 6) - 1)
+        self.fill_channels("a" if self.config.get("band") == "a" else "g",
+                           self.config.get("channel", 6))
         settings_grid.attach(self.channel_combo, 1, 3, 1, 1)
         
         # Country
@@ -146,6 +323,54 @@ class WiFiExtenderGUI(Gtk.Window):
         self.band_combo.connect("changed", self.on_band_changed)
         settings_grid.attach(self.band_combo, 1, 5, 1, 1)
         
+        # Tuning profile (power save, queues, multicast, WMM)
+        profile_label = Gtk.Label(label="Tuning:")
+        profile_label.set_xalign(0)
+        settings_grid.attach(profile_label, 0, 6, 1, 1)
+        
+        self.profile_combo = Gtk.ComboBoxText()
+        for name in tuning.PROFILES:
+            self.profile_combo.append(name, name.replace("-", " ").capitalize())
+        # The installed drop-in is the truth; the saved choice covers first setup
+        installed = tuning.current_profile()
+        self.profile_combo.set_active_id(
+            installed if installed != tuning.DEFAULT_PROFILE
+            else self.config.get("profile", tuning.DEFAULT_PROFILE))
+        settings_grid.attach(self.profile_combo, 1, 6, 1, 1)
+        
+        # Network mode: bridge clients onto eth0's LAN, or route them (NAT)
+        mode_label = Gtk.Label(label="Network mode:")
+        mode_label.set_xalign(0)
+        settings_grid.attach(mode_label, 0, 7, 1, 1)
+        
+        self.mode_combo = Gtk.ComboBoxText()
+        self.mode_combo.append("bridge", "Bridged (same network as eth0)")
+        self.mode_combo.append("routed", "Routed (own subnet, NAT)")
+        self.mode_combo.set_active_id(routed.mode())
+        self.mode_combo.set_tooltip_text(
+            "Routed mode suits uplinks that allow one device per port")
+        settings_grid.attach(self.mode_combo, 1, 7, 1, 1)
+        
+        # Fair sharing between clients, each capped at down/up Mbit/s (0: no cap)
+        qos_label = Gtk.Label(label="Client limits:")
+        qos_label.set_xalign(0)
+        settings_grid.attach(qos_label, 0, 8, 1, 1)
+        
+        qos_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        self.qos_check = Gtk.CheckButton(label="Share fairly, cap each at")
+        self.qos_check.set_tooltip_text(
+            "Stops one client's download from flooding the radio")
+        qos_box.pack_start(self.qos_check, False, False, 0)
+        self.qos_down = Gtk.SpinButton.new_with_range(0, qos.LINE_RATE, 1)
+        self.qos_up = Gtk.SpinButton.new_with_range(0, qos.LINE_RATE, 1)
+        for spin, arrow in ((self.qos_down, "↓"), (self.qos_up, "↑ Mbit/s")):
+            spin.set_tooltip_text("0 for no cap")
+            qos_box.pack_start(spin, False, False, 0)
+            qos_box.pack_start(Gtk.Label(label=arrow), False, False, 0)
+        self.qos_check.connect("toggled", self.on_qos_toggled)
+        self.show_qos(qos.load())
+        settings_grid.attach(qos_box, 1, 8, 1, 1)
+        
         # Button box
         button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         button_box.set_homogeneous(True)
@@ -176,10 +401,47 @@ class WiFiExtenderGUI(Gtk.Window):
         self.update_btn.connect("clicked", self.on_update_clicked)
         update_box.pack_start(self.update_btn, True, True, 0)
         
+        # Remote head cached for hours; checked in the background once painted
+        self.updates = update_check.UpdateChecker()
+        self.update_status = None
+        self.update_requested = False
+        self.update_worker = update_check.UpdateWorker(
+            self.updates, self.show_update_status, post=GLib.idle_add)
+        
         # Progress bar (hidden by default)
+        progress_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        main_box.pack_start(progress_box, False, False, 0)
+        
         self.progress = Gtk.ProgressBar()
         self.progress.set_no_show_all(True)
-        main_box.pack_start(self.progress, False, False, 0)
+        self.progress.set_valign(Gtk.Align.CENTER)
+        progress_box.pack_start(self.progress, True, True, 0)
+        
+        self.cancel_btn = Gtk.Button(label="✖ Cancel")
+        self.cancel_btn.set_no_show_all(True)
+        self.cancel_btn.connect("clicked", self.on_cancel_clicked)
+        progress_box.pack_start(self.cancel_btn, False, False, 0)
+        self.command = None
+        
+        # Stage timeline of the running setup/revert/uninstall (hidden until used)
+        self.stage_frame = Gtk.Frame(label="Stages")
+        self.stage_frame.set_no_show_all(True)
+        main_box.pack_start(self.stage_frame, False, False, 0)
+        
+        self.stage_store = Gtk.ListStore(str, str, int, str)
+        stage_view = Gtk.TreeView(model=self.stage_store)
+        stage_view.append_column(Gtk.TreeViewColumn("Stage", Gtk.CellRendererText(), text=0))
+        renderer = Gtk.CellRendererText()
+        renderer.set_property("xalign", 1.0)
+        stage_view.append_column(Gtk.TreeViewColumn("Time", renderer, text=1))
+        bar = Gtk.TreeViewColumn("Share", Gtk.CellRendererProgress(), value=2)
+        bar.set_min_width(80)
+        stage_view.append_column(bar)
+        stage_view.append_column(Gtk.TreeViewColumn("Result", Gtk.CellRendererText(), text=3))
+        stage_view.show()
+        self.stage_frame.add(stage_view)
+        self.stage_timeline = None
+        self.stage_typical = {}
         
         # Log output
         log_frame = Gtk.Frame(label="Log")
@@ -196,9 +458,32 @@ class WiFiExtenderGUI(Gtk.Window):
         scroll.add(self.log_view)
         
         self.log_buffer = self.log_view.get_buffer()
+        self.log_end = self.log_buffer.create_mark("end", self.log_buffer.get_end_iter(), False)
         
-        # Initial status check
-        GLib.timeout_add(500, self.refresh_status)
+        # Event-driven status, falling back to probes on a background worker
+        self.status_monitor = status_events.StatusMonitor(self.on_status_changed)
+        self.status_watcher = None
+        self.station_reader = None
+        self.sampler = None
+        self.refresher = refresh_worker.RefreshWorker(
+            {"hostapd_active": self._probe_hostapd,
+             "ssid": lambda: self.read_hostapd_conf().ssid,
+             "clients": self._probe_clients,
+             "radios": self._probe_radios},
+            self._apply_probes,
+            post=GLib.idle_add,
+            interval=self.config.get("status_refresh_interval", refresh_worker.DEFAULT_INTERVAL),
+        ).start()
+        self.connect("window-state-event", self.on_window_state)
+        self.connect("draw", self.on_first_draw)
+        self.profile.mark("window built")
+    
+    def on_first_draw(self, widget, cr):
+        """Start live status once the first frame is on screen"""
+        self.disconnect_by_func(self.on_first_draw)
+        self.profile.mark("first paint")
+        GLib.idle_add(self.start_status_watch)
+        return False
     
     def load_config(self):
         """Load saved configuration"""
@@ -212,13 +497,17 @@ class WiFiExtenderGUI(Gtk.Window):
     
     def save_config(self):
         """Save current configuration"""
-        config = {
+        config = dict(self.config)  # Keep settings without a widget
+        config.update({
             "ssid": self.ssid_entry.get_text(),
             "password": self.pass_entry.get_text(),
-            "channel": int(self.channel_combo.get_active_text() or "6"),
+            "channel": self.get_channel(),
             "country": self.country_codes[self.country_combo.get_active()],
-            "band": "g" if self.band_combo.get_active() == 0 else "a"
-        }
+            "band": "g" if self.band_combo.get_active() == 0 else "a",
+            "profile": self.profile_combo.get_active_id(),
+            "mode": self.mode_combo.get_active_id(),
+            "qos": self.qos_setting(),
+        })
         try:
             os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
             with open(CONFIG_FILE, 'w') as f:
@@ -228,86 +517,205 @@ class WiFiExtenderGUI(Gtk.Window):
         return config
     
     def log(self, message):
-        """Add message to log"""
-        GLib.idle_add(self._log_append, message)
+        """Add message to log (safe from any thread)"""
+        if self.log_sink.write(message):
+            GLib.timeout_add(LOG_FLUSH_MS, self._log_flush)
     
-    def _log_append(self, message):
-        end_iter = self.log_buffer.get_end_iter()
-        self.log_buffer.insert(end_iter, message + "\n")
-        # Auto-scroll
-        self.log_view.scroll_to_iter(self.log_buffer.get_end_iter(), 0, False, 0, 0)
+    def _log_flush(self):
+        """Insert everything logged since the last frame in one go"""
+        adj = self.log_view.get_vadjustment()
+        at_bottom = adj.get_value() >= adj.get_upper() - adj.get_page_size() - 1
+        self.log_buffer.insert(self.log_buffer.get_end_iter(), self.log_sink.drain())
+        
+        # Drop the oldest text beyond the cap (the last line is always empty)
+        excess = self.log_buffer.get_line_count() - 1 - self.log_sink.max_lines
+        if excess > 0:
+            self.log_buffer.delete(self.log_buffer.get_start_iter(),
+                                   self.log_buffer.get_iter_at_line(excess))
+        
+        # Only follow new output if the user hasn't scrolled up
+        if at_bottom:
+            self.log_view.scroll_to_mark(self.log_end, 0, False, 0, 0)
+        return False
     
     def on_show_pass_toggled(self, button):
         self.pass_entry.set_visibility(button.get_active())
     
     def on_band_changed(self, combo):
-        """Update channel options based on band"""
+        """Update channel options based on band, keeping Auto if chosen"""
+        self.fill_channels("g" if combo.get_active() == 0 else "a",
+                           self.channel_combo.get_active_id())
+    
+    def fill_channels(self, band, selected=None):
+        """List band's channels and select one by value, else the band's default"""
         self.channel_combo.remove_all()
-        if combo.get_active() == 0:  # 2.4 GHz
-            for ch in range(1, 14):
-                self.channel_combo.append_text(str(ch))
-            self.channel_combo.set_active(5)  # Channel 6
-        else:  # 5 GHz
-            for ch in [36, 40, 44, 48, 149, 153, 157, 161]:
-                self.channel_combo.append_text(str(ch))
-            self.channel_combo.set_active(0)  # Channel 36
+        self.channel_combo.append("auto", AUTO_CHANNEL)
+        for ch in CHANNELS[band]:
+            self.channel_combo.append(str(ch), str(ch))
+        if not self.channel_combo.set_active_id(str(selected)):
+            self.channel_combo.set_active_id(str(DEFAULT_CHANNELS[band]))
+    
+    def get_channel(self):
+        """Selected channel number, or "auto" """
+        channel = self.channel_combo.get_active_id() or "6"
+        return "auto" if channel == "auto" else int(channel)
+    
+    def start_status_watch(self):
+        """Follow hostapd and systemd events; poll once if unavailable"""
+        iface = self.read_hostapd_conf().interface
+        watcher = status_events.StatusWatcher(
+            self.status_monitor, iface,
+            on_attach_failed=self.refresher.request
+        )
+        try:
+            watcher.start()
+            self.status_watcher = watcher
+            try:
+                self.show_radios(self._probe_radios())
+            except OSError:
+                self.radio_label.hide()
+            if not self.radio_label.get_visible():
+                # Events keep the status current; extra radios still need polling
+                self.refresher.set_interval(None)
+        except Exception as e:
+            self.log(f"Live status unavailable ({e}), checking once instead")
+            self.refresh_status()
+        
+        self.sampler = throughput.SamplerThread(
+            iface, lambda rows: GLib.idle_add(self.update_client_table, rows)
+        )
+        self.sampler.start()
+        self.update_worker.start()
+        self.refresh_uplink()
+        GLib.timeout_add_seconds(UPLINK_REFRESH_S, self.refresh_uplink)
+        return False  # Don't repeat
+    
+    def update_client_table(self, rows):
+        """Replace the client table with one sampler tick (main loop)"""
+        self.client_store.clear()
+        for r in rows:
+            self.client_store.append([
+                self.roster.name(r.mac), f"{r.down:.1f}", f"{r.up:.1f}", f"{r.peak:.1f}", f"{r.average:.1f}",
+                r.mac
+            ])
+        return False
+    
+    def read_hostapd_conf(self):
+        """Current hostapd.conf; cached by mtime, so cheap to call per event"""
+        try:
+            return hostapd_config.load()
+        except PermissionError:
+            return hostapd_config.parse("ssid=(permission denied)")
+    
+    def on_status_changed(self, delta):
+        """Status delta from the event watcher (main loop)"""
+        state = self.status_monitor.snapshot()
+        ssid = self.read_hostapd_conf().ssid
+        self.show_live_status(state["hostapd_active"], ssid, state["clients"])
+    
+    def show_live_status(self, hostapd_active, ssid, clients):
+        """Show a live status and remember it for the next startup"""
+        self._update_status(self.format_status(hostapd_active, ssid, clients))
+        self.profile.mark("live status")
+        self.cached_status = status_cache.save(
+            {"hostapd_active": bool(hostapd_active), "ssid": ssid, "clients": clients},
+            previous=self.cached_status)
+    
+    def format_status(self, hostapd_active, ssid, clients):
+        if hostapd_active:
+            status = f"🟢 <b>Active</b> - Broadcasting: {GLib.markup_escape_text(ssid)}\n"
+            status += f"📱 Connected clients: {clients}"
+        else:
+            status = "🔴 <b>Not running</b>"
+        return status
     
     def refresh_status(self):
         """Check current status"""
-        threading.Thread(target=self._check_status, daemon=True).start()
+        if self.status_watcher:
+            # Events keep the state current; only the SSID may have changed
+            self.on_status_changed({})
+        else:
+            self.refresher.request()  # Coalesced with any refresh in flight
         return False  # Don't repeat
     
-    def _check_status(self):
+    def on_window_state(self, window, event):
+        iconified = event.new_window_state & Gdk.WindowState.ICONIFIED
+        self.refresher.set_visible(not iconified)
+        return False
+    
+    def _probe_hostapd(self):
+        return "hostapd" in status_collector.running_processes()
+    
+    def _probe_clients(self):
+        if self.station_reader is None:
+            self.station_reader = station_stats.StationReader(self.read_hostapd_conf().interface)
+        return len(self.station_reader.stations())
+    
+    def _probe_radios(self):
+        """Radio rows from the status daemon, else read directly (root only)"""
+        snapshot = status_collector.read_cache()
+        if snapshot and "radios" in snapshot:
+            return snapshot["radios"]
+        collector = status_collector.StatusCollector()
         try:
-            # Check if hostapd is running
-            result = subprocess.run(
-                ["systemctl", "is-active", "hostapd"],
-                capture_output=True, text=True, timeout=5
-            )
-            hostapd_active = result.stdout.strip() == "active"
-            
-            # Get current SSID if active
-            current_ssid = ""
-            if hostapd_active:
-                try:
-                    if os.path.exists("/etc/hostapd/hostapd.conf"):
-                        with open("/etc/hostapd/hostapd.conf", 'r') as f:
-                            for line in f:
-                                if line.startswith("ssid="):
-                                    current_ssid = line.split("=", 1)[1].strip()
-                                    break
-                except PermissionError:
-                    current_ssid = "(permission denied)"
-            
-            # Get connected clients
-            clients = 0
-            if hostapd_active:
-                try:
-                    result = subprocess.run(
-                        ["iw", "dev", "wlan0", "station", "dump"],
-                        capture_output=True, text=True, timeout=5
-                    )
-                    clients = result.stdout.count("Station")
-                except:
-                    pass
-            
-            # Update UI
-            if hostapd_active:
-                status = f"🟢 <b>Active</b> - Broadcasting: {current_ssid}\n"
-                status += f"📱 Connected clients: {clients}"
-            else:
-                status = "🔴 <b>Not running</b>"
-            
-            GLib.idle_add(self._update_status, status)
-            
-        except Exception as e:
-            GLib.idle_add(self._update_status, f"⚠ Error: {e}")
+            return [radio for radio, _ in collector.radios()]
+        finally:
+            collector.close()
+    
+    def _apply_probes(self, result):
+        """Newest probe result from the refresh worker (main loop)"""
+        if result["radios"] is not None:
+            self.show_radios(result["radios"])
+        if result["hostapd_active"] is None:
+            self._update_status("⚠ Could not check status")
+            return
+        self.show_live_status(result["hostapd_active"], result["ssid"] or "",
+                              result["clients"] or 0)
+    
+    def refresh_uplink(self):
+        """Show the daemon's uplink and shaping figures; hidden while it is not running"""
+        snapshot = status_collector.read_cache()
+        summary = snapshot.get("uplink") if snapshot else None
+        if summary:
+            self.uplink_label.set_markup(
+                "<small>🌐 " + GLib.markup_escape_text(uplink.format_uplink(summary)) + "</small>")
+            self.uplink_label.show()
+        else:
+            self.uplink_label.hide()
+        shaping = snapshot.get("qos") if snapshot else None
+        if shaping:
+            self.qos_label.set_markup(
+                "<small>⚖ " + GLib.markup_escape_text(qos.format_summary(shaping)) + "</small>")
+            self.qos_label.show()
+        else:
+            self.qos_label.hide()
+        return self.running  # Repeat while the window is open
+    
+    def show_radios(self, radios):
+        """Band, channel, state and clients of each radio, if several"""
+        if len(radios) <= 1:
+            self.radio_label.hide()
+            return
+        rows = []
+        for radio in radios:
+            band = "5 GHz" if radio.get("band") == "a" else "2.4 GHz"
+            icon = "🟢" if radio.get("state") == "ENABLED" else "🔴"
+            rows.append(f"{icon} {GLib.markup_escape_text(radio['interface'])} · {band} · "
+                        f"ch {radio.get('channel') or '?'} · {radio.get('clients', 0)} clients")
+        self.radio_label.set_markup("<small>" + "\n".join(rows) + "</small>")
+        self.radio_label.show()
     
     def _update_status(self, status):
         self.status_label.set_markup(status)
     
-    def run_command(self, cmd, success_msg, requires_reboot=False):
-        """Run command in background thread"""
+    def run_command(self, cmd, success_msg, requires_reboot=False, on_exit=None,
+                    helper_op=None):
+        """Run command, streaming its output into the log as it arrives
+
+        helper_op, an (operation, args) pair, runs on the privileged helper
+        instead when it is installed; cmd is the pkexec fallback. on_exit,
+        if given, is called on the main loop with the exit status.
+        """
         self.set_buttons_sensitive(False)
         self.progress.show()
         self.progress.pulse()
@@ -322,27 +730,84 @@ class WiFiExtenderGUI(Gtk.Window):
         
         GLib.timeout_add(100, pulse)
         
-        def run():
-            try:
-                self.log(f"Running: {' '.join(cmd)}")
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True, text=True
-                )
-                
-                if result.returncode == 0:
-                    self.log(result.stdout if result.stdout else success_msg)
-                    if requires_reboot:
-                        GLib.idle_add(self.show_reboot_dialog)
-                else:
-                    self.log(f"Error: {result.stderr}")
-                
-            except Exception as e:
-                self.log(f"Exception: {e}")
-            finally:
-                GLib.idle_add(self.command_finished)
+        printed = False  # Lines go straight to the log; nothing is kept
+        self.stage_timeline = None
         
-        threading.Thread(target=run, daemon=True).start()
+        def on_line(line):
+            nonlocal printed
+            event = stage_timing.parse_event(line)
+            if event:
+                GLib.idle_add(self.add_stage, event)  # May be off the main loop
+                return
+            printed = True
+            self.log(line)
+        
+        def on_done(returncode):
+            self.command = None
+            self.cancel_btn.hide()
+            if returncode == 0:
+                if not printed:
+                    self.log(success_msg)
+                if requires_reboot:
+                    GLib.idle_add(self.show_reboot_dialog)
+            elif returncode < 0:
+                self.log(f"Cancelled ({signal.Signals(-returncode).name})")
+            else:
+                self.log(f"Error: exited with status {returncode}")
+            self.command_finished()
+            if on_exit:
+                on_exit(returncode)
+        
+        try:
+            if helper_op and self.helper.available():
+                op, args = helper_op
+                self.log(f"Running: {op}")
+                self.command = HelperCommand(self.helper, op, args, on_line, on_done)
+            else:
+                self.log(f"Running: {' '.join(cmd)}")
+                self.command = StreamedCommand(cmd, on_line, on_done)
+        except Exception as e:
+            self.log(f"Exception: {e}")
+            self.command_finished()
+            if on_exit:
+                on_exit(None)
+            return
+        self.cancel_btn.show()
+    
+    def add_stage(self, event):
+        """Add a finished stage to the timeline, flagging unusually slow ones"""
+        if self.stage_timeline is None:
+            self.stage_timeline = stage_timing.Timeline()
+            earlier = [t for t in stage_timing.load_runs(script=event.get("script"))
+                       if t.run != event.get("run")]
+            self.stage_typical = stage_timing.typical_durations(
+                earlier[-stage_timing.BASELINE_RUNS:])
+            self.stage_store.clear()
+            self.stage_frame.set_label(f"Stages - {event.get('script')}")
+            self.stage_frame.show()
+        self.stage_timeline.add(event)
+        typical = self.stage_typical.get(event["stage"])
+        if stage_timing.is_slower(event["duration"], typical):
+            self.log(f"Slow stage: {stage_timing.format_event(event, typical)}")
+        # Shares of the total change with every stage, so rebuild the rows
+        total = self.stage_timeline.total or 1
+        self.stage_store.clear()
+        for e in self.stage_timeline.events:
+            typical = self.stage_typical.get(e["stage"])
+            result = e.get("result", "")
+            if stage_timing.is_slower(e["duration"], typical):
+                result += f" (usually {stage_timing.format_duration(typical)})"
+            self.stage_store.append([e["stage"], stage_timing.format_duration(e["duration"]),
+                                     int(100 * e["duration"] / total), result])
+        return False
+    
+    def on_cancel_clicked(self, button):
+        if self.command:
+            self.log("Cancelling...")
+            try:
+                self.command.cancel()
+            except (ProcessLookupError, PermissionError) as e:
+                self.log(f"Cancel failed: {e}")
     
     def command_finished(self):
         self.progress.hide()
@@ -368,12 +833,18 @@ class WiFiExtenderGUI(Gtk.Window):
         dialog.destroy()
         
         if response == Gtk.ResponseType.YES:
+            if self.helper.available():
+                try:
+                    self.helper.call("reboot")
+                    return
+                except privileged_helper.HelperError as e:
+                    self.log(f"Reboot via helper failed: {e}")
             subprocess.run(["sudo", "reboot"])
     
     def on_apply_clicked(self, button):
         ssid = self.ssid_entry.get_text().strip()
         password = self.pass_entry.get_text()
-        channel = self.channel_combo.get_active_text()
+        channel = str(self.get_channel())
         country = self.country_codes[self.country_combo.get_active()]
         band = "g" if self.band_combo.get_active() == 0 else "a"
         
@@ -387,10 +858,119 @@ class WiFiExtenderGUI(Gtk.Window):
             return
         
         self.save_config()
+        args = [ssid, password, channel, country, band]
         
+        # Already set up in this mode: push only what changed, without a reboot
+        if (os.path.exists(hostapd_config.HOSTAPD_CONF)
+                and self.mode_combo.get_active_id() == routed.mode()):
+            cmd = ["pkexec", sys.executable, os.path.join(SCRIPT_DIR, "live_apply.py")] + \
+                self.profile_args() + args
+            
+            def on_exit(returncode):
+                if returncode == live_apply.EXIT_NEEDS_SETUP:
+                    self.run_setup(args)
+                elif returncode == 0:
+                    self.apply_qos()
+                return False
+            
+            self.run_command(cmd, "Settings applied!", on_exit=on_exit,
+                             helper_op=("apply_config", self.helper_args(args)))
+        else:
+            self.run_setup(args)
+    
+    def profile_args(self):
+        """--profile for the scripts, or nothing if no profile is selected"""
+        profile = self.profile_combo.get_active_id()
+        return ["--profile", profile] if profile else []
+    
+    def helper_args(self, args):
+        return dict(zip(("ssid", "password", "channel", "country", "band"), args),
+                    profile=self.profile_combo.get_active_id())
+    
+    def run_setup(self, args):
+        """Run the setup script; it flags when its changes need a reboot"""
         setup_script = os.path.join(SCRIPT_DIR, "setup.sh")
-        cmd = ["pkexec", setup_script, ssid, password, channel, country, band]
-        self.run_command(cmd, "Setup complete!", requires_reboot=True)
+        mode = self.mode_combo.get_active_id()
+        shaping = self.qos_setting()
+        cmd = ["pkexec", setup_script] + self.profile_args() + \
+            ["--mode", mode, "--qos", shaping] + args
+        
+        def on_exit(returncode):
+            if returncode == 0 and os.path.exists(SETUP_REBOOT_FLAG):
+                self.show_reboot_dialog()
+            return False
+        
+        self.run_command(cmd, "Setup complete!", on_exit=on_exit,
+                         helper_op=("setup", dict(self.helper_args(args), mode=mode,
+                                                  qos=shaping)))
+    
+    def show_qos(self, config):
+        """Set the client limit widgets from a QosConfig (None: off)"""
+        self.qos_check.set_active(config is not None)
+        if config:
+            self.qos_down.set_value(config.default[0] or 0)
+            self.qos_up.set_value(config.default[1] or 0)
+        self.on_qos_toggled(self.qos_check)
+    
+    def on_qos_toggled(self, button):
+        for spin in (self.qos_down, self.qos_up):
+            spin.set_sensitive(button.get_active())
+    
+    def qos_setting(self):
+        """The client limits as setup.sh's --qos value: "DOWN:UP" or "off" """
+        if not self.qos_check.get_active():
+            return "off"
+        return qos.format_rates((self.qos_down.get_value() or None,
+                                 self.qos_up.get_value() or None))
+    
+    def apply_qos(self):
+        """Change the shaping after a live apply, if the limits were edited"""
+        installed = qos.load()
+        current = qos.format_rates(installed.default) if installed else "off"
+        if self.qos_setting() == current:
+            return
+        self.run_qos({"default": self.qos_setting()}, "Client limits applied!")
+    
+    def run_qos(self, args, success_msg):
+        """Run a set_qos operation (see privileged_helper.qos_args)"""
+        cmd = ["pkexec", sys.executable, os.path.join(SCRIPT_DIR, "qos.py")] + \
+            privileged_helper.qos_args(**args)
+        
+        def on_exit(returncode):
+            if returncode == 0:
+                self.show_qos(qos.load())
+            return False
+        
+        self.run_command(cmd, success_msg, on_exit=on_exit, helper_op=("set_qos", args))
+    
+    def on_client_activated(self, view, path, column):
+        """Ask for one client's own down/up caps"""
+        name, mac = self.client_store[path][0], self.client_store[path][5]
+        config = qos.load()
+        down, up = config.caps(mac) if config else (None, None)
+        dialog = Gtk.Dialog(title=f"Limit {name}", transient_for=self, flags=0)
+        dialog.add_button("Cancel", Gtk.ResponseType.CANCEL)
+        if config and mac in config.clients:
+            dialog.add_button("Remove limit", Gtk.ResponseType.REJECT)
+        dialog.add_button("Set", Gtk.ResponseType.OK)
+        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        box.set_border_width(10)
+        spins = []
+        for value, arrow in ((down, "↓"), (up, "↑ Mbit/s (0: no cap)")):
+            spin = Gtk.SpinButton.new_with_range(0, qos.LINE_RATE, 1)
+            spin.set_value(value or 0)
+            spins.append(spin)
+            box.pack_start(spin, False, False, 0)
+            box.pack_start(Gtk.Label(label=arrow), False, False, 0)
+        dialog.get_content_area().add(box)
+        dialog.show_all()
+        response = dialog.run()
+        rates = qos.format_rates(tuple(spin.get_value() or None for spin in spins))
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK:
+            self.run_qos({"clients": {mac: rates}}, f"Limited {name} to {rates} Mbit/s")
+        elif response == Gtk.ResponseType.REJECT:
+            self.run_qos({"clients": {mac: "off"}}, f"Removed the limit on {name}")
     
     def on_revert_clicked(self, button):
         dialog = Gtk.MessageDialog(
@@ -407,7 +987,8 @@ class WiFiExtenderGUI(Gtk.Window):
         if response == Gtk.ResponseType.OK:
             setup_script = os.path.join(SCRIPT_DIR, "setup.sh")
             cmd = ["pkexec", setup_script, "--revert"]
-            self.run_command(cmd, "Reverted successfully!", requires_reboot=True)
+            self.run_command(cmd, "Reverted successfully!", requires_reboot=True,
+                             helper_op=("revert", {}))
     
     def on_uninstall_clicked(self, button):
         dialog = Gtk.MessageDialog(
@@ -424,37 +1005,34 @@ class WiFiExtenderGUI(Gtk.Window):
         if response == Gtk.ResponseType.OK:
             uninstall_script = os.path.join(SCRIPT_DIR, "uninstall.sh")
             cmd = ["pkexec", uninstall_script]
-            self.run_command(cmd, "Uninstalled successfully!", requires_reboot=True)
+            self.run_command(cmd, "Uninstalled successfully!", requires_reboot=True,
+                             helper_op=("uninstall", {}))
     
     def on_update_clicked(self, button):
+        if self.update_status and self.update_status.available:
+            self.show_update_available()  # Known from the cache; no network needed
+            return
         self.log("Checking for updates...")
-        self.set_buttons_sensitive(False)
-        
-        def check_update():
-            try:
-                # Fetch latest from git
-                result = subprocess.run(
-                    ["git", "-C", SCRIPT_DIR, "fetch", "origin"],
-                    capture_output=True, text=True
-                )
-                
-                # Check if behind
-                result = subprocess.run(
-                    ["git", "-C", SCRIPT_DIR, "status", "-uno"],
-                    capture_output=True, text=True
-                )
-                
-                if "behind" in result.stdout:
-                    GLib.idle_add(self.show_update_available)
-                else:
-                    self.log("✓ Already up to date!")
-                    GLib.idle_add(self.command_finished)
-                    
-            except Exception as e:
-                self.log(f"Update check failed: {e}")
-                GLib.idle_add(self.command_finished)
-        
-        threading.Thread(target=check_update, daemon=True).start()
+        self.update_btn.set_sensitive(False)
+        self.update_requested = True
+        self.update_worker.request()
+    
+    def show_update_status(self, status):
+        """Newest update check result (main loop)"""
+        self.update_status = status
+        if status.available:
+            self.update_btn.set_label(f"⬇ Update Available ({status.remote[:7]})")
+            self.update_btn.get_style_context().add_class("suggested-action")
+        else:
+            self.update_btn.set_label("⬇ Check for Updates")
+            self.update_btn.get_style_context().remove_class("suggested-action")
+        if self.update_requested:
+            self.update_requested = False
+            self.update_btn.set_sensitive(self.apply_btn.get_sensitive())  # Unless a command runs
+            self.log(status.describe())
+            if status.available:
+                self.show_update_available()
+        return False
     
     def show_update_available(self):
         dialog = Gtk.MessageDialog(
@@ -470,28 +1048,31 @@ class WiFiExtenderGUI(Gtk.Window):
         
         if response == Gtk.ResponseType.YES:
             self.log("Downloading update...")
-            cmd = ["git", "-C", SCRIPT_DIR, "pull", "origin", "main"]
+            self.set_buttons_sensitive(False)
             
             def pull():
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True)
-                    if result.returncode == 0:
-                        self.log("✓ Updated successfully! Restart the app to use new version.")
-                    else:
-                        self.log(f"Update failed: {result.stderr}")
-                except Exception as e:
+                    self.updates.pull()
+                    self.log("✓ Updated successfully! Restart the app to use new version.")
+                    GLib.idle_add(self.show_update_status, self.updates.cached())
+                except update_check.UpdateCheckError as e:
                     self.log(f"Update failed: {e}")
                 finally:
                     GLib.idle_add(self.command_finished)
             
             threading.Thread(target=pull, daemon=True).start()
-        else:
-            self.command_finished()
-
 
 def on_destroy(win):
     """Clean shutdown"""
     win.running = False
+    if win.status_watcher:
+        win.status_watcher.stop()
+    if win.sampler:
+        win.sampler.stop()
+    win.refresher.stop()
+    win.update_worker.stop()
+    win.helper.close()
+    win.log_sink.close()
     Gtk.main_quit()
 
 
@@ -499,10 +1080,15 @@ def main():
     # Handle Ctrl+C gracefully
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     
-    # Check for display
-    if not os.environ.get('DISPLAY'):
-        print("Error: No display found. Run from desktop or use: DISPLAY=:0 ./wifi-extender-gui.py")
-        return 1
+    args = sys.argv[1:]
+    profile = status_cache.StartupProfile(STARTED, enabled="--profile-startup" in args)
+    args = [a for a in args if a != "--profile-startup"]
+    
+    # Headless (cron, SSH): print status instead of failing
+    if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+        print("No display found - showing status (for the GUI: DISPLAY=:0 ./wifi-extender-gui.py)",
+              file=sys.stderr)
+        return status_collector.main(args)
     
     # Load CSS
     css_provider = Gtk.CssProvider()
@@ -513,7 +1099,7 @@ def main():
         Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
     )
     
-    win = WiFiExtenderGUI()
+    win = WiFiExtenderGUI(profile)
     win.connect("destroy", on_destroy)
     win.show_all()
     win.progress.hide()